@@ -3,9 +3,8 @@ from datetime import datetime
 from airflow import DAG
 from airflow.operators.python import PythonOperator
 
-from binance_wss.data.extract import extract_all
-from binance_wss.data.transform import transform_merge
-from binance_wss.data.load import load_to_mongo_task 
+# Solo callables livianos: las dependencias pesadas se importan dentro de cada task
+from binance_wss.data.tasks import extract_task, transform_task, load_task
 
 
 with DAG(
@@ -17,17 +16,17 @@ with DAG(
 
     extract = PythonOperator(
         task_id="extract",
-        python_callable=extract_all,  # devuelve algo JSON-serializable
+        python_callable=extract_task,  # devuelve rutas de staging (Arrow IPC)
     )
 
     transform = PythonOperator(
         task_id="transform",
-        python_callable=transform_merge,  # también devuelve algo JSON-serializable
+        python_callable=transform_task,  # también devuelve una ruta de staging
     )
 
     load = PythonOperator(
         task_id="load",
-        python_callable=load_to_mongo_task,  # wrapper síncrono
+        python_callable=load_task,  # wrapper síncrono
     )
 
     extract >> transform >> load
@@ -0,0 +1,162 @@
+"""
+Benchmark del extractor: bucle secuencial original contra `extract_symbols`.
+
+Levanta un REST falso de Binance (aiohttp, `--latency-ms` por petición)
+con velas 1m y `--trades-per-minute` aggTrades por minuto, y extrae las
+últimas `--klines` velas de cada símbolo con sus aggTrades:
+
+- secuencial: el bucle de antes del extractor asíncrono, una petición de
+  velas por símbolo y una de aggTrades por vela, bloqueantes y con
+  `time.sleep(0.2)` tras cada una;
+- async: `extract_symbols` (sesión con pool, concurrencia acotada y
+  presupuesto de peso), como lo llama `extract_all`.
+
+Uso:
+    python scripts/bench_extract.py [--symbols 1 5] [--klines 60] [--latency-ms 30]
+
+Resultado registrado (30 ms de latencia, 60 velas, 100 trades/minuto):
+    symbols  requests seq/async  sequential     async
+          1              61 / 7     14.22 s    0.27 s
+          5            305 / 40     71.16 s    0.56 s
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from pathlib import Path
+
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+for name in ("BINANCE_API_KEY", "BINANCE_API_SECRET_KEY", "BINANCE_API_BASE_URL",
+             "MONGODB_URI", "MONGODB_DB_NAME", "MONGODB_COLLECTION_NAME"):
+    os.environ.setdefault(name, "bench")
+
+from binance_wss.data.extract import extract_symbols  # noqa: E402
+
+MINUTE_MS = 60_000
+
+
+class FakeBinance:
+    """REST falso: velas 1m hasta el minuto actual y aggTrades repartidos en cada minuto."""
+
+    def __init__(self, latency: float, trades_per_minute: int):
+        self.latency = latency
+        self.trades_per_minute = trades_per_minute
+        self.requests = 0
+        self.now_minute = int(time.time() * 1000) // MINUTE_MS * MINUTE_MS
+
+    def _trade(self, agg_id: int) -> dict:
+        minute, j = divmod(agg_id, self.trades_per_minute)
+        return {"a": agg_id, "p": "100.0", "q": "0.5", "f": agg_id, "l": agg_id,
+                "T": minute * MINUTE_MS + j * (MINUTE_MS // self.trades_per_minute),
+                "m": agg_id % 2 == 0, "M": True}
+
+    async def klines(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        limit = int(request.query.get("limit", 500))
+        # la vela en curso también se devuelve, como hace Binance
+        last = self.now_minute
+        opens = [last - i * MINUTE_MS for i in range(limit)][::-1]
+        rows = [[t, "1", "2", "0.5", "1.5", "10", t + MINUTE_MS - 1, "15", 100, "5", "7", "0"] for t in opens]
+        return web.json_response(rows, headers={"X-MBX-USED-WEIGHT-1M": "1"})
+
+    async def aggtrades(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        query = request.query
+        limit = int(query.get("limit", 500))
+        if "fromId" in query:
+            first = int(query["fromId"])
+        else:
+            first = int(query["startTime"]) // MINUTE_MS * self.trades_per_minute
+        end = int(query["endTime"]) if "endTime" in query else None
+        trades = []
+        for agg_id in range(first, first + limit):
+            trade = self._trade(agg_id)
+            if trade["T"] > self.now_minute + MINUTE_MS or (end is not None and trade["T"] > end):
+                break
+            trades.append(trade)
+        return web.json_response(trades, headers={"X-MBX-USED-WEIGHT-1M": "1"})
+
+
+def serve(fake: FakeBinance) -> tuple[str, threading.Thread]:
+    """Sirve `fake` en un hilo con su propio loop (el bucle secuencial bloquea)."""
+    app = web.Application()
+    app.router.add_get("/api/v3/klines", fake.klines)
+    app.router.add_get("/api/v3/aggTrades", fake.aggtrades)
+    ready, holder = threading.Event(), {}
+
+    def run():
+        loop = asyncio.new_event_loop()
+        runner = web.AppRunner(app)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        loop.run_until_complete(site.start())
+        holder["port"] = site._server.sockets[0].getsockname()[1]
+        ready.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    ready.wait()
+    return f"http://127.0.0.1:{holder['port']}", thread
+
+
+def sequential(base_url: str, symbols: list[str], klines: int) -> int:
+    """Bucle original: velas y luego una petición de aggTrades por vela, con sleep(0.2)."""
+    def get(path, params):
+        with urllib.request.urlopen(f"{base_url}{path}?{urllib.parse.urlencode(params)}") as resp:
+            data = json.loads(resp.read())
+        time.sleep(0.2)
+        return data
+
+    trades = 0
+    for symbol in symbols:
+        rows = get("/api/v3/klines", {"symbol": symbol, "interval": "1m", "limit": klines})
+        for row in rows:
+            trades += len(get("/api/v3/aggTrades", {
+                "symbol": symbol, "startTime": row[0], "endTime": row[6], "limit": 1000,
+            }))
+    return trades
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--symbols", type=int, nargs="+", default=[1, 5])
+    parser.add_argument("--klines", type=int, default=60)
+    parser.add_argument("--latency-ms", type=float, default=30)
+    parser.add_argument("--trades-per-minute", type=int, default=100)
+    args = parser.parse_args()
+
+    fake = FakeBinance(args.latency_ms / 1000, args.trades_per_minute)
+    base_url, _ = serve(fake)
+    os.environ["BINANCE_API_BASE_URL"] = base_url
+    from binance_wss.app.settings import settings
+    settings.BINANCE_API_BASE_URL = base_url
+
+    print(f"{'symbols':>7}  {'requests seq/async':>18}  {'sequential':>10}  {'async':>8}")
+    for count in args.symbols:
+        symbols = [f"SYM{i}USDT" for i in range(count)]
+
+        fake.requests = 0
+        t0 = time.perf_counter()
+        sequential(base_url, symbols, args.klines)
+        seq_time, seq_requests = time.perf_counter() - t0, fake.requests
+
+        fake.requests = 0
+        t0 = time.perf_counter()
+        asyncio.run(extract_symbols(symbols, args.klines))
+        async_time, async_requests = time.perf_counter() - t0, fake.requests
+
+        print(f"{count:>7}  {f'{seq_requests} / {async_requests}':>18}  {seq_time:>8.2f} s  {async_time:>6.2f} s")
+
+
+if __name__ == "__main__":
+    main()
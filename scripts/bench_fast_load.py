@@ -0,0 +1,175 @@
+"""
+Benchmark de la carga rápida (`binance_wss.data.fast_load`) contra
+`Kline.insert_many` de Beanie, contra un mongod real.
+
+Para cada tamaño parte del mismo frame de transform y escribe las velas
+en una colección vacía de una base desechable:
+
+- beanie: `build_klines` (un `Kline` de pydantic por fila) y
+  `Kline.insert_many`, que vuelve a codificar cada documento;
+- fast: `to_kline_frame` + `encode_klines` (RawBSONDocument) e
+  `insert_many` directo en la colección.
+
+Se mide por separado la preparación en el cliente (documentos listos para
+enviar) y el total con la inserción, y se comprueba que ambos caminos dejan
+los mismos documentos guardados.
+
+Con `--client-only` no hace falta servidor: se mide solo la preparación,
+hasta los bytes BSON que pymongo mandaría (en beanie, `get_dict` como en
+`insert_many` más `bson.encode`), y se comprueba que ambos caminos
+codifican los mismos documentos. La inserción, la red y el servidor no
+entran.
+
+Uso:
+    python scripts/bench_fast_load.py [--uri mongodb://localhost:27017] [--klines 1440 4320 10080]
+    python scripts/bench_fast_load.py --client-only
+
+Resultado registrado con `--client-only` (el entorno no tenía mongod),
+100 aggTrades por vela, Python 3.11, 1 CPU:
+
+    klines  beanie prep  fast prep  speedup
+      1440      0.440 s    0.012 s    37.3x
+      4320      1.314 s    0.034 s    38.2x
+     10080      3.076 s    0.110 s    28.1x
+
+Casi todo el coste de beanie es `df.to_dicts()` con los trades anidados y
+un `Kline` por fila; el de fast, `encode_klines` (con 1M velas, 6.6 s
+frente a 11.5 s del dict por fila + `bson.encode` al que sustituye).
+
+La tabla contra un mongod real (sin `--client-only`) añade el
+`insert_many` de cada camino; falta medirla.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+import bson
+import polars as pl
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+for name in ("BINANCE_API_KEY", "BINANCE_API_SECRET_KEY", "BINANCE_API_BASE_URL",
+             "MONGODB_URI", "MONGODB_DB_NAME", "MONGODB_COLLECTION_NAME"):
+    os.environ.setdefault(name, "bench")
+
+from beanie import init_beanie  # noqa: E402
+from beanie.odm.utils.dump import get_dict  # noqa: E402
+from pymongo import AsyncMongoClient  # noqa: E402
+
+from binance_wss.app.models.mongo_models import Kline  # noqa: E402
+from binance_wss.data.aggtrades import split_aggtrades  # noqa: E402
+from binance_wss.data.fast_load import encode_klines, to_kline_frame  # noqa: E402
+from binance_wss.data.load import build_klines  # noqa: E402
+from binance_wss.data.transform import merge_klines_aggtrades  # noqa: E402
+
+T0 = 1_700_000_000_000
+TRADES_PER_KLINE = 100
+
+
+def make_frame(klines: int) -> pl.DataFrame:
+    """Frame de transform: `klines` velas de un símbolo con TRADES_PER_KLINE aggTrades cada una."""
+    opens = [T0 + i * 60_000 for i in range(klines)]
+    raw = pl.DataFrame({
+        "open_time": opens, "open": ["1.0"] * klines, "high": ["2.0"] * klines,
+        "low": ["0.5"] * klines, "close": ["1.5"] * klines, "volume": ["10"] * klines,
+        "close_time": [t + 59_999 for t in opens], "quote_asset_volume": ["15"] * klines,
+        "number_of_trades": [TRADES_PER_KLINE] * klines, "taker_buy_base_asset_volume": ["5"] * klines,
+        "taker_buy_quote_asset_volume": ["7"] * klines, "ignore": ["0"] * klines,
+        "symbol": ["BTCUSDT"] * klines, "interval": ["1m"] * klines,
+    })
+    n = klines * TRADES_PER_KLINE
+    step = 60_000 // TRADES_PER_KLINE
+    aggtrades = pl.DataFrame({
+        "symbol": ["BTCUSDT"] * n,
+        "kline_open": [T0 + i // TRADES_PER_KLINE * 60_000 for i in range(n)],
+        "agg_trade_id": range(n), "price": ["100.5"] * n, "quantity": ["0.25"] * n,
+        "first_trade_id": range(n), "last_trade_id": range(n),
+        "timestamp": [T0 + i * step for i in range(n)],
+        "is_buyer_maker": [i % 2 == 0 for i in range(n)], "is_best_match": [True] * n,
+    })
+    return merge_klines_aggtrades(raw, aggtrades)
+
+
+async def run(uri: str, sizes: list[int]):
+    client = AsyncMongoClient(uri, serverSelectionTimeoutMS=2000)
+    await client.admin.command("ping")
+    name = f"binance_wss_bench_{os.getpid()}"
+    try:
+        await init_beanie(database=client[name], document_models=[Kline])
+        collection = Kline.get_pymongo_collection()
+
+        async def stored() -> list[dict]:
+            return await collection.find({}, {"_id": 0}).sort("open_time").to_list()
+
+        print(f"{'klines':>6}  {'beanie prep':>11}  {'beanie total':>12}  {'fast prep':>9}  {'fast total':>10}")
+        for klines in sizes:
+            df = make_frame(klines)
+
+            await collection.delete_many({})
+            t0 = time.perf_counter()
+            records = build_klines(df.to_dicts())
+            beanie_prep = time.perf_counter() - t0
+            await Kline.insert_many(records)
+            beanie_total = time.perf_counter() - t0
+            beanie_docs = await stored()
+
+            await collection.delete_many({})
+            t0 = time.perf_counter()
+            docs = encode_klines(split_aggtrades(to_kline_frame(df))[0])
+            fast_prep = time.perf_counter() - t0
+            await collection.insert_many(docs)
+            fast_total = time.perf_counter() - t0
+            assert await stored() == beanie_docs, "los documentos guardados no coinciden"
+
+            print(f"{klines:>6}  {beanie_prep:>9.3f} s  {beanie_total:>10.3f} s  {fast_prep:>7.3f} s  {fast_total:>8.3f} s")
+    finally:
+        await client.drop_database(name)
+        await client.close()
+
+
+async def client_only(sizes: list[int]):
+    """Solo la preparación de cada camino, hasta los bytes que pymongo enviaría."""
+    database = AsyncMongoClient("mongodb://localhost:1", connect=False)[f"binance_wss_bench_{os.getpid()}"]
+
+    # init_beanie solo consulta la versión y las colecciones existentes
+    async def command(*args, **kwargs):
+        return {"version": "7.0.0", "versionArray": [7, 0, 0, 0]}
+
+    async def list_collection_names(*args, **kwargs):
+        return []
+
+    database.command, database.list_collection_names = command, list_collection_names
+    await init_beanie(database=database, document_models=[Kline], skip_indexes=True)
+
+    print(f"{'klines':>6}  {'beanie prep':>11}  {'fast prep':>9}  {'speedup':>7}")
+    for klines in sizes:
+        df = make_frame(klines)
+
+        t0 = time.perf_counter()
+        records = build_klines(df.to_dicts())
+        encoded = [bson.encode(get_dict(record, to_db=True, keep_nulls=record.get_settings().keep_nulls))
+                   for record in records]
+        beanie_prep = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        docs = encode_klines(split_aggtrades(to_kline_frame(df))[0])
+        fast_prep = time.perf_counter() - t0
+        assert [bson.decode(raw) for raw in encoded] == [bson.decode(doc.raw) for doc in docs], \
+            "los documentos codificados no coinciden"
+
+        print(f"{klines:>6}  {beanie_prep:>9.3f} s  {fast_prep:>7.3f} s  {beanie_prep / fast_prep:>6.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--uri", default=os.environ.get("TEST_MONGODB_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--client-only", action="store_true", help="Sin mongod: solo la preparación en el cliente")
+    parser.add_argument("--klines", type=int, nargs="+", default=[1440, 4320, 10080])
+    args = parser.parse_args()
+    asyncio.run(client_only(args.klines) if args.client_only else run(args.uri, args.klines))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Benchmark de los parciales de KPIs de un tramo de velas 1m (1M velas por defecto).
+
+Tres caminos sobre el mismo tramo, cada uno en su propio intérprete, con
+la latencia y el RSS que añade (pico muestreado de /proc/self/statm; Linux):
+
+- pipeline: `_pipeline_parciales` ($match → $group por símbolo → $project)
+  en Mongo vía `RollupService.parciales_tramo`; llega un parcial por símbolo;
+- polars: `RollupService.velas_1m` (solo `CAMPOS_VELA`) y `_parciales_velas`,
+  el camino de los tramos con velas en la capa fría;
+- beanie: el camino anterior, `Kline.find(query).to_list()` con un `Kline`
+  por vela y los parciales sumados en un bucle de Python.
+
+Se comprueba que los tres dan los mismos parciales.
+
+Con `--uri` se carga una base desechable de un mongod real. Con
+`--client-only` no hace falta servidor: los documentos que mandaría Mongo
+en cada camino se codifican a BSON fuera de la medida y se mide solo lo
+que hace el cliente (decodificar, construir los modelos y agregar); el
+$group del servidor, la lectura de disco y la red no entran, y la
+respuesta del pipeline se toma de los parciales de las mismas velas.
+
+Uso:
+    python scripts/bench_kpi_partials.py [--uri mongodb://localhost:27017] [--symbols 10] [--minutes 100000]
+    python scripts/bench_kpi_partials.py --client-only
+
+Resultado registrado con `--client-only` (el entorno no tenía mongod), 1M
+velas 1m (10 símbolos × 100 000 minutos), Python 3.11, 1 CPU:
+
+    path        latency          +RSS      docs
+    pipeline    0.000 s       0.1 MiB        10
+    polars      8.132 s    2317.3 MiB   1000000
+    beanie     44.489 s    2114.6 MiB   1000000
+
+La tabla contra un mongod real (sin `--client-only`) suma a pipeline el
+$group en el servidor y a los otros dos la lectura y el envío de 1M
+documentos; falta medirla.
+"""
+import argparse
+import asyncio
+import ctypes
+import gc
+import json
+import math
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+from pathlib import Path
+
+import bson
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+for name in ("BINANCE_API_KEY", "BINANCE_API_SECRET_KEY", "BINANCE_API_BASE_URL",
+             "MONGODB_URI", "MONGODB_DB_NAME", "MONGODB_COLLECTION_NAME"):
+    os.environ.setdefault(name, "bench")
+
+import polars as pl  # noqa: E402
+from beanie import init_beanie  # noqa: E402
+from pymongo import AsyncMongoClient  # noqa: E402
+
+from binance_wss.app.models.mongo_models import Kline  # noqa: E402
+from binance_wss.app.services.rollup_service import (  # noqa: E402
+    CAMPOS_VELA, ESQUEMA_VELA, RollupService, _parciales_velas, ms_a_fecha,
+)
+
+T0 = 1_700_000_040_000 // 60_000 * 60_000
+PATHS = ("pipeline", "polars", "beanie")
+
+
+def make_docs(symbol: int, minutes: int) -> list[dict]:
+    """Velas 1m de un símbolo con precios y aggTrades que cambian por minuto."""
+    start = ms_a_fecha(T0).replace(tzinfo=None)
+    docs = []
+    for minute in range(minutes):
+        open_time = start + timedelta(minutes=minute)
+        low = 100.0 + symbol + math.sin(minute / 30)
+        docs.append({
+            "symbol": f"SYM{symbol}USDT", "interval": "1m", "open_time": open_time,
+            "close_time": open_time + timedelta(milliseconds=59_999),
+            "open_price": low + 0.5, "close_price": low + 1.0, "high_price": low + 1.0 + minute % 7 / 10,
+            "low_price": low, "volume": 1.0 + minute % 11, "quote_asset_volume": 100.0 + minute % 13,
+            "number_of_trades": 10 + minute % 5, "taker_buy_base_asset_volume": 0.5 + minute % 3,
+            "taker_buy_quote_asset_volume": 50.0, "aggtrade_count": minute % 4,
+            "aggtrade_buyer_count": minute % 2, "aggtrade_seller_count": minute % 4 - minute % 2,
+            "aggtrade_quantity": minute % 4 * 0.25,
+        })
+    return docs
+
+
+def parciales_beanie(klines: list[Kline]) -> list[dict]:
+    """Parciales por símbolo sumando los `Kline` en Python, como hacía `KPIService`."""
+    parciales = {}
+    for kline in klines:
+        parcial = parciales.get(kline.symbol)
+        if parcial is None:
+            parcial = parciales[kline.symbol] = defaultdict(int, symbol=kline.symbol, volatilidad_max=0.0,
+                                                            high=kline.high_price, low=kline.low_price)
+        volatilidad = (kline.high_price - kline.low_price) / kline.low_price * 100 if kline.low_price > 0 else 0.0
+        parcial["volatilidad_suma"] += volatilidad
+        parcial["volatilidad_max"] = max(parcial["volatilidad_max"], volatilidad)
+        parcial["num_velas"] += 1
+        parcial["high"] = max(parcial["high"], kline.high_price)
+        parcial["low"] = min(parcial["low"], kline.low_price)
+        parcial["volumen"] += kline.volume
+        parcial["volumen_quote"] += kline.quote_asset_volume
+        parcial["trades"] += kline.number_of_trades
+        parcial["volumen_taker_buy"] += kline.taker_buy_base_asset_volume
+        parcial["aggtrades"] += kline.aggtrade_count
+        parcial["aggtrades_compradores"] += kline.aggtrade_buyer_count
+        parcial["aggtrades_vendedores"] += kline.aggtrade_seller_count
+        parcial["aggtrades_cantidad"] += kline.aggtrade_quantity
+    return [dict(parcial) for parcial in parciales.values()]
+
+
+def same(a: list[dict], b: list[dict]) -> bool:
+    a, b = sorted(a, key=lambda p: p["symbol"]), sorted(b, key=lambda p: p["symbol"])
+    return len(a) == len(b) and all(
+        x.keys() == y.keys() and all(
+            math.isclose(x[k], y[k], rel_tol=1e-9) if isinstance(x[k], float) else x[k] == y[k] for k in x
+        )
+        for x, y in zip(a, b)
+    )
+
+
+def rss() -> int:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+async def measure(path) -> dict:
+    """Latencia, RSS añadido (pico muestreado) y parciales de un camino."""
+    gc.collect()
+    start = peak = rss()
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not done.wait(0.01):
+            peak = max(peak, rss())
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    t0 = time.perf_counter()
+    try:
+        parciales, docs = await path()
+    finally:
+        elapsed = time.perf_counter() - t0
+        done.set()
+        sampler.join()
+    return {"latency": elapsed, "rss_mib": (max(peak, rss()) - start) / 2**20, "docs": docs, "parciales": parciales}
+
+
+async def mongod_path(name: str, uri: str, db: str, minutes: int):
+    """Un camino contra la base ya cargada por `load`."""
+    client = AsyncMongoClient(uri)
+    await init_beanie(database=client[db], document_models=[Kline])
+    inicio, fin = T0, T0 + minutes * 60_000
+
+    async def pipeline():
+        parciales = await RollupService.parciales_tramo(None, None, inicio, fin)
+        return parciales, len(parciales)
+
+    async def polars():
+        velas = await RollupService.velas_1m(None, inicio, fin)
+        return _parciales_velas(velas), velas.height
+
+    async def beanie():
+        klines = await Kline.find(RollupService.consulta(None, inicio, fin)).to_list()
+        return parciales_beanie(klines), len(klines)
+
+    try:
+        return await measure({"pipeline": pipeline, "polars": polars, "beanie": beanie}[name])
+    finally:
+        await client.close()
+
+
+async def client_only_path(name: str, symbols: int, minutes: int):
+    """Un camino sin servidor: lo que llegaría por la red se codifica a BSON fuera de la medida."""
+    docs = [doc for symbol in range(symbols) for doc in make_docs(symbol, minutes)]
+    if name == "beanie":
+        # Beanie solo pide la colección al construir cada documento
+        Kline.get_pymongo_collection = classmethod(lambda cls: None)
+        completos = [bson.encode({"_id": bson.ObjectId(), **doc}) for doc in docs]
+        del docs
+
+        async def path():
+            klines = [Kline.model_validate(bson.decode(raw)) for raw in completos]
+            return parciales_beanie(klines), len(klines)
+    else:
+        proyectados = [bson.encode({campo: doc[campo] for campo in CAMPOS_VELA}) for doc in docs]
+        del docs
+        if name == "pipeline":
+            # la respuesta del $group: los parciales de las mismas velas
+            frame = pl.from_dicts([bson.decode(raw) for raw in proyectados], schema=ESQUEMA_VELA)
+            agregados = [bson.encode(parcial) for parcial in _parciales_velas(frame)]
+            del frame, proyectados
+
+            async def path():
+                parciales = [bson.decode(raw) for raw in agregados]
+                return parciales, len(parciales)
+        else:
+            async def path():
+                velas = pl.from_dicts([bson.decode(raw) for raw in proyectados], schema=ESQUEMA_VELA)
+                return _parciales_velas(velas), velas.height
+
+    gc.collect()
+    ctypes.CDLL("libc.so.6").malloc_trim(0)
+    return await measure(path)
+
+
+async def load(uri: str, db: str, symbols: int, minutes: int):
+    client = AsyncMongoClient(uri, serverSelectionTimeoutMS=2000)
+    await client.admin.command("ping")
+    try:
+        await init_beanie(database=client[db], document_models=[Kline])
+        for symbol in range(symbols):
+            await Kline.get_pymongo_collection().insert_many(make_docs(symbol, minutes))
+    finally:
+        await client.close()
+
+
+async def drop(uri: str, db: str):
+    client = AsyncMongoClient(uri)
+    await client.drop_database(db)
+    await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--uri", default=os.environ.get("TEST_MONGODB_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--client-only", action="store_true", help="Sin mongod: solo el coste en el cliente")
+    parser.add_argument("--symbols", type=int, default=10)
+    parser.add_argument("--minutes", type=int, default=100_000)
+    parser.add_argument("--path", choices=PATHS, help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.path:
+        # proceso hijo: un solo camino, el resultado en JSON por stdout
+        if args.client_only:
+            result = asyncio.run(client_only_path(args.path, args.symbols, args.minutes))
+        else:
+            result = asyncio.run(mongod_path(args.path, args.uri, args.db, args.minutes))
+        print(json.dumps(result, default=str))
+        return
+
+    db = f"binance_wss_bench_{os.getpid()}"
+    if not args.client_only:
+        asyncio.run(load(args.uri, db, args.symbols, args.minutes))
+    try:
+        # cada camino en su propio intérprete: la memoria que libera uno no la reutiliza el siguiente
+        command = [sys.executable, __file__, "--uri", args.uri, "--db", db,
+                   "--symbols", str(args.symbols), "--minutes", str(args.minutes)]
+        command += ["--client-only"] if args.client_only else []
+        print(f"{args.symbols * args.minutes:,} velas 1m ({args.symbols} símbolos)")
+        print(f"{'path':<8}  {'latency':>9}  {'+RSS':>12}  {'docs':>8}")
+        results = []
+        for path in PATHS:
+            output = subprocess.run([*command, "--path", path], capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.splitlines()[-1])
+            print(f"{path:<8}  {result['latency']:>7.3f} s  {result['rss_mib']:>8.1f} MiB  {result['docs']:>8}")
+            results.append(result["parciales"])
+        assert all(same(results[0], other) for other in results[1:]), "los parciales no coinciden"
+    finally:
+        if not args.client_only:
+            asyncio.run(drop(args.uri, db))
+
+
+if __name__ == "__main__":
+    main()
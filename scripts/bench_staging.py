@@ -0,0 +1,110 @@
+"""
+Benchmark del paso de datos entre tasks del ETL: XCom en JSON contra
+staging en Arrow IPC (`binance_wss.data.staging`).
+
+Para N aggTrades (100 por vela) mide solo la serialización de una
+ejecución, sin el merge:
+
+- XCom: extract → transform con velas y aggTrades como `to_dicts()` en
+  JSON (dumps + loads + DataFrame) y transform → load igual con el
+  resultado anidado, como hacía el DAG antes del staging;
+- Arrow IPC: `write_frame` + `read_frame` (memory-map) de los mismos
+  frames; por XCom solo viajan las rutas.
+
+Uso:
+    python scripts/bench_staging.py [--trades 10000 100000 1000000]
+
+Resultado registrado:
+     trades  json xcom  arrow ipc
+      10000    0.250 s    0.005 s
+     100000    2.954 s    0.010 s
+    1000000   25.833 s    0.127 s
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import polars as pl
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+for name in ("BINANCE_API_KEY", "BINANCE_API_SECRET_KEY", "BINANCE_API_BASE_URL",
+             "MONGODB_URI", "MONGODB_DB_NAME", "MONGODB_COLLECTION_NAME"):
+    os.environ.setdefault(name, "bench")
+
+from binance_wss.data.extract import bucket_aggtrades  # noqa: E402
+from binance_wss.data.staging import read_frame, write_frame  # noqa: E402
+from binance_wss.data.transform import merge_klines_aggtrades  # noqa: E402
+
+T0 = 1_700_000_000_000
+TRADES_PER_KLINE = 100
+
+
+def make_frames(trades: int) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """Velas crudas (strings, como las devuelve Binance) y aggTrades ya asignados a su vela."""
+    n = trades // TRADES_PER_KLINE
+    opens = [T0 + i * 60_000 for i in range(n)]
+    klines = pl.DataFrame({
+        "open_time": opens, "open": ["1.0"] * n, "high": ["2.0"] * n, "low": ["0.5"] * n,
+        "close": ["1.5"] * n, "volume": ["10"] * n, "close_time": [t + 59_999 for t in opens],
+        "quote_asset_volume": ["15"] * n, "number_of_trades": [TRADES_PER_KLINE] * n,
+        "taker_buy_base_asset_volume": ["5"] * n, "taker_buy_quote_asset_volume": ["7"] * n,
+        "ignore": ["0"] * n, "symbol": ["BTCUSDT"] * n, "interval": ["1m"] * n,
+    })
+    rng = random.Random(0)
+    aggtrades = pl.DataFrame({
+        "agg_trade_id": range(trades),
+        "price": [f"{rng.uniform(90, 110):.2f}" for _ in range(trades)],
+        "quantity": [f"{rng.uniform(0, 1):.4f}" for _ in range(trades)],
+        "first_trade_id": range(trades),
+        "last_trade_id": range(trades),
+        "timestamp": [T0 + i * (60_000 // TRADES_PER_KLINE) for i in range(trades)],
+        "is_buyer_maker": [rng.random() < 0.5 for _ in range(trades)],
+        "is_best_match": [True] * trades,
+    })
+    return klines, bucket_aggtrades(klines, aggtrades)
+
+
+def json_xcom(klines: pl.DataFrame, aggtrades: pl.DataFrame, merged: pl.DataFrame):
+    # Airflow guarda el XCom serializado en su base y la task siguiente lo deserializa
+    payload = json.loads(json.dumps({"klines": klines.to_dicts(), "aggtrades": aggtrades.to_dicts()}))
+    pl.DataFrame(payload["klines"]), pl.DataFrame(payload["aggtrades"])
+    rows = json.loads(json.dumps(merged.to_dicts(), default=str))
+    return pl.DataFrame(rows)
+
+
+def arrow_ipc(klines: pl.DataFrame, aggtrades: pl.DataFrame, merged: pl.DataFrame, directory: Path):
+    refs = {"klines": [write_frame(klines, directory, "klines")],
+            "aggtrades": [write_frame(aggtrades, directory, "aggtrades")]}
+    read_frame(refs["klines"]), read_frame(refs["aggtrades"])
+    return read_frame(write_frame(merged, directory, "transformed"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--trades", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'trades':>7}  {'json xcom':>9}  {'arrow ipc':>9}")
+    for trades in args.trades:
+        klines, aggtrades = make_frames(trades)
+        merged = merge_klines_aggtrades(klines, aggtrades)
+
+        t0 = time.perf_counter()
+        json_xcom(klines, aggtrades, merged)
+        xcom_time = time.perf_counter() - t0
+
+        with tempfile.TemporaryDirectory() as directory:
+            t0 = time.perf_counter()
+            arrow_ipc(klines, aggtrades, merged, Path(directory))
+            ipc_time = time.perf_counter() - t0
+
+        print(f"{trades:>7}  {xcom_time:>7.3f} s  {ipc_time:>7.3f} s")
+
+
+if __name__ == "__main__":
+    main()
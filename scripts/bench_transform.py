@@ -0,0 +1,162 @@
+"""
+Benchmark de `merge_klines_aggtrades`: merge vectorizado contra el bucle
+por vela que había antes.
+
+El merge anterior (reproducido abajo) recibía una fila por vela con la
+lista de sus trades y construía, casteaba y volvía a pasar a dicts un
+DataFrame por vela. El actual recibe el frame plano de `bucket_aggtrades`
+y anida con un único `group_by` + join. Antes de medir se comprueba que
+ambos producen las mismas velas con los mismos trades.
+
+Uso:
+    python scripts/bench_transform.py
+
+Resultado registrado:
+    klines  trades/kline  per-row loop  vectorized
+        60           100       0.069 s     0.003 s
+      1440           100       1.811 s     0.033 s
+      1440          1000      14.408 s     0.267 s
+"""
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+import polars as pl
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+for name in ("BINANCE_API_KEY", "BINANCE_API_SECRET_KEY", "BINANCE_API_BASE_URL",
+             "MONGODB_URI", "MONGODB_DB_NAME", "MONGODB_COLLECTION_NAME"):
+    os.environ.setdefault(name, "bench")
+
+from binance_wss.data.extract import AGGTRADE_COLUMNS, bucket_aggtrades  # noqa: E402
+from binance_wss.data.transform import AGGTRADE_SCHEMA, merge_klines_aggtrades  # noqa: E402
+
+T0 = 1_700_000_000_000
+
+
+def old_bucket_aggtrades(klines: pl.DataFrame, aggtrades: pl.DataFrame) -> pl.DataFrame:
+    """Entrada del merge anterior: una fila (symbol, kline_open, aggtrades: list[struct]) por vela."""
+    keys = klines.select(
+        pl.col("symbol"),
+        pl.col("open_time").cast(pl.Int64).alias("kline_open"),
+        pl.col("close_time").cast(pl.Int64),
+    ).sort("kline_open")
+    bucketed = (
+        aggtrades
+        .with_columns(pl.col("timestamp").cast(pl.Int64))
+        .sort("timestamp")
+        .join_asof(keys.drop("symbol"), left_on="timestamp", right_on="kline_open", strategy="backward")
+        .filter(pl.col("timestamp") <= pl.col("close_time"))
+        .group_by("kline_open")
+        .agg(pl.struct(list(AGGTRADE_COLUMNS.values())).alias("aggtrades"))
+    )
+    return (
+        keys.select("symbol", "kline_open")
+        .join(bucketed, on="kline_open", how="left")
+        .with_columns(pl.col("aggtrades").fill_null([]))
+    )
+
+
+def old_merge_klines_aggtrades(klines: pl.DataFrame, aggtrades: pl.DataFrame) -> pl.DataFrame:
+    """El merge por vela anterior a la vectorización."""
+    kline_df = klines.drop("ignore", strict=False).cast({
+        "open_time": pl.Int64,
+        "open": pl.Float64,
+        "high": pl.Float64,
+        "low": pl.Float64,
+        "close": pl.Float64,
+        "volume": pl.Float64,
+        "close_time": pl.Int64,
+        "quote_asset_volume": pl.Float64,
+        "number_of_trades": pl.Int64,
+        "taker_buy_base_asset_volume": pl.Float64,
+        "taker_buy_quote_asset_volume": pl.Float64,
+    }).with_columns(
+        pl.col("open_time").cast(pl.Datetime("ms")),
+        pl.col("close_time").cast(pl.Datetime("ms")),
+    )
+
+    processed_aggtrades, kline_open_times, kline_symbols = [], [], []
+    for item in aggtrades.iter_rows(named=True):
+        agg_rows = item["aggtrades"]
+        if agg_rows:
+            agg_df = pl.DataFrame(agg_rows).cast(AGGTRADE_SCHEMA).with_columns(
+                pl.col("timestamp").cast(pl.Datetime("ms"))
+            )
+            agg_rows = agg_df.to_dicts()
+        processed_aggtrades.append(agg_rows or [])
+        kline_open_times.append(item["kline_open"])
+        kline_symbols.append(item["symbol"])
+
+    agg_struct_df = pl.DataFrame({
+        "symbol": kline_symbols,
+        "kline_open": kline_open_times,
+        "aggtrades": processed_aggtrades,
+    }).with_columns(pl.col("kline_open").cast(pl.Datetime("ms")))
+
+    return kline_df.join(
+        agg_struct_df,
+        left_on=["symbol", "open_time"],
+        right_on=["symbol", "kline_open"],
+        how="left",
+    )
+
+
+def make_frames(klines: int, per_kline: int) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """Velas crudas y aggTrades al azar dentro de ellas; la segunda vela queda sin trades."""
+    rng = random.Random(0)
+    opens = [T0 + i * 60_000 for i in range(klines)]
+    kline_df = pl.DataFrame({
+        "open_time": opens, "open": ["1.0"] * klines, "high": ["2.0"] * klines,
+        "low": ["0.5"] * klines, "close": ["1.5"] * klines, "volume": ["10"] * klines,
+        "close_time": [t + 59_999 for t in opens], "quote_asset_volume": ["15"] * klines,
+        "number_of_trades": [per_kline] * klines, "taker_buy_base_asset_volume": ["5"] * klines,
+        "taker_buy_quote_asset_volume": ["7"] * klines, "ignore": ["0"] * klines,
+        "symbol": ["ETHUSDT"] * klines, "interval": ["1m"] * klines,
+    })
+    timestamps = sorted(
+        t for t in (rng.randrange(T0, T0 + klines * 60_000) for _ in range(klines * per_kline))
+        if not T0 + 60_000 <= t < T0 + 120_000
+    )
+    n = len(timestamps)
+    trades = pl.DataFrame({
+        "agg_trade_id": range(n), "price": [f"{rng.random():.6f}" for _ in range(n)],
+        "quantity": ["0.1"] * n, "first_trade_id": range(n), "last_trade_id": range(n),
+        "timestamp": timestamps, "is_buyer_maker": [rng.random() < 0.5 for _ in range(n)],
+        "is_best_match": [True] * n,
+    })
+    return kline_df, trades
+
+
+def normalize(df: pl.DataFrame) -> pl.DataFrame:
+    df = df.sort("open_time").with_columns(
+        pl.col("aggtrades").list.eval(pl.element().sort_by(pl.element().struct.field("agg_trade_id")))
+    )
+    return df.select(sorted(df.columns))
+
+
+def main():
+    print(f"{'klines':>6}  {'trades/kline':>12}  {'per-row loop':>12}  {'vectorized':>10}")
+    for klines, per_kline in [(60, 100), (1440, 100), (1440, 1000)]:
+        kline_df, trades = make_frames(klines, per_kline)
+        old_input, new_input = old_bucket_aggtrades(kline_df, trades), bucket_aggtrades(kline_df, trades)
+
+        old = old_merge_klines_aggtrades(kline_df, old_input)
+        new = merge_klines_aggtrades(kline_df, new_input)
+        assert normalize(old).equals(normalize(new)), "los merges no coinciden"
+
+        t0 = time.perf_counter()
+        old_merge_klines_aggtrades(kline_df, old_input)
+        old_time = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        merge_klines_aggtrades(kline_df, new_input)
+        new_time = time.perf_counter() - t0
+
+        print(f"{klines:>6}  {per_kline:>12}  {old_time:>10.3f} s  {new_time:>8.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,16 @@
+import asyncio
 from datetime import datetime
 from typing import List, Optional
 from bson import ObjectId
 
 from fastapi import HTTPException, Query, APIRouter
 from pydantic import BaseModel
-from ..models.mongo_models import Kline, AggTrade
+from ..models.mongo_models import KLINE_SORT_FIELDS, AggTradeEvent, Kline
+from ..services.aggtrade_service import AggTradeService
+from ..services.partition_service import PartitionService
+from ..services.rollup_service import RollupService, fecha_a_ms
+from binance_wss.data import archive
+from binance_wss.data.rollups import refresh_rollups, touched_ranges
 
 router = APIRouter(prefix="/kline", tags=["Klines"])
 
@@ -69,10 +75,14 @@ class KlineResponse(KlineBase):
         from_attributes = True
 
 # ---------- Helper Functions ----------
-def kline_to_response(kline: Kline) -> KlineResponse:
-    """Convierte un documento Kline de Beanie a KlineResponse"""
+def kline_to_response(kline: Kline, aggtrades: Optional[List[AggTradeEvent]] = None) -> KlineResponse:
+    """
+    Convierte un documento Kline de Beanie a KlineResponse. Los aggtrades
+    viven en su propia colección y solo se incluyen si se pasan. Las velas
+    de la capa fría no tienen _id: se identifican por symbol y open_time.
+    """
     return KlineResponse(
-        id=str(kline.id),
+        id=str(kline.id) if kline.id else f"{kline.symbol}-{fecha_a_ms(kline.open_time)}",
         open_time=kline.open_time,
         close_time=kline.close_time,
         symbol=kline.symbol,
@@ -88,7 +98,7 @@ def kline_to_response(kline: Kline) -> KlineResponse:
         taker_buy_quote_asset_volume=kline.taker_buy_quote_asset_volume,
         aggtrades=[
             AggTradeResponse(
-                trade_id=agg.trade_id,
+                trade_id=agg.agg_trade_id,
                 price=agg.price,
                 quantity=agg.quantity,
                 first_trade_id=agg.first_trade_id,
@@ -97,10 +107,28 @@ def kline_to_response(kline: Kline) -> KlineResponse:
                 is_buyer_maker=agg.is_buyer_maker,
                 is_best_match=agg.is_best_match,
             )
-            for agg in kline.aggtrades
+            for agg in aggtrades or []
         ]
     )
 
+
+def aggtrade_events(symbol: str, aggtrades: List[AggTradeResponse]) -> List[AggTradeEvent]:
+    """Convierte los aggtrades de una petición en documentos de la colección `aggtrades`"""
+    return [
+        AggTradeEvent(
+            symbol=symbol,
+            agg_trade_id=agg.trade_id,
+            price=agg.price,
+            quantity=agg.quantity,
+            first_trade_id=agg.first_trade_id,
+            last_trade_id=agg.last_trade_id,
+            timestamp=agg.timestamp,
+            is_buyer_maker=agg.is_buyer_maker,
+            is_best_match=agg.is_best_match,
+        )
+        for agg in aggtrades
+    ]
+
 @router.post("/klines", response_model=KlineResponse, status_code=201, tags=["Klines"])
 async def create_kline(kline: KlineCreate):
     """
@@ -109,21 +137,7 @@ async def create_kline(kline: KlineCreate):
     Crea una nueva vela en la base de datos.
     """
     try:
-        # Convertir AggTradeResponse a AggTrade
-        aggtrades = [
-            AggTrade(
-                trade_id=agg.trade_id,
-                price=agg.price,
-                quantity=agg.quantity,
-                first_trade_id=agg.first_trade_id,
-                last_trade_id=agg.last_trade_id,
-                timestamp=agg.timestamp,
-                is_buyer_maker=agg.is_buyer_maker,
-                is_best_match=agg.is_best_match,
-            )
-            for agg in kline.aggtrades
-        ]
-        
+        aggtrades = aggtrade_events(kline.symbol, kline.aggtrades)
         new_kline = Kline(
             open_time=kline.open_time,
             close_time=kline.close_time,
@@ -138,11 +152,16 @@ async def create_kline(kline: KlineCreate):
             number_of_trades=kline.number_of_trades,
             taker_buy_base_asset_volume=kline.taker_buy_base_asset_volume,
             taker_buy_quote_asset_volume=kline.taker_buy_quote_asset_volume,
-            aggtrades=aggtrades,
+            **AggTradeService.parciales_de_vela(aggtrades),
         )
         
-        await new_kline.insert()
-        return kline_to_response(new_kline)
+        await PartitionService.guardar(new_kline)
+
+        # Los aggtrades van a la colección time-series
+        if aggtrades:
+            await AggTradeEvent.insert_many(aggtrades)
+        await refresh_rollups(touched_ranges([(new_kline.symbol, new_kline.open_time)]))
+        return kline_to_response(new_kline, aggtrades)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error al crear kline: {str(e)}")
 
@@ -155,7 +174,9 @@ async def list_klines(
     limit: int = Query(100, ge=1, le=1000, description="Número máximo de resultados"),
     skip: int = Query(0, ge=0, description="Número de resultados a saltar (paginación)"),
     sort_by: str = Query("open_time", description="Campo por el cual ordenar"),
-    sort_order: str = Query("desc", regex="^(asc|desc)$", description="Orden: 'asc' o 'desc'")
+    sort_order: str = Query("desc", regex="^(asc|desc)$", description="Orden: 'asc' o 'desc'"),
+    include_aggtrades: bool = Query(False, description="Incluir los aggtrades de cada vela"),
+    interval: str = Query("1m", regex="^(1m|5m|15m|1h|1d)$", description="Intervalo de las velas: 1m o un rollup (5m, 15m, 1h, 1d)")
 ):
     """
     **GET /klines** - Listar velas con filtros
@@ -168,11 +189,17 @@ async def list_klines(
     - **skip**: Número de resultados a saltar para paginación (default: 0)
     - **sort_by**: Campo por el cual ordenar (default: open_time)
     - **sort_order**: Orden ascendente ('asc') o descendente ('desc', default)
+    - **include_aggtrades**: Incluir los aggtrades de cada vela (default: false)
+    - **interval**: 1m (default) o un rollup precalculado: 5m, 15m, 1h, 1d
+
+    Las velas 1m de días archivados se leen de la capa fría (Parquet) y se
+    mezclan con las de Mongo con el mismo filtro, orden y paginación.
     
     **Ejemplos:**
     - `/klines?symbol=BTCUSDT&limit=50`
     - `/klines?start_date=2025-01-01T00:00:00&end_date=2025-01-31T23:59:59`
     - `/klines?symbol=ETHUSDT&limit=10&skip=20&sort_by=volume&sort_order=desc`
+    - `/klines?symbol=BTCUSDT&interval=1h&start_date=2025-01-01T00:00:00&end_date=2025-01-31T23:59:59`
     """
     try:
         # Construir query de filtrado
@@ -190,21 +217,45 @@ async def list_klines(
         
         # Construir ordenamiento
         sort_direction = -1 if sort_order == "desc" else 1
-        sort_field = sort_by if sort_by in [
-            "open_time", "close_time", "open_price", "close_price",
-            "high_price", "low_price", "volume", "symbol"
-        ] else "open_time"
+        sort_field = sort_by if sort_by in KLINE_SORT_FIELDS else "open_time"
         
-        # Ejecutar query con Beanie
-        klines = await Kline.find(query).sort((sort_field, sort_direction)).skip(skip).limit(limit).to_list()
+        orden = (sort_field, sort_direction)
+        inicio = fecha_a_ms(start_date) if start_date else None
+        fin = fecha_a_ms(end_date) + 1 if end_date else None
+
+        if interval != "1m":
+            # Rollup precalculado del intervalo
+            coleccion = RollupService.coleccion(interval)
+            klines = await coleccion.find(query).sort(orden).skip(skip).limit(limit).to_list()
+        else:
+            # Velas 1m archivadas: las primeras skip + limit de cada capa bastan para la página
+            frias = await asyncio.to_thread(
+                archive.read_klines, symbol, inicio, fin, sort_field, sort_direction == -1, skip + limit
+            )
+            if frias:
+                calientes = await PartitionService.buscar(query, symbol, inicio, fin, orden, 0, skip + limit)
+                claves = {(kline.symbol, kline.open_time) for kline in calientes}
+                klines = calientes + [kline for kline in frias if (kline.symbol, kline.open_time) not in claves]
+                klines.sort(key=lambda kline: getattr(kline, sort_field), reverse=sort_direction == -1)
+                klines = klines[skip:skip + limit]
+            else:
+                # velas 1m de Mongo (de las particiones que correspondan)
+                klines = await PartitionService.buscar(query, symbol, inicio, fin, orden, skip, limit)
         
-        return [kline_to_response(kline) for kline in klines]
+        if not include_aggtrades:
+            return [kline_to_response(kline) for kline in klines]
+
+        trades = await AggTradeService.trades_por_vela(klines, RollupService.bucket(interval))
+        return [kline_to_response(kline, trades.get((kline.symbol, kline.open_time))) for kline in klines]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener klines: {str(e)}")
 
 
 @router.get("/klines/{kline_id}", response_model=KlineResponse, tags=["Klines"])
-async def get_kline(kline_id: str):
+async def get_kline(
+    kline_id: str,
+    include_aggtrades: bool = Query(False, description="Incluir los aggtrades de la vela")
+):
     """
     **GET /klines/{id}** - Obtener una vela por ID
     
@@ -214,11 +265,12 @@ async def get_kline(kline_id: str):
         if not ObjectId.is_valid(kline_id):
             raise HTTPException(status_code=400, detail="ID inválido")
         
-        kline = await Kline.get(kline_id)
+        kline = await PartitionService.obtener(ObjectId(kline_id))
         if not kline:
             raise HTTPException(status_code=404, detail="Kline no encontrada")
         
-        return kline_to_response(kline)
+        aggtrades = await AggTradeService.trades_de_vela(kline) if include_aggtrades else None
+        return kline_to_response(kline, aggtrades)
     except HTTPException:
         raise
     except Exception as e:
@@ -236,35 +288,38 @@ async def update_kline(kline_id: str, kline_update: KlineUpdate):
         if not ObjectId.is_valid(kline_id):
             raise HTTPException(status_code=400, detail="ID inválido")
         
-        kline = await Kline.get(kline_id)
+        kline = await PartitionService.obtener(ObjectId(kline_id))
         if not kline:
             raise HTTPException(status_code=404, detail="Kline no encontrada")
         
         # Actualizar solo los campos proporcionados
         update_data = kline_update.model_dump(exclude_unset=True)
-        
-        if "aggtrades" in update_data:
-            # Convertir AggTradeResponse a AggTrade
-            update_data["aggtrades"] = [
-                AggTrade(
-                    trade_id=agg.trade_id,
-                    price=agg.price,
-                    quantity=agg.quantity,
-                    first_trade_id=agg.first_trade_id,
-                    last_trade_id=agg.last_trade_id,
-                    timestamp=agg.timestamp,
-                    is_buyer_maker=agg.is_buyer_maker,
-                    is_best_match=agg.is_best_match,
-                )
-                for agg in kline_update.aggtrades
-            ]
+        update_data.pop("aggtrades", None)
+        antes = (kline.symbol, kline.open_time)
         
         # Aplicar actualizaciones
         for field, value in update_data.items():
             setattr(kline, field, value)
+
+        aggtrades = None
+        if kline_update.aggtrades is not None:
+            aggtrades = aggtrade_events(kline.symbol, kline_update.aggtrades)
+            for field, value in AggTradeService.parciales_de_vela(aggtrades).items():
+                setattr(kline, field, value)
         
-        await kline.save()
-        return kline_to_response(kline)
+        await PartitionService.guardar(kline, antes)
+
+        if aggtrades is not None:
+            # Reemplazar los aggtrades de la vela en la colección time-series
+            await AggTradeEvent.find({
+                "symbol": kline.symbol,
+                "timestamp": {"$gte": kline.open_time, "$lte": kline.close_time},
+            }).delete()
+            if aggtrades:
+                await AggTradeEvent.insert_many(aggtrades)
+
+        await refresh_rollups(touched_ranges([antes, (kline.symbol, kline.open_time)]))
+        return kline_to_response(kline, aggtrades)
     except HTTPException:
         raise
     except Exception as e:
@@ -282,11 +337,16 @@ async def delete_kline(kline_id: str):
         if not ObjectId.is_valid(kline_id):
             raise HTTPException(status_code=400, detail="ID inválido")
         
-        kline = await Kline.get(kline_id)
+        kline = await PartitionService.obtener(ObjectId(kline_id))
         if not kline:
             raise HTTPException(status_code=404, detail="Kline no encontrada")
         
-        await kline.delete()
+        await AggTradeEvent.find({
+            "symbol": kline.symbol,
+            "timestamp": {"$gte": kline.open_time, "$lte": kline.close_time},
+        }).delete()
+        await PartitionService.eliminar(kline)
+        await refresh_rollups(touched_ranges([(kline.symbol, kline.open_time)]))
         return {"detail": "Kline eliminada exitosamente", "id": kline_id}
     except HTTPException:
         raise
@@ -304,12 +364,7 @@ async def get_symbols():
     Retorna una lista de todos los símbolos únicos en la base de datos.
     """
     try:
-        pipeline = [
-            {"$group": {"_id": "$symbol"}},
-            {"$sort": {"_id": 1}}
-        ]
-        symbols = await Kline.aggregate(pipeline).to_list()
-        return {"symbols": [s["_id"] for s in symbols]}
+        return {"symbols": await PartitionService.simbolos()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener símbolos: {str(e)}")
 
@@ -336,7 +391,12 @@ async def get_count(
             if end_date:
                 query["open_time"]["$lte"] = end_date
         
-        count = await Kline.find(query).count()
+        count = await PartitionService.contar(
+            query,
+            symbol,
+            fecha_a_ms(start_date) if start_date else None,
+            fecha_a_ms(end_date) + 1 if end_date else None,
+        )
         return {"count": count, "filters": {"symbol": symbol, "start_date": start_date, "end_date": end_date}}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al contar klines: {str(e)}")
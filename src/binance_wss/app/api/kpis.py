@@ -1,7 +1,9 @@
 from fastapi import APIRouter, Query
 from typing import Optional
 from datetime import datetime
+from ..services.kpi_cache_service import KPICacheService
 from ..services.kpi_service import KPIService
+from ..services.rolling_kpi_service import RollingKPIService
 
 router = APIRouter(prefix="/kpis", tags=["KPIs"])
 
@@ -10,7 +12,8 @@ router = APIRouter(prefix="/kpis", tags=["KPIs"])
 async def get_volatilidad(
     symbol: Optional[str] = Query(None, description="Símbolo del par de trading (ej: BTCUSDT)"),
     fecha_inicio: Optional[datetime] = Query(None, description="Fecha de inicio del periodo"),
-    fecha_fin: Optional[datetime] = Query(None, description="Fecha de fin del periodo")
+    fecha_fin: Optional[datetime] = Query(None, description="Fecha de fin del periodo"),
+    ventana_minutos: Optional[int] = Query(None, ge=1, description="Últimos N minutos (en lugar de fecha_inicio/fecha_fin)")
 ):
     """
     KPI: Volatilidad del Mercado
@@ -21,14 +24,17 @@ async def get_volatilidad(
     - datos_globales: Promedio de volatilidad global en porcentaje
     - datos_por_simbolo: Métricas detalladas por cada símbolo
     """
-    return await KPIService.calcular_volatilidad(symbol, fecha_inicio, fecha_fin)
+    if ventana_minutos is not None:
+        return await RollingKPIService.obtener("volatilidad", symbol, ventana_minutos)
+    return await KPICacheService.obtener("volatilidad", KPIService.calcular_volatilidad, symbol, fecha_inicio, fecha_fin)
 
 
 @router.get("/volumen")
 async def get_volumen_trading(
     symbol: Optional[str] = Query(None, description="Símbolo del par de trading (ej: BTCUSDT)"),
     fecha_inicio: Optional[datetime] = Query(None, description="Fecha de inicio del periodo"),
-    fecha_fin: Optional[datetime] = Query(None, description="Fecha de fin del periodo")
+    fecha_fin: Optional[datetime] = Query(None, description="Fecha de fin del periodo"),
+    ventana_minutos: Optional[int] = Query(None, ge=1, description="Últimos N minutos (en lugar de fecha_inicio/fecha_fin)")
 ):
     """
     KPI: Volumen de Trading
@@ -39,14 +45,17 @@ async def get_volumen_trading(
     - datos_globales: Volumen total BTC, USDT y número de trades
     - datos_por_simbolo: Volúmenes y estadísticas por símbolo
     """
-    return await KPIService.calcular_volumen_trading(symbol, fecha_inicio, fecha_fin)
+    if ventana_minutos is not None:
+        return await RollingKPIService.obtener("volumen", symbol, ventana_minutos)
+    return await KPICacheService.obtener("volumen", KPIService.calcular_volumen_trading, symbol, fecha_inicio, fecha_fin)
 
 
 @router.get("/presion")
 async def get_presion_compradora_vendedora(
     symbol: Optional[str] = Query(None, description="Símbolo del par de trading (ej: BTCUSDT)"),
     fecha_inicio: Optional[datetime] = Query(None, description="Fecha de inicio del periodo"),
-    fecha_fin: Optional[datetime] = Query(None, description="Fecha de fin del periodo")
+    fecha_fin: Optional[datetime] = Query(None, description="Fecha de fin del periodo"),
+    ventana_minutos: Optional[int] = Query(None, ge=1, description="Últimos N minutos (en lugar de fecha_inicio/fecha_fin)")
 ):
     """
     KPI: Presión Compradora vs Vendedora
@@ -57,14 +66,19 @@ async def get_presion_compradora_vendedora(
     - datos_globales: Porcentaje global de presión compradora y sentimiento del mercado
     - datos_por_simbolo: Presión y sentimiento por cada símbolo
     """
-    return await KPIService.calcular_presion_compradora_vendedora(symbol, fecha_inicio, fecha_fin)
+    if ventana_minutos is not None:
+        return await RollingKPIService.obtener("presion", symbol, ventana_minutos)
+    return await KPICacheService.obtener(
+        "presion", KPIService.calcular_presion_compradora_vendedora, symbol, fecha_inicio, fecha_fin
+    )
 
 
 @router.get("/aggtrades-stats")
 async def get_aggtrades_stats(
     symbol: Optional[str] = Query(None, description="Símbolo del par de trading (ej: BTCUSDT)"),
     fecha_inicio: Optional[datetime] = Query(None, description="Fecha de inicio del periodo"),
-    fecha_fin: Optional[datetime] = Query(None, description="Fecha de fin del periodo")
+    fecha_fin: Optional[datetime] = Query(None, description="Fecha de fin del periodo"),
+    ventana_minutos: Optional[int] = Query(None, ge=1, description="Últimos N minutos (en lugar de fecha_inicio/fecha_fin)")
 ):
     """
     Estadísticas de Aggregate Trades
@@ -74,19 +88,23 @@ async def get_aggtrades_stats(
     Respuesta:
     - datos_por_simbolo: Total de trades, distribución compradores/vendedores, cantidades promedio
     """
-    return await KPIService.calcular_aggtrades_stats(symbol, fecha_inicio, fecha_fin)
+    if ventana_minutos is not None:
+        return await RollingKPIService.obtener("aggtrades", symbol, ventana_minutos)
+    return await KPICacheService.obtener("aggtrades", KPIService.calcular_aggtrades_stats, symbol, fecha_inicio, fecha_fin)
 
 
 @router.get("/resumen")
 async def get_resumen_completo(
     symbol: Optional[str] = Query(None, description="Símbolo del par de trading (ej: BTCUSDT)"),
     fecha_inicio: Optional[datetime] = Query(None, description="Fecha de inicio del periodo"),
-    fecha_fin: Optional[datetime] = Query(None, description="Fecha de fin del periodo")
+    fecha_fin: Optional[datetime] = Query(None, description="Fecha de fin del periodo"),
+    ventana_minutos: Optional[int] = Query(None, ge=1, description="Últimos N minutos (en lugar de fecha_inicio/fecha_fin)")
 ):
     """
     Resumen Completo de Todos los KPIs
     
-    Retorna todos los KPIs en una sola llamada para optimizar el dashboard.
+    Retorna todos los KPIs en una sola llamada para optimizar el dashboard,
+    leyendo el rango una sola vez.
     
     Respuesta:
     - volatilidad: Datos de volatilidad del mercado
@@ -94,14 +112,29 @@ async def get_resumen_completo(
     - presion: Datos de presión compradora/vendedora
     - aggtrades: Estadísticas de trades agregados
     """
-    volatilidad = await KPIService.calcular_volatilidad(symbol, fecha_inicio, fecha_fin)
-    volumen = await KPIService.calcular_volumen_trading(symbol, fecha_inicio, fecha_fin)
-    presion = await KPIService.calcular_presion_compradora_vendedora(symbol, fecha_inicio, fecha_fin)
-    aggtrades = await KPIService.calcular_aggtrades_stats(symbol, fecha_inicio, fecha_fin)
-    
-    return {
-        "volatilidad": volatilidad,
-        "volumen": volumen,
-        "presion": presion,
-        "aggtrades": aggtrades
-    }
+    if ventana_minutos is not None:
+        return await RollingKPIService.obtener("resumen", symbol, ventana_minutos)
+    return await KPICacheService.obtener("resumen", KPIService.calcular_resumen, symbol, fecha_inicio, fecha_fin)
+
+
+@router.get("/cache")
+async def get_cache_metricas():
+    """
+    Métricas de la caché de KPIs
+
+    Aciertos, fallos, invalidaciones por watermark, expulsiones LRU y
+    entradas actuales de la caché en este proceso de la API.
+    """
+    return KPICacheService.metricas()
+
+
+@router.get("/ventanas")
+async def get_ventanas_metricas():
+    """
+    Estado de los KPIs en memoria
+
+    Ventanas configuradas, símbolos en memoria, si la sincronización está
+    al día y cuántas peticiones con `ventana_minutos` salieron de memoria o
+    se calcularon sobre Mongo.
+    """
+    return RollingKPIService.metricas()
@@ -1,25 +1,21 @@
 """
 Aplicación principal de FastAPI con MongoDB Atlas
 """
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
 from contextlib import asynccontextmanager
 
-from .models.mongo_models import Kline
+from .db import DOCUMENT_MODELS, mongo_client
 from .api.route import api_router
+from .services.rolling_kpi_service import RollingKPIService
 from .settings import settings
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    client = AsyncIOMotorClient(
-        settings.MONGODB_URI,
-        serverSelectionTimeoutMS=5000,
-        maxPoolSize=10,
-        minPoolSize=1
-    )
+    client = mongo_client()
     
     try:
         await client.admin.command('ping')
@@ -30,12 +26,17 @@ async def lifespan(app: FastAPI):
     database = client[settings.MONGODB_DB_NAME]
     await init_beanie(
         database=database,
-        document_models=[Kline]
+        document_models=DOCUMENT_MODELS
     )
     
     app.state.db_client = client
+
+    # KPIs de los últimos N minutos en memoria, al ritmo de los watermarks del loader
+    ventanas = asyncio.create_task(RollingKPIService.ejecutar()) if settings.KPI_ROLLING_ENABLED else None
     
     yield
+    if ventanas is not None:
+        ventanas.cancel()
     client.close()
 
 
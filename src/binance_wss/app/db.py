@@ -1,24 +1,76 @@
-import asyncio
+import logging
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
 from typing import Optional
 
 from .settings import settings
-from .models.mongo_models import Kline
+from .models.mongo_models import (
+    AggTradeEvent,
+    DataWatermark,
+    Kline,
+    KlineRollup1d,
+    KlineRollup1h,
+    KlineRollup5m,
+    KlineRollup15m,
+    Watermark,
+)
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_MODELS = [
+    Kline,
+    AggTradeEvent,
+    KlineRollup5m,
+    KlineRollup15m,
+    KlineRollup1h,
+    KlineRollup1d,
+    Watermark,
+    DataWatermark,
+]
 
 _db_client: Optional[AsyncIOMotorClient] = None
 _db_initialized = False
 
+
+def mongo_client() -> AsyncIOMotorClient:
+    """Cliente de Mongo con el pool y los timeouts de `Settings`."""
+    return AsyncIOMotorClient(
+        settings.MONGODB_URI,
+        maxPoolSize=settings.MONGODB_MAX_POOL_SIZE,
+        minPoolSize=settings.MONGODB_MIN_POOL_SIZE,
+        serverSelectionTimeoutMS=settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=settings.MONGODB_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=settings.MONGODB_SOCKET_TIMEOUT_MS,
+    )
+
+
 async def get_db():
     global _db_client, _db_initialized
 
     if not _db_client:
-        _db_client = AsyncIOMotorClient(settings.MONGODB_URI)
+        _db_client = mongo_client()
     
     if not _db_initialized:
         db = _db_client[settings.MONGODB_DB_NAME]
-        await init_beanie(database=db, document_models=[Kline])
+        await init_beanie(database=db, document_models=DOCUMENT_MODELS)
         _db_initialized = True
-        print("Beanie MongoDB initialized (singleton)")
+        logger.info(
+            "Beanie MongoDB initialized (pool %d-%d)",
+            settings.MONGODB_MIN_POOL_SIZE, settings.MONGODB_MAX_POOL_SIZE,
+        )
+
+    return _db_client[settings.MONGODB_DB_NAME]
+
+
+def close_db():
+    """
+    Cierra el cliente singleton. El cliente queda ligado al event loop en
+    el que se usó, así que quien crea su propio loop (`asyncio.run`) debe
+    cerrarlo antes de que el loop termine.
+    """
+    global _db_client, _db_initialized
 
-    return _db_client[settings.MONGODB_DB_NAME]
\ No newline at end of file
+    if _db_client:
+        _db_client.close()
+    _db_client = None
+    _db_initialized = False
\ No newline at end of file
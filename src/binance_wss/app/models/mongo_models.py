@@ -1,8 +1,10 @@
 
 import pymongo
 from datetime import datetime
-from beanie import Document
+from typing import Optional
+from beanie import Document, Granularity, TimeSeriesConfig
 from pydantic import BaseModel
+from pymongo import IndexModel
 
 
 class AggTrade(BaseModel):
@@ -16,6 +18,65 @@ class AggTrade(BaseModel):
     is_best_match: bool
 
 
+class AggTradeEvent(Document):
+    """
+    AggTrade en la colección time-series `aggtrades` (meta = symbol).
+
+    Los trades de una vela son los del mismo símbolo con `timestamp` en
+    [open_time, close_time]; la vela ya no los embebe.
+    """
+    symbol: str
+    agg_trade_id: int
+    price: float
+    quantity: float
+    first_trade_id: int
+    last_trade_id: int
+    timestamp: datetime
+    is_buyer_maker: bool
+    is_best_match: bool
+
+    class Settings:
+        name = "aggtrades"
+        timeseries = TimeSeriesConfig(
+            time_field="timestamp",
+            meta_field="symbol",
+            granularity=Granularity.seconds,
+        )
+        indexes = [
+            [
+                ("symbol", pymongo.ASCENDING),
+                ("timestamp", pymongo.ASCENDING),
+            ],
+        ]
+
+
+# campos por los que `GET /klines` ordena (otro valor ordena por open_time)
+KLINE_SORT_FIELDS = (
+    "open_time", "close_time", "open_price", "close_price",
+    "high_price", "low_price", "volume", "symbol",
+)
+# los que tienen índice (symbol, campo) para el listado de un símbolo; el
+# resto de órdenes (o estos sin symbol) se ordenan en memoria
+SYMBOL_SORT_FIELDS = ("volume", "close_price")
+
+
+def _query_indexes() -> list:
+    """
+    Índices de las formas de consulta de `GET /klines` y los KPIs que no
+    cubre la clave (symbol, open_time), comunes a las velas 1m, sus
+    particiones y los rollups. `python -m binance_wss.data.indexes check`
+    comprueba con explain() que ninguna forma termina en COLLSCAN o SORT.
+    """
+    return [
+        # rango u orden por open_time sin symbol
+        IndexModel([("open_time", pymongo.ASCENDING)]),
+    ] + [
+        # listado de un símbolo ordenado por volumen o precio de cierre
+        IndexModel([("symbol", pymongo.ASCENDING), (field, pymongo.ASCENDING)])
+        for field in SYMBOL_SORT_FIELDS
+    ]
+
+
 class Kline(Document):
     open_time: datetime
     close_time: datetime
@@ -30,14 +91,134 @@ class Kline(Document):
     number_of_trades: int
     taker_buy_base_asset_volume: float
     taker_buy_quote_asset_volume: float
-    aggtrades: list[AggTrade]
+    # parciales de los aggTrades de la vela (compradores = taker buy, is_buyer_maker = false)
+    aggtrade_count: int = 0
+    aggtrade_buyer_count: int = 0
+    aggtrade_seller_count: int = 0
+    aggtrade_quantity: float = 0.0
 
     class Settings:
         name = "kline_with_aggtrades"
         indexes = [
-            "open_time",
+            # clave de upsert: una sola vela por (symbol, interval, open_time)
+            IndexModel(
+                [
+                    ("symbol", pymongo.ASCENDING),
+                    ("interval", pymongo.ASCENDING),
+                    ("open_time", pymongo.ASCENDING),
+                ],
+                unique=True,
+            ),
+            # listado y KPIs: igualdad en symbol, rango y orden por open_time
+            IndexModel(
+                [
+                    ("symbol", pymongo.ASCENDING),
+                    ("open_time", pymongo.ASCENDING),
+                ],
+            ),
+        ] + _query_indexes()
+
+
+class KlineRollupFields(BaseModel):
+    """
+    Vela agregada a partir de las velas 1m de un bucket, con los parciales
+    de volatilidad (por vela 1m: (high - low) / low * 100) y de aggTrades
+    para poder combinar buckets sin volver a las velas originales.
+    """
+    symbol: str
+    interval: str
+    open_time: datetime
+    close_time: datetime
+    open_price: float
+    close_price: float
+    high_price: float
+    low_price: float
+    volume: float
+    quote_asset_volume: float
+    number_of_trades: int
+    taker_buy_base_asset_volume: float
+    taker_buy_quote_asset_volume: float
+    kline_count: int
+    volatility_sum: float
+    volatility_max: float
+    aggtrade_count: int = 0
+    aggtrade_buyer_count: int = 0
+    aggtrade_seller_count: int = 0
+    aggtrade_quantity: float = 0.0
+
+
+def _rollup_indexes() -> list:
+    # clave del $merge con el que el loader recalcula cada bucket
+    return [
+        IndexModel(
             [
-                ("open_time", pymongo.ASCENDING),
                 ("symbol", pymongo.ASCENDING),
+                ("open_time", pymongo.ASCENDING),
             ],
+            unique=True,
+        ),
+    ] + _query_indexes()
+
+
+class KlineRollup5m(KlineRollupFields, Document):
+    class Settings:
+        name = "kline_rollup_5m"
+        indexes = _rollup_indexes()
+
+
+class KlineRollup15m(KlineRollupFields, Document):
+    class Settings:
+        name = "kline_rollup_15m"
+        indexes = _rollup_indexes()
+
+
+class KlineRollup1h(KlineRollupFields, Document):
+    class Settings:
+        name = "kline_rollup_1h"
+        indexes = _rollup_indexes()
+
+
+class KlineRollup1d(KlineRollupFields, Document):
+    class Settings:
+        name = "kline_rollup_1d"
+        indexes = _rollup_indexes()
+
+
+class Watermark(Document):
+    """Última vela cerrada y último aggTrade cargados por (symbol, interval)."""
+    symbol: str
+    interval: str
+    last_open_time: datetime
+    last_agg_trade_id: Optional[int] = None
+    updated_at: datetime
+
+    class Settings:
+        name = "extraction_watermarks"
+        indexes = [
+            IndexModel(
+                [
+                    ("symbol", pymongo.ASCENDING),
+                    ("interval", pymongo.ASCENDING),
+                ],
+                unique=True,
+            ),
+        ]
+
+
+class DataWatermark(Document):
+    """
+    Versión de las velas 1m de un símbolo, que avanza cada recálculo de
+    rollups: `newest` es la vela más nueva escrita y `epoch` sube cuando
+    se reescribe una vela anterior a ella (backfill, CRUD, recarga).
+    La caché de KPIs invalida con ella.
+    """
+    symbol: str
+    newest: datetime
+    epoch: int = 0
+    updated_at: datetime
+
+    class Settings:
+        name = "data_watermarks"
+        indexes = [
+            IndexModel([("symbol", pymongo.ASCENDING)], unique=True),
         ]
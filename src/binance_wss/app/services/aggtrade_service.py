@@ -0,0 +1,156 @@
+import asyncio
+from typing import Dict, List, Any, Optional, Tuple
+from datetime import datetime, timedelta
+from ..models.mongo_models import AggTradeEvent, Kline
+from .rollup_service import fecha_a_ms
+from binance_wss.data import archive
+
+MINUTO = timedelta(minutes=1)
+
+
+def _truncar_minuto(fecha: datetime) -> datetime:
+    return fecha.replace(second=0, microsecond=0)
+
+
+def _truncar(fecha: datetime, bucket: timedelta) -> datetime:
+    epoch = datetime(1970, 1, 1, tzinfo=fecha.tzinfo)
+    return epoch + (fecha - epoch) // bucket * bucket
+
+
+def _por_id(trades: List[AggTradeEvent]) -> List[AggTradeEvent]:
+    # Mongo los devuelve por timestamp (orden del índice, sin SORT en memoria);
+    # el agg_trade_id crece con el tiempo, así que esto solo reordena empates
+    trades.sort(key=lambda trade: trade.agg_trade_id)
+    return trades
+
+
+class AggTradeService:
+    """Consultas sobre la colección time-series `aggtrades`"""
+
+    @staticmethod
+    def rango_trades(
+        fecha_inicio: Optional[datetime] = None,
+        fecha_fin: Optional[datetime] = None
+    ) -> Dict[str, datetime]:
+        """
+        Traduce un filtro de velas por open_time ([fecha_inicio, fecha_fin])
+        al rango de `timestamp` de sus trades: desde la primera vela que
+        abre en o después de fecha_inicio hasta el cierre de la vela que
+        abre en o antes de fecha_fin.
+        """
+        rango = {}
+        if fecha_inicio:
+            inicio = _truncar_minuto(fecha_inicio)
+            rango["$gte"] = inicio if inicio == fecha_inicio else inicio + MINUTO
+        if fecha_fin:
+            rango["$lt"] = _truncar_minuto(fecha_fin) + MINUTO
+        return rango
+
+    @staticmethod
+    def parciales_de_vela(trades: List[AggTradeEvent]) -> Dict[str, Any]:
+        """Parciales de aggTrades que se guardan en la vela (compradores = is_buyer_maker false)"""
+        compradores = sum(1 for trade in trades if not trade.is_buyer_maker)
+        return {
+            "aggtrade_count": len(trades),
+            "aggtrade_buyer_count": compradores,
+            "aggtrade_seller_count": len(trades) - compradores,
+            "aggtrade_quantity": float(sum(trade.quantity for trade in trades)),
+        }
+
+    @staticmethod
+    async def buscar(
+        symbol: Optional[str] = None,
+        fecha_inicio: Optional[datetime] = None,
+        fecha_fin: Optional[datetime] = None,
+        limit: Optional[int] = None
+    ) -> List[AggTradeEvent]:
+        """Trades del símbolo en el rango de velas [fecha_inicio, fecha_fin], ordenados por timestamp."""
+        query: Dict[str, Any] = {}
+        if symbol:
+            query["symbol"] = symbol
+        rango = AggTradeService.rango_trades(fecha_inicio, fecha_fin)
+        if rango:
+            query["timestamp"] = rango
+
+        consulta = AggTradeEvent.find(query).sort(("timestamp", 1))
+        if limit:
+            consulta = consulta.limit(limit)
+        return await consulta.to_list()
+
+    @staticmethod
+    async def trades_de_vela(kline: Kline) -> List[AggTradeEvent]:
+        """Trades de una vela: mismo símbolo y timestamp en [open_time, close_time]."""
+        trades = await AggTradeEvent.find({
+            "symbol": kline.symbol,
+            "timestamp": {"$gte": kline.open_time, "$lte": kline.close_time},
+        }).sort(("timestamp", 1)).to_list()
+        return _por_id(trades)
+
+    @staticmethod
+    async def trades_por_vela(
+        klines: List[Kline],
+        bucket: timedelta = MINUTO
+    ) -> Dict[Tuple[str, datetime], List[AggTradeEvent]]:
+        """
+        Trades de un conjunto de velas (1m o de un rollup de tamaño `bucket`)
+        con una consulta por símbolo, agrupados por (symbol, open_time). Los
+        trades de días archivados se leen de la capa fría.
+        """
+        rangos: Dict[str, List[datetime]] = {}
+        for kline in klines:
+            inicio, fin = rangos.setdefault(kline.symbol, [kline.open_time, kline.open_time])
+            rangos[kline.symbol] = [min(inicio, kline.open_time), max(fin, kline.open_time)]
+
+        claves = {(kline.symbol, kline.open_time) for kline in klines}
+        agrupado: Dict[Tuple[str, datetime], List[AggTradeEvent]] = {clave: [] for clave in claves}
+
+        for sym, (inicio, fin) in rangos.items():
+            calientes, frios = await asyncio.gather(
+                AggTradeEvent.find({
+                    "symbol": sym,
+                    "timestamp": {"$gte": inicio, "$lt": fin + bucket},
+                }).sort(("timestamp", 1)).to_list(),
+                asyncio.to_thread(archive.read_trades, sym, fecha_a_ms(inicio), fecha_a_ms(fin + bucket)),
+            )
+            # los días archivados son anteriores a los que siguen en Mongo;
+            # si un trade está en ambos (archivado a medias) gana el de Mongo
+            calientes = _por_id(calientes)
+            ids = {trade.agg_trade_id for trade in calientes}
+            trades = [trade for trade in frios if trade.agg_trade_id not in ids] + calientes
+
+            for trade in trades:
+                clave = (sym, _truncar(trade.timestamp, bucket))
+                if clave in agrupado:
+                    agrupado[clave].append(trade)
+
+        return agrupado
+
+    @staticmethod
+    async def estadisticas_por_simbolo(
+        symbol: Optional[str] = None,
+        fecha_inicio: Optional[datetime] = None,
+        fecha_fin: Optional[datetime] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Conteos y cantidades por símbolo calculados en el servidor:
+        total de trades, compradores (taker buy, `is_buyer_maker` = false),
+        vendedores y cantidad total.
+        """
+        match: Dict[str, Any] = {}
+        if symbol:
+            match["symbol"] = symbol
+        rango = AggTradeService.rango_trades(fecha_inicio, fecha_fin)
+        if rango:
+            match["timestamp"] = rango
+
+        pipeline = [
+            {"$match": match},
+            {"$group": {
+                "_id": "$symbol",
+                "total_aggtrades": {"$sum": 1},
+                "trades_compradores": {"$sum": {"$cond": ["$is_buyer_maker", 0, 1]}},
+                "trades_vendedores": {"$sum": {"$cond": ["$is_buyer_maker", 1, 0]}},
+                "total_cantidad": {"$sum": "$quantity"},
+            }},
+        ]
+        return await AggTradeEvent.aggregate(pipeline).to_list()
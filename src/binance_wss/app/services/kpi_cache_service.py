@@ -0,0 +1,105 @@
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from ..models.mongo_models import DataWatermark
+from ..settings import settings
+from .rollup_service import RollupService, fecha_a_ms
+
+# (kpi, symbol, inicio, fin) → (resultado, sello de los watermarks con que se calculó)
+_entradas: "OrderedDict[tuple, Tuple[Any, tuple]]" = OrderedDict()
+_marcas: Dict[str, Any] = {"por_simbolo": None, "leido": 0.0}
+_metricas = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+
+class KPICacheService:
+    """
+    Caché LRU en proceso delante de `KPIService`.
+
+    La clave es el KPI, el símbolo y el rango normalizado a velas 1m
+    (`RollupService.rango_minutos`), así que dos peticiones dentro del mismo
+    minuto comparten entrada. Cada entrada guarda el sello de los
+    `DataWatermark` con que se calculó. Un rango que termina antes de la vela
+    más nueva de su símbolo solo depende del `epoch` (se reescribe historia),
+    así que sigue valiendo mientras se añaden velas nuevas. Un rango que
+    llega a la vela más nueva se recalcula cuando el loader la avanza.
+    """
+
+    @staticmethod
+    async def marcas(refrescar: bool = False) -> Dict[str, Tuple[int, int]]:
+        """{symbol: (epoch, newest en epoch ms)}, releído cada KPI_CACHE_WATERMARK_POLL_SECONDS."""
+        vencido = time.monotonic() - _marcas["leido"] > settings.KPI_CACHE_WATERMARK_POLL_SECONDS
+        if refrescar or _marcas["por_simbolo"] is None or vencido:
+            docs = await DataWatermark.get_pymongo_collection().find(
+                {}, {"_id": 0, "symbol": 1, "epoch": 1, "newest": 1}
+            ).to_list(None)
+            _marcas["por_simbolo"] = {
+                doc["symbol"]: (doc.get("epoch", 0), fecha_a_ms(doc["newest"]))
+                for doc in docs
+            }
+            _marcas["leido"] = time.monotonic()
+        return _marcas["por_simbolo"]
+
+    @staticmethod
+    def sello(marcas: Dict[str, Tuple[int, int]], symbol: Optional[str], fin: Optional[int]) -> tuple:
+        """Parte de los watermarks de la que depende el resultado de (symbol, [.., fin))."""
+        def de_simbolo(sym: str) -> tuple:
+            epoch, newest = marcas.get(sym, (0, None))
+            abierto = newest is None or fin is None or fin > newest
+            return (epoch, newest if abierto else None)
+
+        if symbol:
+            return de_simbolo(symbol)
+        return tuple((sym, de_simbolo(sym)) for sym in sorted(marcas))
+
+    @staticmethod
+    async def obtener(
+        kpi: str,
+        calcular: Callable[..., Awaitable[Dict[str, Any]]],
+        symbol: Optional[str] = None,
+        fecha_inicio: Optional[datetime] = None,
+        fecha_fin: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        """Resultado de `calcular(symbol, fecha_inicio, fecha_fin)`, de la caché si sigue vigente."""
+        if not settings.KPI_CACHE_ENABLED:
+            return await calcular(symbol, fecha_inicio, fecha_fin)
+
+        inicio, fin = RollupService.rango_minutos(fecha_inicio, fecha_fin)
+        clave = (kpi, symbol, inicio, fin)
+        sello = KPICacheService.sello(await KPICacheService.marcas(), symbol, fin)
+
+        entrada = _entradas.get(clave)
+        if entrada is not None:
+            if entrada[1] == sello:
+                _entradas.move_to_end(clave)
+                _metricas["hits"] += 1
+                return entrada[0]
+            del _entradas[clave]
+            _metricas["invalidations"] += 1
+
+        _metricas["misses"] += 1
+        # con el sello leído antes de calcular: si los datos cambian mientras
+        # tanto, la siguiente petición ve otro sello y recalcula
+        resultado = await calcular(symbol, fecha_inicio, fecha_fin)
+        _entradas[clave] = (resultado, sello)
+        while len(_entradas) > settings.KPI_CACHE_MAX_ENTRIES:
+            _entradas.popitem(last=False)
+            _metricas["evictions"] += 1
+        return resultado
+
+    @staticmethod
+    def metricas() -> Dict[str, Any]:
+        consultas = _metricas["hits"] + _metricas["misses"]
+        return {
+            **_metricas,
+            "hit_ratio": round(_metricas["hits"] / consultas, 4) if consultas else 0.0,
+            "entries": len(_entradas),
+            "max_entries": settings.KPI_CACHE_MAX_ENTRIES,
+            "enabled": settings.KPI_CACHE_ENABLED,
+        }
+
+    @staticmethod
+    def limpiar():
+        _entradas.clear()
+        _marcas["por_simbolo"] = None
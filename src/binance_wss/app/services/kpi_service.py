@@ -1,7 +1,29 @@
 from typing import Dict, List, Any
 from datetime import datetime
 from beanie import PydanticObjectId
-from ..models.mongo_models import Kline
+import polars as pl
+from .rollup_service import ESQUEMA_PARCIAL, RollupService
+
+
+def _por_simbolo(parciales: List[Dict[str, Any]]):
+    # en el orden en que aparece cada símbolo, como los dicts de antes (desempates del sort)
+    return pl.from_dicts(parciales, schema=ESQUEMA_PARCIAL).group_by("symbol", maintain_order=True)
+
+
+def _cociente(numerador: str, denominador: str, escala: float = 1, vacio: float = 0.0) -> pl.Expr:
+    return (
+        pl.when(pl.col(denominador) > 0)
+        .then(pl.col(numerador) / pl.col(denominador) * escala)
+        .otherwise(vacio)
+    )
+
+
+def _sentimiento(presion_compradora: float) -> str:
+    if presion_compradora > 55:
+        return "ALCISTA"
+    if presion_compradora < 45:
+        return "BAJISTA"
+    return "NEUTRAL"
 
 
 class KPIService:
@@ -20,21 +42,13 @@ class KPIService:
         - Datos globales: promedio de volatilidad, unidad
         - Datos por símbolo: volatilidad promedio, máxima, precios extremos, número de registros
         """
-        query = {}
-        
-        if symbol:
-            query["symbol"] = symbol
-        if fecha_inicio:
-            query["open_time"] = {"$gte": fecha_inicio}
-        if fecha_fin:
-            if "open_time" in query:
-                query["open_time"]["$lte"] = fecha_fin
-            else:
-                query["open_time"] = {"$lte": fecha_fin}
-
-        klines = await Kline.find(query).to_list()
-        
-        if not klines:
+        # velas 1m o el rollup más grueso que responde el rango exactamente
+        parciales = await RollupService.parciales(symbol, fecha_inicio, fecha_fin)
+        return KPIService._volatilidad(parciales)
+
+    @staticmethod
+    def _volatilidad(parciales: List[Dict[str, Any]]) -> Dict[str, Any]:
+        if not parciales:
             return {
                 "datos_globales": {
                     "valor_global": 0.0,
@@ -43,47 +57,35 @@ class KPIService:
                 "datos_por_simbolo": []
             }
 
-        # Agrupar por símbolo
-        agrupado = {}
-        for kline in klines:
-            sym = kline.symbol
-            if sym not in agrupado:
-                agrupado[sym] = []
-            
-            # Calcular volatilidad de la vela
-            volatilidad = ((kline.high_price - kline.low_price) / kline.low_price) * 100 if kline.low_price > 0 else 0
-            
-            agrupado[sym].append({
-                "volatilidad": volatilidad,
-                "high": kline.high_price,
-                "low": kline.low_price
-            })
-
-        # Calcular métricas por símbolo
-        datos_por_simbolo = []
-        volatilidades_totales = []
-        
-        for sym, data in agrupado.items():
-            volatilidades = [d["volatilidad"] for d in data]
-            precios_altos = [d["high"] for d in data]
-            precios_bajos = [d["low"] for d in data]
-            
-            volatilidad_promedio = sum(volatilidades) / len(volatilidades) if volatilidades else 0
-            volatilidad_maxima = max(volatilidades) if volatilidades else 0
-            
-            volatilidades_totales.extend(volatilidades)
-            
-            datos_por_simbolo.append({
-                "symbol": sym,
-                "volatilidad_promedio": round(volatilidad_promedio, 4),
-                "volatilidad_maxima": round(volatilidad_maxima, 4),
-                "precio_max": round(max(precios_altos), 2) if precios_altos else 0,
-                "precio_min": round(min(precios_bajos), 2) if precios_bajos else 0,
-                "num_registros": len(data)
-            })
+        # Agrupar por símbolo (la volatilidad de cada vela 1m ya viene sumada en los parciales)
+        agrupado = _por_simbolo(parciales).agg(
+            pl.col("volatilidad_suma").sum(),
+            pl.col("volatilidad_max").max(),
+            pl.col("high").max(),
+            pl.col("low").min(),
+            pl.col("num_velas").sum(),
+        ).with_columns(
+            pl.when(pl.col("num_velas") > 0)
+            .then(pl.col("volatilidad_suma") / pl.col("num_velas"))
+            .otherwise(0.0)
+            .alias("volatilidad_promedio")
+        )
+
+        datos_por_simbolo = [
+            {
+                "symbol": data["symbol"],
+                "volatilidad_promedio": round(data["volatilidad_promedio"], 4),
+                "volatilidad_maxima": round(data["volatilidad_max"], 4),
+                "precio_max": round(data["high"], 2),
+                "precio_min": round(data["low"], 2),
+                "num_registros": data["num_velas"]
+            }
+            for data in agrupado.iter_rows(named=True)
+        ]
 
         # Calcular valor global
-        valor_global = sum(volatilidades_totales) / len(volatilidades_totales) if volatilidades_totales else 0
+        num_velas_total = agrupado["num_velas"].sum()
+        valor_global = agrupado["volatilidad_suma"].sum() / num_velas_total if num_velas_total else 0
 
         return {
             "datos_globales": {
@@ -106,21 +108,13 @@ class KPIService:
         - Datos globales: volumen total en BTC y USDT, trades totales
         - Datos por símbolo: volúmenes, número de trades, promedios
         """
-        query = {}
-        
-        if symbol:
-            query["symbol"] = symbol
-        if fecha_inicio:
-            query["open_time"] = {"$gte": fecha_inicio}
-        if fecha_fin:
-            if "open_time" in query:
-                query["open_time"]["$lte"] = fecha_fin
-            else:
-                query["open_time"] = {"$lte": fecha_fin}
-
-        klines = await Kline.find(query).to_list()
-        
-        if not klines:
+        # velas 1m o el rollup más grueso que responde el rango exactamente
+        parciales = await RollupService.parciales(symbol, fecha_inicio, fecha_fin)
+        return KPIService._volumen_trading(parciales)
+
+    @staticmethod
+    def _volumen_trading(parciales: List[Dict[str, Any]]) -> Dict[str, Any]:
+        if not parciales:
             return {
                 "datos_globales": {
                     "valor_global_btc": 0.0,
@@ -131,50 +125,33 @@ class KPIService:
             }
 
         # Agrupar por símbolo
-        agrupado = {}
-        for kline in klines:
-            sym = kline.symbol
-            if sym not in agrupado:
-                agrupado[sym] = {
-                    "volumen_btc": 0.0,
-                    "volumen_usdt": 0.0,
-                    "num_trades": 0,
-                    "num_periodos": 0
-                }
-            
-            agrupado[sym]["volumen_btc"] += kline.volume
-            agrupado[sym]["volumen_usdt"] += kline.quote_asset_volume
-            agrupado[sym]["num_trades"] += kline.number_of_trades
-            agrupado[sym]["num_periodos"] += 1
-
-        # Calcular métricas
-        datos_por_simbolo = []
-        total_btc = 0.0
-        total_usdt = 0.0
-        total_trades = 0
-        
-        for sym, data in agrupado.items():
-            total_btc += data["volumen_btc"]
-            total_usdt += data["volumen_usdt"]
-            total_trades += data["num_trades"]
-            
-            volumen_promedio = data["volumen_btc"] / data["num_periodos"] if data["num_periodos"] > 0 else 0
-            usdt_por_trade = data["volumen_usdt"] / data["num_trades"] if data["num_trades"] > 0 else 0
-            
-            datos_por_simbolo.append({
-                "symbol": sym,
+        agrupado = _por_simbolo(parciales).agg(
+            pl.col("volumen").sum().alias("volumen_btc"),
+            pl.col("volumen_quote").sum().alias("volumen_usdt"),
+            pl.col("trades").sum().alias("num_trades"),
+            pl.col("num_velas").sum().alias("num_periodos"),
+        ).with_columns(
+            _cociente("volumen_btc", "num_periodos").alias("volumen_promedio"),
+            _cociente("volumen_usdt", "num_trades").alias("usdt_por_trade"),
+        )
+
+        datos_por_simbolo = [
+            {
+                "symbol": data["symbol"],
                 "volumen_btc": round(data["volumen_btc"], 8),
                 "volumen_usdt": round(data["volumen_usdt"], 2),
                 "num_trades": data["num_trades"],
-                "volumen_promedio_por_periodo": round(volumen_promedio, 8),
-                "usdt_por_trade": round(usdt_por_trade, 2)
-            })
+                "volumen_promedio_por_periodo": round(data["volumen_promedio"], 8),
+                "usdt_por_trade": round(data["usdt_por_trade"], 2)
+            }
+            for data in agrupado.iter_rows(named=True)
+        ]
 
         return {
             "datos_globales": {
-                "valor_global_btc": round(total_btc, 8),
-                "valor_global_usdt": round(total_usdt, 2),
-                "trades_totales": total_trades
+                "valor_global_btc": round(agrupado["volumen_btc"].sum(), 8),
+                "valor_global_usdt": round(agrupado["volumen_usdt"].sum(), 2),
+                "trades_totales": agrupado["num_trades"].sum()
             },
             "datos_por_simbolo": sorted(datos_por_simbolo, key=lambda x: x["volumen_usdt"], reverse=True)
         }
@@ -192,21 +169,13 @@ class KPIService:
         - Datos globales: porcentaje de presión compradora, sentimiento global
         - Datos por símbolo: presiones, sentimiento, volúmenes exactos
         """
-        query = {}
-        
-        if symbol:
-            query["symbol"] = symbol
-        if fecha_inicio:
-            query["open_time"] = {"$gte": fecha_inicio}
-        if fecha_fin:
-            if "open_time" in query:
-                query["open_time"]["$lte"] = fecha_fin
-            else:
-                query["open_time"] = {"$lte": fecha_fin}
-
-        klines = await Kline.find(query).to_list()
-        
-        if not klines:
+        # velas 1m o el rollup más grueso que responde el rango exactamente
+        parciales = await RollupService.parciales(symbol, fecha_inicio, fecha_fin)
+        return KPIService._presion_compradora_vendedora(parciales)
+
+    @staticmethod
+    def _presion_compradora_vendedora(parciales: List[Dict[str, Any]]) -> Dict[str, Any]:
+        if not parciales:
             return {
                 "datos_globales": {
                     "valor_global_pct": 0.0,
@@ -216,67 +185,34 @@ class KPIService:
             }
 
         # Agrupar por símbolo
-        agrupado = {}
-        for kline in klines:
-            sym = kline.symbol
-            if sym not in agrupado:
-                agrupado[sym] = {
-                    "volumen_compradores": 0.0,
-                    "volumen_vendedores": 0.0,
-                    "volumen_total": 0.0
-                }
-            
-            vol_compradores = kline.taker_buy_base_asset_volume
-            vol_total = kline.volume
-            vol_vendedores = vol_total - vol_compradores
-            
-            agrupado[sym]["volumen_compradores"] += vol_compradores
-            agrupado[sym]["volumen_vendedores"] += vol_vendedores
-            agrupado[sym]["volumen_total"] += vol_total
-
-        # Calcular métricas
-        datos_por_simbolo = []
-        volumen_compradores_global = 0.0
-        volumen_total_global = 0.0
-        
-        for sym, data in agrupado.items():
-            volumen_compradores_global += data["volumen_compradores"]
-            volumen_total_global += data["volumen_total"]
-            
-            presion_compradora = (data["volumen_compradores"] / data["volumen_total"] * 100) if data["volumen_total"] > 0 else 50.0
-            presion_vendedora = 100 - presion_compradora
-            
-            # Determinar sentimiento
-            if presion_compradora > 55:
-                sentimiento = "ALCISTA"
-            elif presion_compradora < 45:
-                sentimiento = "BAJISTA"
-            else:
-                sentimiento = "NEUTRAL"
-            
-            datos_por_simbolo.append({
-                "symbol": sym,
-                "presion_compradora": round(presion_compradora, 2),
-                "presion_vendedora": round(presion_vendedora, 2),
-                "sentimiento": sentimiento,
+        agrupado = _por_simbolo(parciales).agg(
+            pl.col("volumen_taker_buy").sum().alias("volumen_compradores"),
+            (pl.col("volumen") - pl.col("volumen_taker_buy")).sum().alias("volumen_vendedores"),
+            pl.col("volumen").sum().alias("volumen_total"),
+        ).with_columns(
+            _cociente("volumen_compradores", "volumen_total", 100, 50.0).alias("presion_compradora")
+        )
+
+        datos_por_simbolo = [
+            {
+                "symbol": data["symbol"],
+                "presion_compradora": round(data["presion_compradora"], 2),
+                "presion_vendedora": round(100 - data["presion_compradora"], 2),
+                "sentimiento": _sentimiento(data["presion_compradora"]),
                 "volumen_compradores": round(data["volumen_compradores"], 8),
                 "volumen_vendedores": round(data["volumen_vendedores"], 8)
-            })
+            }
+            for data in agrupado.iter_rows(named=True)
+        ]
 
         # Calcular datos globales
-        valor_global_pct = (volumen_compradores_global / volumen_total_global * 100) if volumen_total_global > 0 else 50.0
-        
-        if valor_global_pct > 55:
-            sentimiento_global = "ALCISTA"
-        elif valor_global_pct < 45:
-            sentimiento_global = "BAJISTA"
-        else:
-            sentimiento_global = "NEUTRAL"
+        volumen_total_global = agrupado["volumen_total"].sum()
+        valor_global_pct = (agrupado["volumen_compradores"].sum() / volumen_total_global * 100) if volumen_total_global > 0 else 50.0
 
         return {
             "datos_globales": {
                 "valor_global_pct": round(valor_global_pct, 2),
-                "sentimiento_global": sentimiento_global
+                "sentimiento_global": _sentimiento(valor_global_pct)
             },
             "datos_por_simbolo": sorted(datos_por_simbolo, key=lambda x: x["presion_compradora"], reverse=True)
         }
@@ -290,65 +226,66 @@ class KPIService:
         """
         Estadísticas adicionales basadas en aggtrades para enriquecer el dashboard.
         
-        Retorna estadísticas de trades individuales por símbolo.
+        Retorna estadísticas de trades individuales por símbolo, a partir de
+        los conteos de aggTrades que el loader guarda en cada vela.
         """
-        query = {}
-        
-        if symbol:
-            query["symbol"] = symbol
-        if fecha_inicio:
-            query["open_time"] = {"$gte": fecha_inicio}
-        if fecha_fin:
-            if "open_time" in query:
-                query["open_time"]["$lte"] = fecha_fin
-            else:
-                query["open_time"] = {"$lte": fecha_fin}
-
-        klines = await Kline.find(query).to_list()
-        
-        if not klines:
+        # parciales de aggTrades guardados en las velas y sus rollups
+        parciales = await RollupService.parciales(symbol, fecha_inicio, fecha_fin)
+        return KPIService._aggtrades_stats(parciales)
+
+    @staticmethod
+    def _aggtrades_stats(parciales: List[Dict[str, Any]]) -> Dict[str, Any]:
+        if not parciales:
             return {
                 "datos_por_simbolo": []
             }
 
-        # Agrupar por símbolo
-        agrupado = {}
-        for kline in klines:
-            sym = kline.symbol
-            if sym not in agrupado:
-                agrupado[sym] = {
-                    "total_aggtrades": 0,
-                    "trades_compradores": 0,
-                    "trades_vendedores": 0,
-                    "cantidad_promedio": 0.0,
-                    "total_cantidad": 0.0
-                }
-            
-            for aggtrade in kline.aggtrades:
-                agrupado[sym]["total_aggtrades"] += 1
-                agrupado[sym]["total_cantidad"] += aggtrade.quantity
-                
-                if not aggtrade.is_buyer_maker:
-                    agrupado[sym]["trades_compradores"] += 1
-                else:
-                    agrupado[sym]["trades_vendedores"] += 1
-
-        # Calcular métricas
-        datos_por_simbolo = []
-        
-        for sym, data in agrupado.items():
-            cantidad_promedio = data["total_cantidad"] / data["total_aggtrades"] if data["total_aggtrades"] > 0 else 0
-            pct_trades_compradores = (data["trades_compradores"] / data["total_aggtrades"] * 100) if data["total_aggtrades"] > 0 else 0
-            
-            datos_por_simbolo.append({
-                "symbol": sym,
+        agrupado = _por_simbolo(parciales).agg(
+            pl.col("aggtrades").sum().alias("total_aggtrades"),
+            pl.col("aggtrades_compradores").sum().alias("trades_compradores"),
+            pl.col("aggtrades_vendedores").sum().alias("trades_vendedores"),
+            pl.col("aggtrades_cantidad").sum().alias("total_cantidad"),
+        )
+        # los símbolos con velas pero sin trades en el rango salen con 0
+        agrupado = agrupado.with_columns(
+            _cociente("total_cantidad", "total_aggtrades").alias("cantidad_promedio"),
+            _cociente("trades_compradores", "total_aggtrades", 100).alias("pct_trades_compradores"),
+        )
+
+        datos_por_simbolo = [
+            {
+                "symbol": data["symbol"],
                 "total_aggtrades": data["total_aggtrades"],
                 "trades_compradores": data["trades_compradores"],
                 "trades_vendedores": data["trades_vendedores"],
-                "pct_trades_compradores": round(pct_trades_compradores, 2),
-                "cantidad_promedio_trade": round(cantidad_promedio, 8)
-            })
+                "pct_trades_compradores": round(data["pct_trades_compradores"], 2),
+                "cantidad_promedio_trade": round(data["cantidad_promedio"], 8)
+            }
+            for data in agrupado.iter_rows(named=True)
+        ]
 
         return {
             "datos_por_simbolo": sorted(datos_por_simbolo, key=lambda x: x["total_aggtrades"], reverse=True)
         }
+
+    @staticmethod
+    async def calcular_resumen(
+        symbol: str = None,
+        fecha_inicio: datetime = None,
+        fecha_fin: datetime = None
+    ) -> Dict[str, Any]:
+        """
+        Los cuatro KPIs con una sola lectura: los parciales del rango se
+        piden una vez y alimentan las cuatro agregaciones.
+        """
+        parciales = await RollupService.parciales(symbol, fecha_inicio, fecha_fin)
+        return KPIService._resumen(parciales)
+
+    @staticmethod
+    def _resumen(parciales: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            "volatilidad": KPIService._volatilidad(parciales),
+            "volumen": KPIService._volumen_trading(parciales),
+            "presion": KPIService._presion_compradora_vendedora(parciales),
+            "aggtrades": KPIService._aggtrades_stats(parciales),
+        }
@@ -0,0 +1,263 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime, timezone
+
+from ..models.mongo_models import Kline
+from ..settings import settings
+
+# modos de KLINE_PARTITIONING → (por símbolo, por mes)
+MODOS = {
+    "none": (False, False),
+    "symbol": (True, False),
+    "month": (False, True),
+    "symbol_month": (True, True),
+}
+
+# mismos índices que `Kline` en cada partición
+INDICES = Kline.Settings.indexes
+
+SEPARADOR = "__"
+CACHE_SEGUNDOS = 60
+# documentos por lote de los cursores de `agregar`
+LOTE_CURSOR = 100_000
+
+_cache: Dict[str, Any] = {"nombres": None, "leido": 0.0}
+_con_indices: set = set()
+
+
+def _mes(fecha: datetime) -> str:
+    return f"{fecha.year:04d}{fecha.month:02d}"
+
+
+def _mes_ms(ms: int) -> str:
+    return _mes(datetime.fromtimestamp(ms / 1000, tz=timezone.utc))
+
+
+class PartitionService:
+    """
+    Enrutado de las velas 1m a colecciones particionadas por símbolo y/o mes
+    (`KLINE_PARTITIONING`). Con "none" todo va a la colección de `Kline`.
+
+    Las particiones se llaman `<colección de Kline>__<SYMBOL>`,
+    `<colección>__<YYYYMM>` o `<colección>__<SYMBOL>__<YYYYMM>`; una consulta
+    por (symbol, rango de open_time) se resuelve a las particiones que
+    pueden tener velas y se reparte entre ellas concurrentemente.
+    """
+
+    @staticmethod
+    def activo() -> bool:
+        return any(MODOS[settings.KLINE_PARTITIONING])
+
+    @staticmethod
+    def nombre(symbol: str, open_time: datetime) -> str:
+        """Partición de una vela."""
+        por_simbolo, por_mes = MODOS[settings.KLINE_PARTITIONING]
+        partes = [Kline.get_collection_name()]
+        if por_simbolo:
+            partes.append(symbol)
+        if por_mes:
+            partes.append(_mes(open_time))
+        return SEPARADOR.join(partes)
+
+    @staticmethod
+    def clave(nombre: str) -> Tuple[Optional[str], Optional[str]]:
+        """(symbol, YYYYMM) de un nombre de partición; None en lo que no particiona."""
+        por_simbolo, por_mes = MODOS[settings.KLINE_PARTITIONING]
+        partes = nombre.split(SEPARADOR)[1:]
+        symbol = partes.pop(0) if por_simbolo else None
+        mes = partes.pop(0) if por_mes else None
+        return symbol, mes
+
+    @staticmethod
+    def coleccion(nombre: str):
+        return Kline.get_pymongo_collection().database[nombre]
+
+    @staticmethod
+    async def existentes(refrescar: bool = False) -> List[str]:
+        """Particiones que existen en la base (cacheadas CACHE_SEGUNDOS)."""
+        if refrescar or _cache["nombres"] is None or time.monotonic() - _cache["leido"] > CACHE_SEGUNDOS:
+            base = Kline.get_collection_name() + SEPARADOR
+            nombres = await Kline.get_pymongo_collection().database.list_collection_names(
+                filter={"name": {"$regex": f"^{base}"}}
+            )
+            _cache["nombres"] = sorted(nombres)
+            _cache["leido"] = time.monotonic()
+        return _cache["nombres"]
+
+    @staticmethod
+    async def asegurar(nombre: str):
+        """Crea los índices de una partición la primera vez que este proceso escribe en ella."""
+        if nombre in _con_indices or nombre == Kline.get_collection_name():
+            return
+        await PartitionService.coleccion(nombre).create_indexes(INDICES)
+        _con_indices.add(nombre)
+        if _cache["nombres"] is not None and nombre not in _cache["nombres"]:
+            _cache["nombres"] = sorted(_cache["nombres"] + [nombre])
+
+    @staticmethod
+    async def particiones(
+        symbol: Optional[str] = None,
+        inicio: Optional[int] = None,
+        fin: Optional[int] = None
+    ) -> List[str]:
+        """Particiones que pueden tener velas de `symbol` con open_time en [inicio, fin) (epoch ms)."""
+        if not PartitionService.activo():
+            return [Kline.get_collection_name()]
+
+        desde = _mes_ms(inicio) if inicio is not None else None
+        hasta = _mes_ms(fin - 1) if fin is not None else None
+        elegidas = []
+        for nombre in await PartitionService.existentes():
+            sym, mes = PartitionService.clave(nombre)
+            if symbol and sym is not None and sym != symbol:
+                continue
+            if mes is not None and ((desde and mes < desde) or (hasta and mes > hasta)):
+                continue
+            elegidas.append(nombre)
+        return elegidas
+
+    @staticmethod
+    async def buscar(
+        query: Dict[str, Any],
+        symbol: Optional[str] = None,
+        inicio: Optional[int] = None,
+        fin: Optional[int] = None,
+        sort: Optional[Tuple[str, int]] = None,
+        skip: int = 0,
+        limit: Optional[int] = None
+    ) -> List[Kline]:
+        """
+        `query` sobre las particiones de (symbol, [inicio, fin)): cada una
+        devuelve sus primeras skip + limit velas y se mezclan en orden.
+        """
+        if not PartitionService.activo():
+            consulta = Kline.find(query)
+            if sort:
+                consulta = consulta.sort(sort)
+            if skip:
+                consulta = consulta.skip(skip)
+            if limit is not None:
+                consulta = consulta.limit(limit)
+            return await consulta.to_list()
+
+        async def _una(nombre: str) -> List[dict]:
+            cursor = PartitionService.coleccion(nombre).find(query)
+            if sort:
+                cursor = cursor.sort(*sort)
+            if limit is not None:
+                cursor = cursor.limit(skip + limit)
+            return await cursor.to_list(None)
+
+        nombres = await PartitionService.particiones(symbol, inicio, fin)
+        docs = [doc for parte in await asyncio.gather(*[_una(n) for n in nombres]) for doc in parte]
+        if sort:
+            docs.sort(key=lambda doc: doc[sort[0]], reverse=sort[1] == -1)
+        docs = docs[skip:skip + limit] if limit is not None else docs[skip:]
+        return [Kline.model_validate(doc) for doc in docs]
+
+    @staticmethod
+    async def contar(
+        query: Dict[str, Any],
+        symbol: Optional[str] = None,
+        inicio: Optional[int] = None,
+        fin: Optional[int] = None
+    ) -> int:
+        if not PartitionService.activo():
+            return await Kline.find(query).count()
+        nombres = await PartitionService.particiones(symbol, inicio, fin)
+        return sum(await asyncio.gather(*[
+            PartitionService.coleccion(nombre).count_documents(query) for nombre in nombres
+        ]))
+
+    @staticmethod
+    async def simbolos() -> List[str]:
+        if not PartitionService.activo():
+            return sorted(s["_id"] for s in await Kline.aggregate([{"$group": {"_id": "$symbol"}}]).to_list())
+        nombres = await PartitionService.particiones()
+        por_simbolo, _ = MODOS[settings.KLINE_PARTITIONING]
+        if por_simbolo:
+            return sorted({PartitionService.clave(nombre)[0] for nombre in nombres})
+        listas = await asyncio.gather(*[PartitionService.coleccion(n).distinct("symbol") for n in nombres])
+        return sorted({symbol for lista in listas for symbol in lista})
+
+    @staticmethod
+    async def agregar(symbol: Optional[str], inicio: Optional[int], fin: Optional[int], pipeline: List[dict]) -> List[dict]:
+        """
+        Ejecuta `pipeline` en cada partición de (symbol, [inicio, fin)) y junta
+        los resultados. Cada cursor se lee entero (getMore en lotes de
+        `LOTE_CURSOR`) y se cierra con killCursors si la lectura falla.
+        """
+        if not PartitionService.activo():
+            return await Kline.aggregate(pipeline).to_list()
+        database = Kline.get_pymongo_collection().database
+
+        async def _una(nombre: str) -> List[dict]:
+            # el primer lote y getMore hasta que el cursor se agota (id 0)
+            cursor = (await database.command(
+                "aggregate", nombre, pipeline=pipeline, cursor={"batchSize": LOTE_CURSOR}
+            ))["cursor"]
+            docs = list(cursor["firstBatch"])
+            try:
+                while cursor["id"]:
+                    cursor = (await database.command(
+                        "getMore", cursor["id"], collection=nombre, batchSize=LOTE_CURSOR
+                    ))["cursor"]
+                    docs.extend(cursor["nextBatch"])
+            except BaseException:
+                if cursor["id"]:
+                    await database.command("killCursors", nombre, cursors=[cursor["id"]])
+                raise
+            return docs
+
+        partes = await asyncio.gather(*[
+            _una(nombre) for nombre in await PartitionService.particiones(symbol, inicio, fin)
+        ])
+        return [doc for parte in partes for doc in parte]
+
+    @staticmethod
+    async def obtener(kline_id: Any) -> Optional[Kline]:
+        """Vela por _id (en modo particionado se busca en todas las particiones)."""
+        if not PartitionService.activo():
+            return await Kline.get(kline_id)
+        docs = await asyncio.gather(*[
+            PartitionService.coleccion(nombre).find_one({"_id": kline_id})
+            for nombre in await PartitionService.particiones()
+        ])
+        encontrados = [doc for doc in docs if doc]
+        return Kline.model_validate(encontrados[0]) if encontrados else None
+
+    @staticmethod
+    async def guardar(kline: Kline, antes: Optional[Tuple[str, datetime]] = None) -> Kline:
+        """
+        Inserta o reemplaza la vela en su partición. Si `antes` (symbol,
+        open_time previos) cae en otra partición, la vela se quita de esa.
+        """
+        if not PartitionService.activo():
+            if kline.id is None:
+                await kline.insert()
+            else:
+                await kline.save()
+            return kline
+
+        nombre = PartitionService.nombre(kline.symbol, kline.open_time)
+        await PartitionService.asegurar(nombre)
+        coleccion = PartitionService.coleccion(nombre)
+        doc = kline.model_dump(by_alias=True, exclude={"id", "revision_id"})
+        if kline.id is None:
+            kline.id = (await coleccion.insert_one(doc)).inserted_id
+        else:
+            await coleccion.replace_one({"_id": kline.id}, doc, upsert=True)
+
+        if antes is not None:
+            anterior = PartitionService.nombre(*antes)
+            if anterior != nombre:
+                await PartitionService.coleccion(anterior).delete_one({"_id": kline.id})
+        return kline
+
+    @staticmethod
+    async def eliminar(kline: Kline):
+        if not PartitionService.activo():
+            await kline.delete()
+            return
+        await PartitionService.coleccion(PartitionService.nombre(kline.symbol, kline.open_time)).delete_one({"_id": kline.id})
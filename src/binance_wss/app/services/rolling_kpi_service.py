@@ -0,0 +1,291 @@
+import asyncio
+import logging
+import math
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import polars as pl
+
+from binance_wss.data import archive
+from ..settings import settings
+from .kpi_cache_service import KPICacheService
+from .kpi_service import KPIService
+from .rollup_service import CAMPOS_VELA, ESQUEMA_PARCIAL, MINUTO_MS, RollupService, ms_a_fecha
+
+logger = logging.getLogger(__name__)
+
+# sumas de un parcial que acumula cada ventana; una vela es (open_ms, high, low, *SUMAS)
+SUMAS = [
+    "volatilidad_suma", "volumen", "volumen_quote", "trades", "volumen_taker_buy",
+    "aggtrades", "aggtrades_compradores", "aggtrades_vendedores", "aggtrades_cantidad",
+]
+ENTERAS = {i for i, campo in enumerate(SUMAS) if ESQUEMA_PARCIAL[campo] == pl.Int64}
+
+# kpi → (KPI a partir de parciales, cálculo sobre Mongo)
+CALCULOS: Dict[str, Tuple[Callable, Callable]] = {
+    "volatilidad": (KPIService._volatilidad, KPIService.calcular_volatilidad),
+    "volumen": (KPIService._volumen_trading, KPIService.calcular_volumen_trading),
+    "presion": (KPIService._presion_compradora_vendedora, KPIService.calcular_presion_compradora_vendedora),
+    "aggtrades": (KPIService._aggtrades_stats, KPIService.calcular_aggtrades_stats),
+    "resumen": (KPIService._resumen, KPIService.calcular_resumen),
+}
+
+# sin sincronizar en tantos polls, las peticiones vuelven a Mongo
+RETRASO_MAXIMO_POLLS = 5
+
+
+def _minuto_actual() -> int:
+    return int(time.time() * 1000) // MINUTO_MS * MINUTO_MS
+
+
+def _velas(frame: pl.DataFrame) -> Dict[str, List[tuple]]:
+    """Velas de un frame (columnas `CAMPOS_VELA`) por símbolo y por open_time, como tuplas."""
+    low, high = pl.col("low_price"), pl.col("high_price")
+    filas = frame.sort("symbol", "open_time").select(
+        "symbol",
+        pl.col("open_time").dt.epoch("ms"),
+        high,
+        low,
+        # volatilidad de cada vela 1m, como en `_parciales_velas`
+        pl.when(low > 0).then((high - low) / low * 100).otherwise(0.0).alias("volatilidad"),
+        "volume",
+        "quote_asset_volume",
+        "number_of_trades",
+        "taker_buy_base_asset_volume",
+        pl.col("aggtrade_count", "aggtrade_buyer_count", "aggtrade_seller_count").fill_null(0),
+        pl.col("aggtrade_quantity").fill_null(0.0),
+    )
+    por_simbolo = defaultdict(list)
+    for symbol, *vela in filas.iter_rows():
+        por_simbolo[symbol].append(tuple(vela))
+    return por_simbolo
+
+
+def _empujar(extremos: Deque[Tuple[int, float]], open_ms: int, valor: float, mayor: bool):
+    # cola monótona: el primero es el extremo de la ventana
+    while extremos and (extremos[-1][1] <= valor if mayor else extremos[-1][1] >= valor):
+        extremos.pop()
+    extremos.append((open_ms, valor))
+
+
+class _Ventana:
+    """Acumuladores de las velas 1m de un símbolo con open_time en [fin - minutos, fin)."""
+
+    def __init__(self, minutos: int):
+        self.ms = minutos * MINUTO_MS
+        self.velas: Deque[tuple] = deque()
+        self.sumas: List[float] = [0] * len(SUMAS)
+        self.maximos: Deque[Tuple[int, float]] = deque()
+        self.minimos: Deque[Tuple[int, float]] = deque()
+        self.volatilidades: Deque[Tuple[int, float]] = deque()
+        self.salidas = 0
+
+    def entrar(self, vela: tuple):
+        open_ms, high, low, *sumas = vela
+        self.velas.append(vela)
+        for i, valor in enumerate(sumas):
+            self.sumas[i] += valor
+        _empujar(self.maximos, open_ms, high, mayor=True)
+        _empujar(self.minimos, open_ms, low, mayor=False)
+        _empujar(self.volatilidades, open_ms, sumas[0], mayor=True)
+
+    def salir(self, limite: int):
+        """Quita las velas con open_time anterior a `limite`."""
+        while self.velas and self.velas[0][0] < limite:
+            _, _, _, *sumas = self.velas.popleft()
+            for i, valor in enumerate(sumas):
+                self.sumas[i] -= valor
+            self.salidas += 1
+        for extremos in (self.maximos, self.minimos, self.volatilidades):
+            while extremos and extremos[0][0] < limite:
+                extremos.popleft()
+
+        # restar floats acumula error: tras renovar la ventana entera se
+        # vuelven a sumar sus velas (coste amortizado constante)
+        if self.salidas and self.salidas >= len(self.velas):
+            self.sumas = [
+                sum(vela[3 + i] for vela in self.velas) if i in ENTERAS
+                else math.fsum(vela[3 + i] for vela in self.velas)
+                for i in range(len(SUMAS))
+            ]
+            self.salidas = 0
+
+    def parcial(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """Parcial de la ventana con las claves de `ESQUEMA_PARCIAL` (None si está vacía)."""
+        if not self.velas:
+            return None
+        return {
+            "symbol": symbol,
+            **dict(zip(SUMAS, self.sumas)),
+            "volatilidad_max": self.volatilidades[0][1],
+            "num_velas": len(self.velas),
+            "high": self.maximos[0][1],
+            "low": self.minimos[0][1],
+        }
+
+
+class _Simbolo:
+    """Ventanas de un símbolo y las velas leídas que aún no entran (open_time >= minuto actual)."""
+
+    def __init__(self, epoch: int, newest: int, minutos: List[int]):
+        self.epoch = epoch
+        self.newest = newest
+        self.pendientes: Deque[tuple] = deque()
+        self.ventanas = {m: _Ventana(m) for m in minutos}
+
+    def avanzar(self, fin: int):
+        while self.pendientes and self.pendientes[0][0] < fin:
+            vela = self.pendientes.popleft()
+            for ventana in self.ventanas.values():
+                ventana.entrar(vela)
+        for ventana in self.ventanas.values():
+            ventana.salir(fin - ventana.ms)
+
+
+_simbolos: Dict[str, _Simbolo] = {}
+_estado: Dict[str, Any] = {"sincronizado": None}
+_metricas = {"in_memory": 0, "fallbacks": 0}
+
+
+class RollingKPIService:
+    """
+    KPIs de los últimos N minutos (velas 1m cerradas hasta el minuto actual)
+    servidos desde memoria, para las ventanas de KPI_ROLLING_WINDOWS_MINUTES.
+
+    Cada símbolo guarda por ventana las sumas de sus velas y colas monótonas
+    para el máximo y el mínimo, así que responder cuesta O(1) por símbolo.
+    La ingesta escribe en otro proceso: `sincronizar` sigue los
+    `DataWatermark` que avanza cada carga y lee de Mongo solo las velas
+    nuevas de cada símbolo: una lectura para los que están al día y una por
+    símbolo para los atrasados. Si sube el `epoch` (se reescribió historia)
+    el símbolo se vuelve a sembrar con la ventana más larga, leyendo cada
+    símbolo por separado.
+
+    Cualquier otra ventana, o si la sincronización se retrasa, se calcula
+    con `KPIService` (vía `KPICacheService`).
+    """
+
+    @staticmethod
+    async def sincronizar():
+        """Aplica las velas escritas desde la última sincronización."""
+        marcas = await KPICacheService.marcas(refrescar=True)
+        minutos = sorted(set(settings.KPI_ROLLING_WINDOWS_MINUTES))
+        fin = _minuto_actual()
+        desde = fin - minutos[-1] * MINUTO_MS
+
+        for symbol in set(_simbolos) - set(marcas):
+            del _simbolos[symbol]
+        sembrar = {
+            symbol: marca for symbol, marca in marcas.items()
+            if symbol not in _simbolos or _simbolos[symbol].epoch != marca[0]
+        }
+        nuevas = {
+            symbol: marca for symbol, marca in marcas.items()
+            if symbol not in sembrar and marca[1] > _simbolos[symbol].newest
+        }
+
+        # un símbolo por lectura (a lo sumo KPI_ROLLING_SEED_CONCURRENCY a la
+        # vez) al sembrar o ponerse al día: la ventana más larga de todos los
+        # símbolos no cabe en una
+        sem = asyncio.Semaphore(settings.KPI_ROLLING_SEED_CONCURRENCY)
+
+        if sembrar:
+            async def _sembrar(symbol: str, epoch: int, newest: int):
+                estado = _Simbolo(epoch, newest, minutos)
+                hasta = newest + MINUTO_MS
+                if hasta > desde:
+                    async with sem:
+                        frias = await asyncio.to_thread(archive.read_kline_frame, symbol, desde, hasta, CAMPOS_VELA)
+                        velas = _velas(await RollupService.velas_1m(symbol, desde, hasta, frias))
+                    estado.pendientes.extend(velas.get(symbol, []))
+                _simbolos[symbol] = estado
+
+            await asyncio.gather(*[_sembrar(symbol, *marca) for symbol, marca in sembrar.items()])
+
+        if nuevas:
+            # las velas nuevas nunca están en la capa fría. Los símbolos al día
+            # comparten una lectura desde su primera vela pendiente; los que van
+            # atrasados leen cada uno la suya, para no arrastrar a los demás
+            inicios = {symbol: max(desde, _simbolos[symbol].newest + MINUTO_MS) for symbol in nuevas}
+            reciente = max(inicios.values())
+            juntos = [symbol for symbol, inicio in inicios.items() if inicio == reciente]
+            lecturas = [(juntos[0] if len(juntos) == 1 else None, juntos, reciente)]
+            lecturas += [(symbol, [symbol], inicio) for symbol, inicio in inicios.items() if inicio < reciente]
+
+            async def _ponerse_al_dia(filtro: Optional[str], symbols: List[str], inicio: int):
+                hasta = max(nuevas[symbol][1] for symbol in symbols) + MINUTO_MS
+                velas = {}
+                if hasta > inicio:
+                    async with sem:
+                        velas = _velas(await RollupService.velas_1m(filtro, inicio, hasta))
+                for symbol in symbols:
+                    estado, newest = _simbolos[symbol], nuevas[symbol][1]
+                    estado.pendientes.extend(vela for vela in velas.get(symbol, []) if estado.newest < vela[0] <= newest)
+                    estado.newest = newest
+
+            await asyncio.gather(*[_ponerse_al_dia(*lectura) for lectura in lecturas])
+
+        for estado in _simbolos.values():
+            estado.avanzar(fin)
+        _estado["sincronizado"] = time.monotonic()
+
+    @staticmethod
+    async def ejecutar():
+        """Sincroniza cada KPI_CACHE_WATERMARK_POLL_SECONDS hasta que se cancela (lifespan de la API)."""
+        while True:
+            try:
+                await RollingKPIService.sincronizar()
+            except Exception:
+                logger.exception("Error sincronizando los KPIs en memoria")
+            await asyncio.sleep(settings.KPI_CACHE_WATERMARK_POLL_SECONDS)
+
+    @staticmethod
+    def al_dia() -> bool:
+        sincronizado = _estado["sincronizado"]
+        retraso_maximo = RETRASO_MAXIMO_POLLS * settings.KPI_CACHE_WATERMARK_POLL_SECONDS
+        return sincronizado is not None and time.monotonic() - sincronizado <= retraso_maximo
+
+    @staticmethod
+    def parciales(symbol: Optional[str], minutos: int, fin: int) -> List[Dict[str, Any]]:
+        """Un parcial por símbolo con velas en la ventana de `minutos` que termina en `fin`."""
+        parciales = []
+        for sym in [symbol] if symbol else sorted(_simbolos):
+            estado = _simbolos.get(sym)
+            if estado is None:
+                continue
+            estado.avanzar(fin)
+            parcial = estado.ventanas[minutos].parcial(sym)
+            if parcial is not None:
+                parciales.append(parcial)
+        return parciales
+
+    @staticmethod
+    async def obtener(kpi: str, symbol: Optional[str], minutos: int) -> Dict[str, Any]:
+        """`kpi` de las velas 1m de los últimos `minutos`, con la misma forma que `KPIService`."""
+        desde_parciales, calcular = CALCULOS[kpi]
+        fin = _minuto_actual()
+        en_memoria = (
+            settings.KPI_ROLLING_ENABLED
+            and minutos in settings.KPI_ROLLING_WINDOWS_MINUTES
+            and RollingKPIService.al_dia()
+        )
+        if en_memoria:
+            _metricas["in_memory"] += 1
+            return desde_parciales(RollingKPIService.parciales(symbol, minutos, fin))
+
+        _metricas["fallbacks"] += 1
+        # [fin - minutos, fin): la última vela abre en fin - 1 minuto
+        return await KPICacheService.obtener(
+            kpi, calcular, symbol, ms_a_fecha(fin - minutos * MINUTO_MS), ms_a_fecha(fin - MINUTO_MS)
+        )
+
+    @staticmethod
+    def metricas() -> Dict[str, Any]:
+        return {
+            **_metricas,
+            "enabled": settings.KPI_ROLLING_ENABLED,
+            "windows_minutes": sorted(set(settings.KPI_ROLLING_WINDOWS_MINUTES)),
+            "symbols": len(_simbolos),
+            "up_to_date": RollingKPIService.al_dia(),
+        }
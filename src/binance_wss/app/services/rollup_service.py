@@ -0,0 +1,268 @@
+import asyncio
+from typing import Dict, Any, List, Optional, Tuple, Type
+from datetime import datetime, timedelta, timezone
+import polars as pl
+from beanie import Document
+from ..models.mongo_models import Kline, KlineRollup1d, KlineRollup1h, KlineRollup5m, KlineRollup15m
+from .partition_service import PartitionService
+from binance_wss.data import archive
+
+MINUTO_MS = 60_000
+
+# de más gruesa a más fina: intervalo → (colección, tamaño del bucket en ms)
+ROLLUPS: Dict[str, tuple] = {
+    "1d": (KlineRollup1d, 86_400_000),
+    "1h": (KlineRollup1h, 3_600_000),
+    "15m": (KlineRollup15m, 900_000),
+    "5m": (KlineRollup5m, 300_000),
+}
+
+
+def fecha_a_ms(fecha: datetime) -> int:
+    # las fechas sin zona se interpretan en UTC, igual que las guarda Mongo
+    if fecha.tzinfo is None:
+        fecha = fecha.replace(tzinfo=timezone.utc)
+    return int(fecha.timestamp() * 1000)
+
+
+def ms_a_fecha(ms: int) -> datetime:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
+
+
+# columnas de las velas 1m que leen los KPIs (los aggTrades vienen como parciales)
+CAMPOS_VELA = [
+    "symbol", "open_time", "high_price", "low_price", "volume", "quote_asset_volume",
+    "number_of_trades", "taker_buy_base_asset_volume", "aggtrade_count",
+    "aggtrade_buyer_count", "aggtrade_seller_count", "aggtrade_quantity",
+]
+
+ESQUEMA_VELA = {campo: ({"symbol": pl.Utf8} | archive.KLINE_ARCHIVE_SCHEMA)[campo] for campo in CAMPOS_VELA}
+
+# claves de un parcial y su tipo en Polars
+ESQUEMA_PARCIAL = {
+    "symbol": pl.Utf8,
+    "volatilidad_suma": pl.Float64,
+    "volatilidad_max": pl.Float64,
+    "num_velas": pl.Int64,
+    "high": pl.Float64,
+    "low": pl.Float64,
+    "volumen": pl.Float64,
+    "volumen_quote": pl.Float64,
+    "trades": pl.Int64,
+    "volumen_taker_buy": pl.Float64,
+    "aggtrades": pl.Int64,
+    "aggtrades_compradores": pl.Int64,
+    "aggtrades_vendedores": pl.Int64,
+    "aggtrades_cantidad": pl.Float64,
+}
+
+
+def _parciales_velas(velas: pl.DataFrame) -> List[Dict[str, Any]]:
+    """Parciales por símbolo de un frame de velas 1m (columnas `CAMPOS_VELA`)."""
+    low, high = pl.col("low_price"), pl.col("high_price")
+    volatilidad = pl.when(low > 0).then((high - low) / low * 100).otherwise(0.0)
+    return velas.group_by("symbol", maintain_order=True).agg(
+        volatilidad.sum().alias("volatilidad_suma"),
+        volatilidad.max().alias("volatilidad_max"),
+        pl.len().cast(pl.Int64).alias("num_velas"),
+        high.max().alias("high"),
+        low.min().alias("low"),
+        pl.col("volume").sum().alias("volumen"),
+        pl.col("quote_asset_volume").sum().alias("volumen_quote"),
+        pl.col("number_of_trades").sum().alias("trades"),
+        pl.col("taker_buy_base_asset_volume").sum().alias("volumen_taker_buy"),
+        pl.col("aggtrade_count").fill_null(0).sum().alias("aggtrades"),
+        pl.col("aggtrade_buyer_count").fill_null(0).sum().alias("aggtrades_compradores"),
+        pl.col("aggtrade_seller_count").fill_null(0).sum().alias("aggtrades_vendedores"),
+        pl.col("aggtrade_quantity").fill_null(0.0).sum().alias("aggtrades_cantidad"),
+    ).to_dicts()
+
+
+def _pipeline_parciales(interval: Optional[str], query: Dict[str, Any]) -> List[dict]:
+    """
+    $match → $group por símbolo → $project: un parcial por símbolo con las
+    claves de `ESQUEMA_PARCIAL`, calculado en Mongo.
+    """
+    if interval is None:
+        # volatilidad de cada vela 1m, como en `_parciales_velas`
+        volatilidad = {"$cond": [
+            {"$gt": ["$low_price", 0]},
+            {"$multiply": [{"$divide": [{"$subtract": ["$high_price", "$low_price"]}, "$low_price"]}, 100]},
+            0,
+        ]}
+        suma, maximo, velas = volatilidad, volatilidad, 1
+    else:
+        suma, maximo, velas = "$volatility_sum", "$volatility_max", "$kline_count"
+
+    grupo = {
+        "volatilidad_suma": {"$sum": suma},
+        "volatilidad_max": {"$max": maximo},
+        "num_velas": {"$sum": velas},
+        "high": {"$max": "$high_price"},
+        "low": {"$min": "$low_price"},
+        "volumen": {"$sum": "$volume"},
+        "volumen_quote": {"$sum": "$quote_asset_volume"},
+        "trades": {"$sum": "$number_of_trades"},
+        "volumen_taker_buy": {"$sum": "$taker_buy_base_asset_volume"},
+        "aggtrades": {"$sum": "$aggtrade_count"},
+        "aggtrades_compradores": {"$sum": "$aggtrade_buyer_count"},
+        "aggtrades_vendedores": {"$sum": "$aggtrade_seller_count"},
+        "aggtrades_cantidad": {"$sum": "$aggtrade_quantity"},
+    }
+    return [
+        {"$match": query},
+        {"$group": {"_id": "$symbol", **grupo}},
+        {"$project": {"_id": 0, "symbol": "$_id", **{campo: 1 for campo in grupo}}},
+    ]
+
+
+class RollupService:
+    """Selección de las colecciones de velas (1m o rollups) que responden una consulta"""
+
+    @staticmethod
+    def tramos(
+        inicio: Optional[int],
+        fin: Optional[int],
+        niveles: Optional[List[str]] = None
+    ) -> List[Tuple[Optional[str], Optional[int], Optional[int]]]:
+        """
+        Descompone las velas 1m con open_time en [inicio, fin) (epoch ms, None
+        sin límite) en tramos (intervalo, inicio, fin): el centro alineado se
+        lee del rollup más grueso y los bordes de los más finos, hasta las
+        velas 1m (intervalo None).
+        """
+        niveles = list(ROLLUPS) if niveles is None else niveles
+        if not niveles:
+            return [(None, inicio, fin)]
+
+        interval, resto = niveles[0], niveles[1:]
+        bucket_ms = ROLLUPS[interval][1]
+        centro_inicio = None if inicio is None else -(-inicio // bucket_ms) * bucket_ms
+        centro_fin = None if fin is None else fin // bucket_ms * bucket_ms
+        if centro_inicio is not None and centro_fin is not None and centro_inicio >= centro_fin:
+            return RollupService.tramos(inicio, fin, resto)
+
+        tramos = []
+        if inicio is not None and inicio < centro_inicio:
+            tramos += RollupService.tramos(inicio, centro_inicio, resto)
+        tramos.append((interval, centro_inicio, centro_fin))
+        if fin is not None and centro_fin < fin:
+            tramos += RollupService.tramos(centro_fin, fin, resto)
+        return tramos
+
+    @staticmethod
+    def rango_minutos(
+        fecha_inicio: Optional[datetime],
+        fecha_fin: Optional[datetime]
+    ) -> Tuple[Optional[int], Optional[int]]:
+        """
+        [inicio, fin) en epoch ms de las velas 1m con open_time en
+        [fecha_inicio, fecha_fin]: dos rangos que dan el mismo resultado
+        dan el mismo par.
+        """
+        # primera vela: fecha_inicio redondeada al minuto hacia arriba;
+        # última: la que abre en fecha_fin redondeada hacia abajo
+        inicio = None if fecha_inicio is None else -(-fecha_a_ms(fecha_inicio) // MINUTO_MS) * MINUTO_MS
+        fin = None if fecha_fin is None else fecha_a_ms(fecha_fin) // MINUTO_MS * MINUTO_MS + MINUTO_MS
+        return inicio, fin
+
+    @staticmethod
+    def coleccion(interval: Optional[str]) -> Type[Document]:
+        """Documento de velas de un intervalo: `Kline` para 1m, el rollup para el resto."""
+        if interval in ROLLUPS:
+            return ROLLUPS[interval][0]
+        return Kline
+
+    @staticmethod
+    def bucket(interval: Optional[str]) -> timedelta:
+        """Duración de una vela del intervalo (1m si no es un rollup)."""
+        return timedelta(milliseconds=ROLLUPS[interval][1] if interval in ROLLUPS else MINUTO_MS)
+
+    @staticmethod
+    def consulta(
+        symbol: Optional[str],
+        inicio: Optional[int],
+        fin: Optional[int]
+    ) -> Dict[str, Any]:
+        """Filtro por symbol y open_time en [inicio, fin) con límites en epoch ms."""
+        query: Dict[str, Any] = {}
+        if symbol:
+            query["symbol"] = symbol
+        if inicio is not None or fin is not None:
+            query["open_time"] = {}
+            if inicio is not None:
+                query["open_time"]["$gte"] = ms_a_fecha(inicio)
+            if fin is not None:
+                query["open_time"]["$lt"] = ms_a_fecha(fin)
+        return query
+
+    @staticmethod
+    async def parciales_tramo(
+        interval: Optional[str],
+        symbol: Optional[str],
+        inicio: Optional[int],
+        fin: Optional[int]
+    ) -> List[Dict[str, Any]]:
+        """
+        Parciales de un tramo agregados en Mongo (uno por símbolo y colección).
+        Si el tramo de velas 1m tiene velas en la capa fría, las de Mongo se
+        leen con solo `CAMPOS_VELA`, se quitan de la capa fría las que estén
+        en ambas (archivado a medias; gana Mongo) y se agregan con Polars.
+        """
+        query = RollupService.consulta(symbol, inicio, fin)
+        pipeline = _pipeline_parciales(interval, query)
+        if interval is not None:
+            return await RollupService.coleccion(interval).aggregate(pipeline).to_list()
+
+        calientes, frias = await asyncio.gather(
+            PartitionService.agregar(symbol, inicio, fin, pipeline),
+            asyncio.to_thread(archive.read_kline_frame, symbol, inicio, fin, CAMPOS_VELA),
+        )
+        if frias.is_empty():
+            return calientes
+        return _parciales_velas(await RollupService.velas_1m(symbol, inicio, fin, frias))
+
+    @staticmethod
+    async def velas_1m(
+        symbol: Optional[str],
+        inicio: Optional[int],
+        fin: Optional[int],
+        frias: Optional[pl.DataFrame] = None
+    ) -> pl.DataFrame:
+        """
+        Velas 1m de (symbol, [inicio, fin)) en Mongo con solo `CAMPOS_VELA`,
+        más las de `frias` (de la capa fría) que no están en Mongo.
+        """
+        query = RollupService.consulta(symbol, inicio, fin)
+        proyeccion = {"_id": 0, **{campo: 1 for campo in CAMPOS_VELA}}
+        filas = await PartitionService.agregar(symbol, inicio, fin, [{"$match": query}, {"$project": proyeccion}])
+        mongo = pl.from_dicts(filas, schema=ESQUEMA_VELA) if filas else pl.DataFrame(schema=ESQUEMA_VELA)
+        if frias is None:
+            return mongo
+        solo_frias = frias.join(mongo.select("symbol", "open_time"), on=["symbol", "open_time"], how="anti")
+        return pl.concat([mongo, solo_frias])
+
+    @staticmethod
+    async def parciales(
+        symbol: Optional[str] = None,
+        fecha_inicio: Optional[datetime] = None,
+        fecha_fin: Optional[datetime] = None
+    ) -> list:
+        """
+        Parciales combinables de las velas 1m con open_time en [fecha_inicio,
+        fecha_fin], agregados en Mongo por símbolo en cada tramo de los
+        rollups que cubren el rango (ver `tramos`) y de las velas 1m de los
+        bordes, en Mongo o en la capa fría de Parquet (los rollups no se
+        archivan). Cada parcial trae symbol, suma/máximo de volatilidad,
+        número de velas 1m, máximo y mínimo de precio, volúmenes, trades,
+        volumen taker buy y conteos/cantidad de aggTrades.
+        """
+        inicio, fin = RollupService.rango_minutos(fecha_inicio, fecha_fin)
+        if inicio is not None and fin is not None and inicio >= fin:
+            return []
+
+        resultados = await asyncio.gather(*[
+            RollupService.parciales_tramo(interval, symbol, desde, hasta)
+            for interval, desde, hasta in RollupService.tramos(inicio, fin)
+        ])
+        return [parcial for parciales in resultados for parcial in parciales]
@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pathlib import Path
+from typing import Literal
 
 BASE_DIR = Path(__file__).resolve().parents[3]
 
@@ -7,10 +8,63 @@ class Settings(BaseSettings):
     BINANCE_API_KEY: str
     BINANCE_API_SECRET_KEY: str
     BINANCE_API_BASE_URL: str
+    BINANCE_WS_BASE_URL: str = "wss://stream.binance.com:9443"
+    BINANCE_WEIGHT_LIMIT: int = 6000
+
+    # Universo de símbolos: lista fija o todos los pares TRADING de exchangeInfo
+    BINANCE_SYMBOLS: list[str] = ["BTCUSDT", "ETHUSDT", "BNBUSDT"]
+    BINANCE_SYMBOLS_FROM_EXCHANGE_INFO: bool = False
+    BINANCE_SYMBOLS_QUOTE_ASSET: str = "USDT"
+
+    EXTRACT_KLINE_LIMIT: int = 60
+    EXTRACT_WORKERS: int = 4
+    EXTRACT_MAX_CONCURRENCY: int = 10
+
+    # Staging columnar entre tasks (local o compartido entre workers)
+    ETL_STAGING_DIR: str = "/tmp/binance_wss/staging"
+    ETL_STAGING_FORMAT: str = "ipc"  # "ipc" (Arrow) o "parquet"
+
+    # Carga: upserts por lotes, varios lotes en vuelo
+    LOAD_BATCH_SIZE: int = 1000
+    LOAD_PARALLEL_BATCHES: int = 4
+    # Frame → BSON sin validar fila a fila con pydantic (opt-in)
+    LOAD_FAST_PATH: bool = False
+
+    # Reintentos por lote ante errores de red (backoff exponencial)
+    LOAD_RETRIES: int = 3
+    LOAD_RETRY_BACKOFF_SECONDS: float = 0.5
+
+    # Spool local del load cuando Mongo no responde
+    SPOOL_DIR: str = str(BASE_DIR / "spool")
+    SPOOL_DRAIN_BATCH_ROWS: int = 50_000
+
+    # Capa fría: días completos más antiguos que ARCHIVE_AFTER_DAYS pasan a Parquet
+    ARCHIVE_DIR: str = str(BASE_DIR / "archive")
+    ARCHIVE_AFTER_DAYS: int = 30
+
+    # Velas 1m en una colección ("none") o particionadas: "symbol", "month", "symbol_month"
+    KLINE_PARTITIONING: Literal["none", "symbol", "month", "symbol_month"] = "none"
+
+    # Caché LRU de KPIs en la API, invalidada por los data watermarks del loader
+    KPI_CACHE_ENABLED: bool = True
+    KPI_CACHE_MAX_ENTRIES: int = 1024
+    KPI_CACHE_WATERMARK_POLL_SECONDS: float = 2.0
+
+    # KPIs de los últimos N minutos en memoria (N en KPI_ROLLING_WINDOWS_MINUTES)
+    KPI_ROLLING_ENABLED: bool = True
+    KPI_ROLLING_WINDOWS_MINUTES: list[int] = [5, 15, 60, 240, 1440]
+    # símbolos que se siembran o se ponen al día a la vez (una lectura por símbolo)
+    KPI_ROLLING_SEED_CONCURRENCY: int = 4
 
     MONGODB_URI: str
     MONGODB_DB_NAME: str
     MONGODB_COLLECTION_NAME: str
+    # Pool del cliente: al menos LOAD_PARALLEL_BATCHES conexiones para los lotes en vuelo
+    MONGODB_MAX_POOL_SIZE: int = 10
+    MONGODB_MIN_POOL_SIZE: int = 1
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS: int = 5000
+    MONGODB_CONNECT_TIMEOUT_MS: int = 10000
+    MONGODB_SOCKET_TIMEOUT_MS: int = 60000
 
     model_config = SettingsConfigDict(
         env_file=str(BASE_DIR / ".env"),
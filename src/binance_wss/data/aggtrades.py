@@ -0,0 +1,178 @@
+"""
+Carga de aggTrades en la colección time-series `aggtrades`.
+
+Las colecciones time-series no admiten índices únicos, así que la carga es
+idempotente comprobando antes qué `agg_trade_id` ya existen en el rango
+(symbol, timestamp) de cada lote e insertando solo los nuevos. Eso mismo
+hace que un lote se pueda reintentar entero tras un error de red.
+"""
+import asyncio
+import logging
+import time
+
+import polars as pl
+
+from binance_wss.app.models.mongo_models import AggTradeEvent
+from binance_wss.app.services.partition_service import PartitionService
+from binance_wss.app.settings import settings
+from binance_wss.data.upsert import with_retry
+
+logger = logging.getLogger(__name__)
+
+AGGTRADE_FIELDS = [
+    "agg_trade_id", "price", "quantity", "first_trade_id",
+    "last_trade_id", "timestamp", "is_buyer_maker", "is_best_match",
+]
+
+
+def split_aggtrades(frame: pl.DataFrame) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    Separa un frame de velas con `aggtrades` anidados en (velas sin la
+    columna, trades planos con su `symbol`).
+    """
+    if "aggtrades" not in frame.columns:
+        return frame, pl.DataFrame()
+
+    trades = (
+        frame.select("symbol", "aggtrades")
+        .explode("aggtrades")
+        .drop_nulls("aggtrades")
+        .unnest("aggtrades")
+    )
+    return frame.drop("aggtrades"), trades
+
+
+def trade_partials(trades: list[dict]) -> dict:
+    """Parciales de aggTrades de una vela; compradores = taker buy (is_buyer_maker = false)."""
+    buyers = sum(1 for trade in trades if not trade["is_buyer_maker"])
+    return {
+        "aggtrade_count": len(trades),
+        "aggtrade_buyer_count": buyers,
+        "aggtrade_seller_count": len(trades) - buyers,
+        "aggtrade_quantity": float(sum(trade["quantity"] for trade in trades)),
+    }
+
+
+def trade_partial_exprs(column: str = "aggtrades") -> list[pl.Expr]:
+    """Mismos parciales que `trade_partials`, sobre una columna list[struct]."""
+    trades = pl.col(column)
+    buyers = trades.list.eval((~pl.element().struct.field("is_buyer_maker")).cast(pl.Int64)).list.sum()
+    return [
+        trades.list.len().cast(pl.Int64).alias("aggtrade_count"),
+        buyers.alias("aggtrade_buyer_count"),
+        (trades.list.len().cast(pl.Int64) - buyers).alias("aggtrade_seller_count"),
+        trades.list.eval(pl.element().struct.field("quantity")).list.sum().cast(pl.Float64).alias("aggtrade_quantity"),
+    ]
+
+
+def explode_rows(rows: list[dict]) -> list[dict]:
+    """Versión por filas de `split_aggtrades`: saca los trades de cada vela (in place)."""
+    trades = []
+    for row in rows:
+        for trade in row.pop("aggtrades", None) or []:
+            trades.append({"symbol": row["symbol"], **trade})
+    return trades
+
+
+async def recount_partials(symbol: str | None = None):
+    """
+    Recalcula en el servidor los parciales de aggTrades de las velas 1m a
+    partir de la colección `aggtrades` ($merge sobre la clave de `Kline`).
+    """
+    match = {"symbol": symbol} if symbol else {}
+    ts_ms = {"$toLong": "$timestamp"}
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "symbol": "$symbol",
+                "open_time": {"$toDate": {"$subtract": [ts_ms, {"$mod": [ts_ms, 60_000]}]}},
+            },
+            "aggtrade_count": {"$sum": 1},
+            "aggtrade_buyer_count": {"$sum": {"$cond": ["$is_buyer_maker", 0, 1]}},
+            "aggtrade_seller_count": {"$sum": {"$cond": ["$is_buyer_maker", 1, 0]}},
+            "aggtrade_quantity": {"$sum": "$quantity"},
+        }},
+        {"$project": {
+            "_id": 0,
+            "symbol": "$_id.symbol",
+            "interval": {"$literal": "1m"},
+            "open_time": "$_id.open_time",
+            "aggtrade_count": 1,
+            "aggtrade_buyer_count": 1,
+            "aggtrade_seller_count": 1,
+            "aggtrade_quantity": 1,
+        }},
+    ]
+    for partition in await PartitionService.particiones(symbol):
+        await AggTradeEvent.aggregate(pipeline + [{"$merge": {
+            "into": partition,
+            "on": ["symbol", "interval", "open_time"],
+            "whenMatched": "merge",
+            "whenNotMatched": "discard",
+        }}]).to_list()
+
+
+async def _load_batch(collection, symbol: str, docs: list[dict]) -> int:
+    start = min(doc["timestamp"] for doc in docs)
+    end = max(doc["timestamp"] for doc in docs)
+    existing = set(await collection.distinct(
+        "agg_trade_id",
+        {"symbol": symbol, "timestamp": {"$gte": start, "$lte": end}},
+    ))
+
+    new = [doc for doc in docs if doc["agg_trade_id"] not in existing]
+    if new:
+        await collection.insert_many(new, ordered=False)
+    return len(new)
+
+
+async def load_aggtrades(trades: pl.DataFrame | list[dict], batch_size: int | None = None) -> dict:
+    """
+    Inserta los trades que aún no están en `aggtrades`, una vez por
+    (symbol, agg_trade_id) aunque se repitan en `trades`. Devuelve
+    {"docs", "inserted", "skipped", "seconds", "docs_per_sec"}.
+    """
+    docs = trades.to_dicts() if isinstance(trades, pl.DataFrame) else trades
+    batch_size = batch_size or settings.LOAD_BATCH_SIZE
+    sem = asyncio.Semaphore(settings.LOAD_PARALLEL_BATCHES)
+    collection = AggTradeEvent.get_pymongo_collection()
+
+    # un trade repetido en `docs` (p. ej. registros del spool que se solapan)
+    # no está aún en Mongo al consultar los existentes: se queda uno por id
+    by_symbol: dict[str, dict[int, dict]] = {}
+    for doc in docs:
+        by_symbol.setdefault(doc["symbol"], {})[doc["agg_trade_id"]] = {
+            "symbol": doc["symbol"], **{field: doc[field] for field in AGGTRADE_FIELDS}
+        }
+
+    # lotes por símbolo en orden de timestamp: rangos disjuntos, cada uno
+    # con su propia consulta de ids existentes y su propio reintento
+    async def _write(symbol: str, batch: list[dict]) -> int:
+        async with sem:
+            return await with_retry(
+                lambda: _load_batch(collection, symbol, batch),
+                f"aggtrades {symbol} batch",
+            )
+
+    batches = []
+    for symbol, unique_docs in by_symbol.items():
+        symbol_docs = sorted(unique_docs.values(), key=lambda doc: doc["timestamp"])
+        batches += [(symbol, symbol_docs[i:i + batch_size]) for i in range(0, len(symbol_docs), batch_size)]
+
+    t0 = time.perf_counter()
+    inserted = await asyncio.gather(*[_write(symbol, batch) for symbol, batch in batches])
+    elapsed = time.perf_counter() - t0
+
+    report = {
+        "docs": len(docs),
+        "inserted": sum(inserted),
+        "skipped": len(docs) - sum(inserted),
+        "seconds": round(elapsed, 3),
+        "docs_per_sec": round(len(docs) / elapsed, 1) if elapsed else 0.0,
+    }
+    logger.info(
+        "aggtrades: %d inserted, %d already present in %.2fs",
+        report["inserted"], report["skipped"], elapsed,
+    )
+    return report
@@ -0,0 +1,253 @@
+"""
+Capa fría en Parquet para las velas 1m y los aggTrades antiguos.
+
+El archivador mueve los días completos más antiguos que
+`ARCHIVE_AFTER_DAYS` a archivos Parquet en disco local, particionados por
+símbolo y fecha (estilo hive), y después los borra de Mongo:
+
+    ARCHIVE_DIR/klines/symbol=BTCUSDT/date=2025-01-01/data.parquet
+    ARCHIVE_DIR/aggtrades/symbol=BTCUSDT/date=2025-01-01/data.parquet
+
+Cada partición se escribe primero (fusionándola con la existente si el día
+ya se había archivado en parte) y solo entonces se borra de Mongo, así que
+si el proceso se cae basta con relanzarlo. Los rollups se quedan en Mongo:
+sus buckets nunca cruzan un día, así que siguen respondiendo los KPIs de
+los días archivados.
+
+La lectura (`read_klines`, `read_kline_frame`, `read_trades`) usa `scan_parquet` con los
+filtros de symbol/fecha empujados al escaneo: solo se abren las
+particiones del rango.
+
+Uso:
+    python -m binance_wss.data.archive run [SYMBOL ...] [--older-than-days 30]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+import polars as pl
+
+from binance_wss.app.db import get_db
+from binance_wss.app.models.mongo_models import AggTradeEvent, Kline
+from binance_wss.app.services.partition_service import PartitionService
+from binance_wss.app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+DAY_MS = 86_400_000
+
+# columnas guardadas en cada partición (symbol y date salen de la ruta)
+KLINE_ARCHIVE_SCHEMA = {
+    "interval": pl.Utf8,
+    "open_time": pl.Datetime("ms"),
+    "close_time": pl.Datetime("ms"),
+    "open_price": pl.Float64,
+    "close_price": pl.Float64,
+    "high_price": pl.Float64,
+    "low_price": pl.Float64,
+    "volume": pl.Float64,
+    "quote_asset_volume": pl.Float64,
+    "number_of_trades": pl.Int64,
+    "taker_buy_base_asset_volume": pl.Float64,
+    "taker_buy_quote_asset_volume": pl.Float64,
+    "aggtrade_count": pl.Int64,
+    "aggtrade_buyer_count": pl.Int64,
+    "aggtrade_seller_count": pl.Int64,
+    "aggtrade_quantity": pl.Float64,
+}
+
+AGGTRADE_ARCHIVE_SCHEMA = {
+    "agg_trade_id": pl.Int64,
+    "price": pl.Float64,
+    "quantity": pl.Float64,
+    "first_trade_id": pl.Int64,
+    "last_trade_id": pl.Int64,
+    "timestamp": pl.Datetime("ms"),
+    "is_buyer_maker": pl.Boolean,
+    "is_best_match": pl.Boolean,
+}
+
+DATASETS = {
+    "klines": (KLINE_ARCHIVE_SCHEMA, "open_time"),
+    "aggtrades": (AGGTRADE_ARCHIVE_SCHEMA, "agg_trade_id"),
+}
+
+
+def _ms_to_naive(ms: int) -> datetime:
+    # Mongo devuelve fechas UTC sin zona: la capa fría usa la misma convención
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).replace(tzinfo=None)
+
+
+def partition_path(dataset: str, symbol: str, day: date) -> Path:
+    return Path(settings.ARCHIVE_DIR) / dataset / f"symbol={symbol}" / f"date={day.isoformat()}" / "data.parquet"
+
+
+def write_partition(dataset: str, symbol: str, day: date, docs: list[dict]) -> int:
+    """
+    Escribe (o amplía) la partición de un día. Las filas nuevas reemplazan
+    a las ya archivadas con la misma clave. Escritura atómica vía rename.
+    """
+    schema, key = DATASETS[dataset]
+    frame = pl.from_dicts(docs, schema=schema) if docs else pl.DataFrame(schema=schema)
+    if dataset == "klines":
+        # velas cargadas antes de tener parciales de aggTrades
+        frame = frame.with_columns(
+            pl.col("aggtrade_count", "aggtrade_buyer_count", "aggtrade_seller_count").fill_null(0),
+            pl.col("aggtrade_quantity").fill_null(0.0),
+        )
+
+    path = partition_path(dataset, symbol, day)
+    if path.exists():
+        frame = pl.concat([pl.read_parquet(path), frame]).unique(key, keep="last")
+    frame = frame.sort(key)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".parquet.tmp")
+    frame.write_parquet(tmp)
+    os.replace(tmp, path)
+    return frame.height
+
+
+async def archive_day(symbol: str, day: date) -> dict:
+    """Archiva las velas 1m y los aggTrades de un símbolo en un día y los borra de Mongo."""
+    start = datetime(day.year, day.month, day.day)
+    end = start + timedelta(days=1)
+    klines = PartitionService.coleccion(PartitionService.nombre(symbol, start))
+    trades = AggTradeEvent.get_pymongo_collection()
+
+    kline_query = {"symbol": symbol, "interval": "1m", "open_time": {"$gte": start, "$lt": end}}
+    trade_query = {"symbol": symbol, "timestamp": {"$gte": start, "$lt": end}}
+    kline_docs = await klines.find(kline_query, {field: 1 for field in KLINE_ARCHIVE_SCHEMA} | {"_id": 0}).to_list(None)
+    trade_docs = await trades.find(trade_query, {field: 1 for field in AGGTRADE_ARCHIVE_SCHEMA} | {"_id": 0}).to_list(None)
+
+    await asyncio.to_thread(write_partition, "klines", symbol, day, kline_docs)
+    if trade_docs:
+        await asyncio.to_thread(write_partition, "aggtrades", symbol, day, trade_docs)
+
+    # solo se borra lo que ya está en disco
+    await klines.delete_many(kline_query)
+    if trade_docs:
+        await trades.delete_many(trade_query)
+    return {"klines": len(kline_docs), "aggtrades": len(trade_docs)}
+
+
+async def archive(symbols: list[str] | None = None, older_than_days: int | None = None) -> dict:
+    """Archiva los días completos anteriores a hoy (UTC) menos `older_than_days`."""
+    await get_db()
+    days = settings.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    today = datetime.now(timezone.utc).date()
+    cutoff_ms = (today - date(1970, 1, 1)).days * DAY_MS - days * DAY_MS
+    cutoff = _ms_to_naive(cutoff_ms)
+
+    match = {"interval": "1m", "open_time": {"$lt": cutoff}}
+    if symbols:
+        match["symbol"] = {"$in": symbols}
+    open_ms = {"$toLong": "$open_time"}
+    partitions = await PartitionService.agregar(None, None, cutoff_ms, [
+        {"$match": match},
+        {"$group": {"_id": {
+            "symbol": "$symbol",
+            "day": {"$toDate": {"$subtract": [open_ms, {"$mod": [open_ms, DAY_MS]}]}},
+        }}},
+    ])
+    partitions.sort(key=lambda partition: (partition["_id"]["day"], partition["_id"]["symbol"]))
+
+    report = {"partitions": 0, "klines": 0, "aggtrades": 0}
+    t0 = time.perf_counter()
+    for partition in partitions:
+        symbol, day = partition["_id"]["symbol"], partition["_id"]["day"].date()
+        moved = await archive_day(symbol, day)
+        report["partitions"] += 1
+        report["klines"] += moved["klines"]
+        report["aggtrades"] += moved["aggtrades"]
+        logger.info("Archived %s %s: %d klines, %d aggtrades", symbol, day, moved["klines"], moved["aggtrades"])
+
+    report["seconds"] = round(time.perf_counter() - t0, 2)
+    return report
+
+
+def _scan(dataset: str, column: str, symbol: str | None, start_ms: int | None, end_ms: int | None) -> pl.LazyFrame | None:
+    """
+    Escaneo lazy de un dataset con los filtros en [start_ms, end_ms) sobre
+    `column`. Los filtros por symbol/date podan particiones antes de leer.
+    """
+    root = Path(settings.ARCHIVE_DIR) / dataset
+    if not root.is_dir() or (symbol and not (root / f"symbol={symbol}").is_dir()):
+        return None
+
+    scan = pl.scan_parquet(str(root / "**" / "*.parquet"), hive_partitioning=True)
+    if symbol:
+        scan = scan.filter(pl.col("symbol") == symbol)
+    if start_ms is not None:
+        scan = scan.filter(
+            pl.col("date") >= _ms_to_naive(start_ms).date(),
+            pl.col(column) >= _ms_to_naive(start_ms),
+        )
+    if end_ms is not None:
+        scan = scan.filter(
+            pl.col("date") <= _ms_to_naive(end_ms - 1).date(),
+            pl.col(column) < _ms_to_naive(end_ms),
+        )
+    return scan.drop("date")
+
+
+def read_klines(
+    symbol: str | None = None,
+    start_ms: int | None = None,
+    end_ms: int | None = None,
+    sort: str | None = None,
+    descending: bool = False,
+    limit: int | None = None,
+) -> list[Kline]:
+    """Velas archivadas con open_time en [start_ms, end_ms), como `Kline` sin id."""
+    scan = _scan("klines", "open_time", symbol, start_ms, end_ms)
+    if scan is None:
+        return []
+    if sort:
+        scan = scan.sort(sort, descending=descending)
+    if limit is not None:
+        scan = scan.head(limit)
+    return [Kline.model_construct(**row) for row in scan.collect().iter_rows(named=True)]
+
+
+def read_kline_frame(
+    symbol: str | None = None,
+    start_ms: int | None = None,
+    end_ms: int | None = None,
+    columns: list[str] | None = None,
+) -> pl.DataFrame:
+    """Velas archivadas con open_time en [start_ms, end_ms) como DataFrame, solo con `columns`."""
+    scan = _scan("klines", "open_time", symbol, start_ms, end_ms)
+    if scan is None:
+        scan = pl.LazyFrame(schema={"symbol": pl.Utf8, **KLINE_ARCHIVE_SCHEMA})
+    return scan.select(columns or pl.all()).collect()
+
+
+def read_trades(symbol: str, start_ms: int | None = None, end_ms: int | None = None) -> list[AggTradeEvent]:
+    """AggTrades archivados de un símbolo con timestamp en [start_ms, end_ms), por agg_trade_id."""
+    scan = _scan("aggtrades", "timestamp", symbol, start_ms, end_ms)
+    if scan is None:
+        return []
+    frame = scan.sort("agg_trade_id").collect()
+    return [AggTradeEvent.model_construct(**row) for row in frame.iter_rows(named=True)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archivar velas 1m y aggTrades antiguos en Parquet")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help="Mover a Parquet los días más antiguos que --older-than-days")
+    run_parser.add_argument("symbols", nargs="*")
+    run_parser.add_argument("--older-than-days", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(asyncio.run(archive(args.symbols or None, args.older_than_days))))
+
+
+if __name__ == "__main__":
+    main()
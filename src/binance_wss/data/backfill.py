@@ -0,0 +1,183 @@
+"""
+Backfill histórico reanudable de klines 1m y aggTrades.
+
+Divide [start, end) en chunks, los procesa en paralelo dentro del límite
+de peso de Binance reutilizando extract/transform/load y guarda en un
+archivo de estado los chunks terminados. Si el proceso se cae, al volver
+a lanzarlo con los mismos argumentos solo procesa los chunks pendientes.
+
+Uso:
+    python -m binance_wss.data.backfill ETHUSDT BTCUSDT \\
+        --start 2025-01-01 --end 2025-04-01 --chunk-hours 6 --concurrency 4
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from .extract import extract_window, INTERVAL_MS
+from .load import load_frame
+from .rest import BinanceREST
+from .transform import merge_klines_aggtrades
+
+logger = logging.getLogger(__name__)
+
+
+def parse_date(value: str) -> int:
+    """Fecha ISO (UTC si no trae zona) → epoch ms."""
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+def split_chunks(start: int, end: int, chunk_ms: int) -> list[tuple[int, int]]:
+    # los bordes se alinean al minuto para que ninguna vela quede partida
+    start -= start % INTERVAL_MS
+    chunk_ms -= chunk_ms % INTERVAL_MS
+    return [(s, min(s + chunk_ms, end)) for s in range(start, end, chunk_ms)]
+
+
+class BackfillState:
+    """Chunks terminados, persistidos en un JSON que se reescribe de forma atómica."""
+
+    def __init__(self, path: Path, key: dict):
+        self.path = path
+        self.key = key
+        self.done: set[str] = set()
+
+        if path.exists():
+            data = json.loads(path.read_text(encoding="utf-8"))
+            if data.get("key") != key:
+                raise ValueError(
+                    f"State file {path} belongs to a different backfill: {data.get('key')}"
+                )
+            self.done = set(data["done"])
+
+    @staticmethod
+    def chunk_id(symbol: str, start: int, end: int) -> str:
+        return f"{symbol}:{start}:{end}"
+
+    def is_done(self, chunk_id: str) -> bool:
+        return chunk_id in self.done
+
+    def mark_done(self, chunk_id: str):
+        self.done.add(chunk_id)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"key": self.key, "done": sorted(self.done)}), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+
+class Backfill:
+    def __init__(
+        self,
+        symbols: list[str],
+        start: int,
+        end: int,
+        chunk_hours: float = 6,
+        concurrency: int = 4,
+        state_file: str | None = None,
+    ):
+        if end <= start:
+            raise ValueError("end must be after start")
+
+        self.symbols = [s.upper() for s in symbols]
+        self.chunks = split_chunks(start, end, int(chunk_hours * 3600 * 1000))
+        self.concurrency = concurrency
+
+        key = {"symbols": self.symbols, "start": start, "end": end, "chunk_hours": chunk_hours}
+        default_name = f"backfill_{'_'.join(self.symbols)}_{start}_{end}.json"
+        self.state = BackfillState(Path(state_file or Path("backfill_state") / default_name), key)
+
+        self.klines = 0
+        self.aggtrades = 0
+
+    async def _run_chunk(self, rest: BinanceREST, sem: asyncio.Semaphore, symbol: str, start: int, end: int):
+        chunk_id = BackfillState.chunk_id(symbol, start, end)
+        async with sem:
+            t0 = time.perf_counter()
+            extracted = await extract_window(rest, symbol, start, end)
+            loaded = trades = 0
+            if extracted is not None:
+                klines, aggtrades = extracted
+                merged = await asyncio.to_thread(merge_klines_aggtrades, klines, aggtrades)
+                loaded = (await load_frame(merged))["docs"]
+                trades = aggtrades.height
+
+        self.klines += loaded
+        self.aggtrades += trades
+        self.state.mark_done(chunk_id)
+
+        elapsed = time.perf_counter() - t0
+        logger.info(
+            "%s done: %d klines, %d aggtrades in %.1fs (%.0f rows/s)",
+            chunk_id, loaded, trades, elapsed, (loaded + trades) / elapsed if elapsed else 0,
+        )
+
+    async def run(self) -> dict:
+        pending = [
+            (symbol, start, end)
+            for symbol in self.symbols
+            for start, end in self.chunks
+            if not self.state.is_done(BackfillState.chunk_id(symbol, start, end))
+        ]
+        total = len(self.symbols) * len(self.chunks)
+        logger.info("Backfill: %d/%d chunks pending", len(pending), total)
+
+        t0 = time.perf_counter()
+        sem = asyncio.Semaphore(self.concurrency)
+        async with BinanceREST(max_concurrency=self.concurrency * 2) as rest:
+            tasks = [
+                asyncio.create_task(self._run_chunk(rest, sem, symbol, start, end))
+                for symbol, start, end in pending
+            ]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                # lo terminado ya quedó en el estado; el resto se retoma al relanzar
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+        elapsed = time.perf_counter() - t0
+
+        report = {
+            "chunks": len(pending),
+            "klines": self.klines,
+            "aggtrades": self.aggtrades,
+            "seconds": round(elapsed, 2),
+            "rows_per_sec": round((self.klines + self.aggtrades) / elapsed, 1) if elapsed else 0.0,
+        }
+        logger.info("Backfill finished: %s", report)
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill histórico de klines y aggTrades")
+    parser.add_argument("symbols", nargs="+")
+    parser.add_argument("--start", required=True, help="Fecha ISO de inicio (incluida)")
+    parser.add_argument("--end", required=True, help="Fecha ISO de fin (excluida)")
+    parser.add_argument("--chunk-hours", type=float, default=6)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--state-file", default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    backfill = Backfill(
+        args.symbols,
+        parse_date(args.start),
+        parse_date(args.end),
+        chunk_hours=args.chunk_hours,
+        concurrency=args.concurrency,
+        state_file=args.state_file,
+    )
+    print(json.dumps(asyncio.run(backfill.run())))
+
+
+if __name__ == "__main__":
+    main()
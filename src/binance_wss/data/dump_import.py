@@ -0,0 +1,296 @@
+"""
+Importación masiva desde los volcados públicos de Binance (data.binance.vision).
+
+Lee los CSV diarios de klines 1m y aggTrades de un mirror local (zip o csv
+ya descomprimido), los escanea en modo lazy con Polars y el motor de
+streaming, los mapea al esquema de `Kline`/`AggTradeEvent` y los carga en Mongo
+por particiones (un día por partición) en paralelo, con memoria acotada por
+el número de particiones en vuelo.
+
+Estructura esperada (la de data.binance.vision, en cualquier subcarpeta de ROOT):
+    .../klines/ETHUSDT/1m/ETHUSDT-1m-2024-01-01.zip
+    .../aggTrades/ETHUSDT/ETHUSDT-aggTrades-2024-01-01.zip
+
+Uso:
+    python -m binance_wss.data.dump_import /mnt/binance-data ETHUSDT --parallel 4
+"""
+import argparse
+import asyncio
+import json
+import logging
+import re
+import tempfile
+import time
+import zipfile
+from datetime import date
+from pathlib import Path
+
+import polars as pl
+
+from binance_wss.app.db import get_db
+from binance_wss.data.aggtrades import load_aggtrades
+from binance_wss.data.partitions import partitioned_upsert
+from binance_wss.data.rollups import refresh_rollups
+from binance_wss.data.watermark import advance_watermarks, datetime_to_ms
+
+logger = logging.getLogger(__name__)
+
+KLINE_CSV_SCHEMA = {
+    "open_time": pl.Int64,
+    "open": pl.Float64,
+    "high": pl.Float64,
+    "low": pl.Float64,
+    "close": pl.Float64,
+    "volume": pl.Float64,
+    "close_time": pl.Int64,
+    "quote_asset_volume": pl.Float64,
+    "number_of_trades": pl.Int64,
+    "taker_buy_base_asset_volume": pl.Float64,
+    "taker_buy_quote_asset_volume": pl.Float64,
+    "ignore": pl.Utf8,
+}
+
+AGGTRADE_CSV_SCHEMA = {
+    "agg_trade_id": pl.Int64,
+    "price": pl.Float64,
+    "quantity": pl.Float64,
+    "first_trade_id": pl.Int64,
+    "last_trade_id": pl.Int64,
+    "timestamp": pl.Int64,
+    "is_buyer_maker": pl.Boolean,
+    "is_best_match": pl.Boolean,
+}
+
+_DATE_RE = re.compile(r"(\d{4}-\d{2}-\d{2})\.(zip|csv)$")
+
+
+def find_partitions(root: Path, symbol: str, interval: str = "1m") -> list[dict]:
+    """Empareja por fecha los archivos de klines y aggTrades de `symbol`."""
+    klines = {}
+    aggtrades = {}
+    for path in root.rglob(f"{symbol}-*"):
+        match = _DATE_RE.search(path.name)
+        if not match:
+            continue
+        day = date.fromisoformat(match.group(1))
+        if path.name.startswith(f"{symbol}-{interval}-"):
+            # si existen el zip y el csv descomprimido se prefiere el csv
+            if day not in klines or path.suffix == ".csv":
+                klines[day] = path
+        elif path.name.startswith(f"{symbol}-aggTrades-"):
+            if day not in aggtrades or path.suffix == ".csv":
+                aggtrades[day] = path
+
+    return [
+        {"symbol": symbol, "date": day, "klines": klines[day], "aggtrades": aggtrades.get(day)}
+        for day in sorted(klines)
+    ]
+
+
+def _csv_path(path: Path, workdir: Path) -> Path:
+    """Devuelve un CSV escaneable; los zip se descomprimen (en streaming) a `workdir`."""
+    if path.suffix != ".zip":
+        return path
+    with zipfile.ZipFile(path) as zf:
+        member = zf.namelist()[0]
+        return Path(zf.extract(member, workdir))
+
+
+def _has_header(path: Path) -> bool:
+    # los volcados más recientes incluyen cabecera, los antiguos no
+    with open(path, encoding="utf-8") as f:
+        return not f.readline()[:1].isdigit()
+
+
+def _epoch_ms(column: str) -> pl.Expr:
+    # desde 2025 los volcados spot vienen en microsegundos
+    col = pl.col(column)
+    return pl.when(col > 10**14).then(col // 1000).otherwise(col).alias(column)
+
+
+def scan_klines(path: Path) -> pl.LazyFrame:
+    return pl.scan_csv(
+        path,
+        has_header=False,
+        skip_rows=1 if _has_header(path) else 0,
+        schema=KLINE_CSV_SCHEMA,
+    ).select(
+        _epoch_ms("open_time"),
+        _epoch_ms("close_time"),
+        pl.col("open").alias("open_price"),
+        pl.col("close").alias("close_price"),
+        pl.col("high").alias("high_price"),
+        pl.col("low").alias("low_price"),
+        "volume",
+        "quote_asset_volume",
+        "number_of_trades",
+        "taker_buy_base_asset_volume",
+        "taker_buy_quote_asset_volume",
+    )
+
+
+def scan_aggtrades(path: Path) -> pl.LazyFrame:
+    return pl.scan_csv(
+        path,
+        has_header=False,
+        skip_rows=1 if _has_header(path) else 0,
+        schema=AGGTRADE_CSV_SCHEMA,
+    ).with_columns(
+        _epoch_ms("timestamp"),
+    )
+
+
+def build_partition(partition: dict, workdir: Path) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    Velas de un día y sus aggTrades (planos, para la colección time-series),
+    ya con los nombres y tipos de `Kline`/`AggTradeEvent`. Todo el plan es
+    lazy y se ejecuta con el motor de streaming.
+    """
+    symbol = partition["symbol"]
+    klines = (
+        scan_klines(_csv_path(partition["klines"], workdir))
+        .with_columns(
+            pl.col("open_time").cast(pl.Datetime("ms")),
+            pl.col("close_time").cast(pl.Datetime("ms")),
+            pl.lit(symbol).alias("symbol"),
+            pl.lit("1m").alias("interval"),
+        )
+        .sort("open_time")
+        .collect(engine="streaming")
+    )
+
+    if partition["aggtrades"] is None:
+        return klines.with_columns(
+            pl.lit(0, dtype=pl.Int64).alias("aggtrade_count"),
+            pl.lit(0, dtype=pl.Int64).alias("aggtrade_buyer_count"),
+            pl.lit(0, dtype=pl.Int64).alias("aggtrade_seller_count"),
+            pl.lit(0.0).alias("aggtrade_quantity"),
+        ), pl.DataFrame()
+
+    aggtrades = (
+        scan_aggtrades(_csv_path(partition["aggtrades"], workdir))
+        .with_columns(
+            pl.col("timestamp").cast(pl.Datetime("ms")),
+            pl.lit(symbol).alias("symbol"),
+        )
+        .sort("agg_trade_id")
+        .collect(engine="streaming")
+    )
+
+    # parciales de aggTrades por vela (compradores = taker buy, is_buyer_maker = false)
+    partials = aggtrades.group_by(pl.col("timestamp").dt.truncate("1m").alias("open_time")).agg(
+        pl.len().cast(pl.Int64).alias("aggtrade_count"),
+        (~pl.col("is_buyer_maker")).sum().cast(pl.Int64).alias("aggtrade_buyer_count"),
+        pl.col("is_buyer_maker").sum().cast(pl.Int64).alias("aggtrade_seller_count"),
+        pl.col("quantity").sum().alias("aggtrade_quantity"),
+    )
+    klines = klines.join(partials, on="open_time", how="left").with_columns(
+        pl.col("aggtrade_count", "aggtrade_buyer_count", "aggtrade_seller_count").fill_null(0),
+        pl.col("aggtrade_quantity").fill_null(0.0),
+    ).sort("open_time")
+    return klines, aggtrades
+
+
+class DumpImporter:
+    def __init__(
+        self,
+        root: str,
+        symbol: str,
+        start_date: date | None = None,
+        end_date: date | None = None,
+        parallel: int = 4,
+        batch_size: int = 500,
+    ):
+        self.root = Path(root)
+        self.symbol = symbol.upper()
+        self.start_date = start_date
+        self.end_date = end_date
+        self.parallel = parallel
+        self.batch_size = batch_size
+        self.klines = 0
+        self.aggtrades = 0
+
+    def partitions(self) -> list[dict]:
+        return [
+            p for p in find_partitions(self.root, self.symbol)
+            if (self.start_date is None or p["date"] >= self.start_date)
+            and (self.end_date is None or p["date"] <= self.end_date)
+        ]
+
+    async def _import_partition(self, sem: asyncio.Semaphore, partition: dict):
+        async with sem:
+            t0 = time.perf_counter()
+            with tempfile.TemporaryDirectory(prefix="binance_dump_") as workdir:
+                df, trades_df = await asyncio.to_thread(build_partition, partition, Path(workdir))
+
+            # upsert / inserción de solo los trades nuevos: reimportar un día no duplica
+            await partitioned_upsert(df.to_dicts(), batch_size=self.batch_size)
+            trades = trades_df.height
+            if trades:
+                await load_aggtrades(trades_df, batch_size=self.batch_size)
+
+            if not df.is_empty():
+                await refresh_rollups({
+                    self.symbol: (
+                        datetime_to_ms(df["open_time"].min()),
+                        datetime_to_ms(df["open_time"].max()),
+                    )
+                })
+                await advance_watermarks([{
+                    "symbol": self.symbol,
+                    "interval": "1m",
+                    "last_open_time": df["open_time"].max(),
+                    "last_agg_trade_id": trades_df["agg_trade_id"].max() if trades else None,
+                }])
+
+        self.klines += df.height
+        self.aggtrades += trades
+        elapsed = time.perf_counter() - t0
+        logger.info(
+            "%s %s: %d klines, %d aggtrades in %.1fs",
+            self.symbol, partition["date"], df.height, trades, elapsed,
+        )
+
+    async def run(self) -> dict:
+        await get_db()
+        partitions = self.partitions()
+        logger.info("Importing %d daily partitions for %s", len(partitions), self.symbol)
+
+        t0 = time.perf_counter()
+        sem = asyncio.Semaphore(self.parallel)
+        await asyncio.gather(*[self._import_partition(sem, p) for p in partitions])
+        elapsed = time.perf_counter() - t0
+
+        return {
+            "partitions": len(partitions),
+            "klines": self.klines,
+            "aggtrades": self.aggtrades,
+            "seconds": round(elapsed, 2),
+            "rows_per_sec": round((self.klines + self.aggtrades) / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importar volcados públicos de Binance a Mongo")
+    parser.add_argument("root", help="Carpeta raíz del mirror local")
+    parser.add_argument("symbol")
+    parser.add_argument("--start-date", type=date.fromisoformat, default=None)
+    parser.add_argument("--end-date", type=date.fromisoformat, default=None)
+    parser.add_argument("--parallel", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    importer = DumpImporter(
+        args.root,
+        args.symbol,
+        start_date=args.start_date,
+        end_date=args.end_date,
+        parallel=args.parallel,
+        batch_size=args.batch_size,
+    )
+    print(json.dumps(asyncio.run(importer.run())))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,75 +1,338 @@
+import asyncio
+import multiprocessing
 import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+
 import polars as pl
-from binance.client import Client
 from ..app.settings import settings
+from ..app.db import close_db
+from .rest import BinanceREST, SharedWeightBudget, WeightBudget
+from .staging import run_dir, write_frame
+from .watermark import load_watermarks
 
-client = Client()
+KLINE_COLUMNS = [
+    "open_time", "open", "high", "low", "close",
+    "volume", "close_time", "quote_asset_volume",
+    "number_of_trades", "taker_buy_base_asset_volume",
+    "taker_buy_quote_asset_volume", "ignore"
+]
 
-def extract_klines(symbol: str, limit: int | None):
-    interval = Client.KLINE_INTERVAL_1MINUTE
-    data = client.get_historical_klines(
-        symbol=symbol,
-        interval=interval,
-        limit=limit
-    )
+AGGTRADE_COLUMNS = {
+    "a": "agg_trade_id",
+    "p": "price",
+    "q": "quantity",
+    "f": "first_trade_id",
+    "l": "last_trade_id",
+    "T": "timestamp",
+    "m": "is_buyer_maker",
+    "M": "is_best_match"
+}
 
-    df = pl.DataFrame(data, schema=[
-        "open_time", "open", "high", "low", "close", 
-        "volume", "close_time", "quote_asset_volume", 
-        "number_of_trades", "taker_buy_base_asset_volume", 
-        "taker_buy_quote_asset_volume", "ignore"
-    ], orient="row")
+KLINES_PAGE_SIZE = 1000
+INTERVAL = "1m"
+INTERVAL_MS = 60_000
 
-    df = df.with_columns(pl.lit(symbol).alias("symbol"))
+async def extract_klines(
+    rest: BinanceREST,
+    symbol: str,
+    limit: int | None,
+    start_time: int | None = None,
+    end_time: int | None = None
+):
+    """
+    Sin `start_time` devuelve las últimas `limit` velas; con `start_time`
+    pagina desde ahí hasta `end_time` (o hasta la vela más reciente).
+    """
+    if start_time is None:
+        data = await rest.get("/api/v3/klines", {
+            "symbol": symbol,
+            "interval": INTERVAL,
+            "limit": limit
+        })
+    else:
+        data = []
+        while True:
+            page = await rest.get("/api/v3/klines", {
+                "symbol": symbol,
+                "interval": INTERVAL,
+                "startTime": start_time,
+                "endTime": end_time,
+                "limit": KLINES_PAGE_SIZE
+            })
+            data.extend(page)
+            if len(page) < KLINES_PAGE_SIZE or end_time is not None and page[-1][0] >= end_time:
+                break
+            start_time = page[-1][0] + 1
+
+    df = pl.DataFrame(data, schema=KLINE_COLUMNS, orient="row")
 
-    time.sleep(0.2)
+    df = df.with_columns(pl.lit(symbol).alias("symbol"))
     return df
 
-def extract_aggtrades(
-    symbol: str, 
-    start_time: int | None, 
-    end_time: int | None, 
-    limit: int | None
+AGGTRADES_PAGE_SIZE = 1000
+# Binance exige que startTime/endTime de aggTrades abarquen menos de 1 hora
+AGGTRADES_MAX_WINDOW_MS = 60 * 60 * 1000 - 1
+
+async def extract_aggtrades(
+    rest: BinanceREST,
+    symbol: str,
+    start_time: int | None,
+    end_time: int | None,
+    limit: int | None = AGGTRADES_PAGE_SIZE,
+    from_id: int | None = None
 ):
-    data = client.get_aggregate_trades(
-        symbol=symbol,
-        startTime=start_time,
-        endTime=end_time,
-        limit=limit
-    )
+    """
+    Descarga todos los aggTrades de [start_time, end_time] en una sola pasada.
 
-    df = pl.DataFrame(data).rename({
-        "a": "agg_trade_id",
-        "p": "price",
-        "q": "quantity",
-        "f": "first_trade_id",
-        "l": "last_trade_id",
-        "T": "timestamp",
-        "m": "is_buyer_maker",
-        "M": "is_best_match"
-    })
-
-    time.sleep(0.2)
-    return df
+    La primera página se localiza por tiempo (o directamente por `from_id`
+    si se conoce el último trade cargado) y el resto se recorre por `fromId`
+    hasta superar `end_time`, así no se trunca ningún minuto.
+    """
+    limit = limit or AGGTRADES_PAGE_SIZE
+    if start_time is None or end_time is None:
+        pages = [await rest.get("/api/v3/aggTrades", {
+            "symbol": symbol,
+            "startTime": start_time,
+            "endTime": end_time,
+            "limit": limit
+        })]
+        return _aggtrades_frame(pages)
 
-def extract_all():
-    limit = 10
-    klines = extract_klines("ETHUSDT", limit)
+    pages = []
+    page = []
+    if from_id is not None:
+        page = await rest.get("/api/v3/aggTrades", {
+            "symbol": symbol,
+            "fromId": from_id,
+            "limit": limit
+        })
 
-    result = []
-    for row in klines.iter_rows(named=True):
-        open_time = row["open_time"]
-        close_time = row["close_time"]
-        agg_df = extract_aggtrades("ETHUSDT", open_time, close_time, limit)
+    window_start = start_time
+    while not page and window_start <= end_time:
+        page = await rest.get("/api/v3/aggTrades", {
+            "symbol": symbol,
+            "startTime": window_start,
+            "endTime": min(window_start + AGGTRADES_MAX_WINDOW_MS, end_time),
+            "limit": limit
+        })
+        window_start += AGGTRADES_MAX_WINDOW_MS + 1
 
-        result.append({
-            "kline_open": int(open_time),
-            "aggtrades": agg_df.to_dicts(),  # lista[dict]
+    while page:
+        pages.append(page)
+        if page[-1]["T"] > end_time:
+            break
+        page = await rest.get("/api/v3/aggTrades", {
+            "symbol": symbol,
+            "fromId": page[-1]["a"] + 1,
+            "limit": limit
         })
 
-    # Lo que se manda por XCom:
-    payload = {
-        "klines": klines.to_dicts(),  # lista[dict]
-        "aggtrades": result,          # lista[dict{kline_open, aggtrades:list[dict]}]
+    df = _aggtrades_frame(pages)
+    return df.filter(pl.col("timestamp").is_between(start_time, end_time))
+
+def _aggtrades_frame(pages: list[list[dict]]) -> pl.DataFrame:
+    rows = [trade for page in pages for trade in page]
+    if not rows:
+        return pl.DataFrame(schema={
+            "agg_trade_id": pl.Int64,
+            "price": pl.Utf8,
+            "quantity": pl.Utf8,
+            "first_trade_id": pl.Int64,
+            "last_trade_id": pl.Int64,
+            "timestamp": pl.Int64,
+            "is_buyer_maker": pl.Boolean,
+            "is_best_match": pl.Boolean,
+        })
+    return pl.DataFrame(rows).rename(AGGTRADE_COLUMNS)
+
+def bucket_aggtrades(klines: pl.DataFrame, aggtrades: pl.DataFrame) -> pl.DataFrame:
+    """
+    Asigna cada aggTrade a su vela con un `join_asof` por timestamp
+    (open_time <= timestamp <= close_time). Devuelve un frame plano, una
+    fila por trade con la clave (symbol, kline_open); el anidado por vela
+    se hace en transform.
+    """
+    keys = klines.select(
+        pl.col("symbol"),
+        pl.col("open_time").cast(pl.Int64).alias("kline_open"),
+        pl.col("close_time").cast(pl.Int64),
+    ).sort("kline_open")
+
+    return (
+        aggtrades
+        .with_columns(pl.col("timestamp").cast(pl.Int64))
+        .sort("timestamp")
+        .join_asof(keys, left_on="timestamp", right_on="kline_open", strategy="backward")
+        .filter(pl.col("timestamp") <= pl.col("close_time"))
+        .select("symbol", "kline_open", *AGGTRADE_COLUMNS.values())
+    )
+
+async def resolve_symbols(rest: BinanceREST) -> list[str]:
+    """Universo de símbolos: `BINANCE_SYMBOLS` o los pares TRADING de exchangeInfo."""
+    if not settings.BINANCE_SYMBOLS_FROM_EXCHANGE_INFO:
+        return list(settings.BINANCE_SYMBOLS)
+
+    info = await rest.get("/api/v3/exchangeInfo", {"permissions": "SPOT"})
+    return sorted(
+        s["symbol"] for s in info["symbols"]
+        if s["status"] == "TRADING" and s["quoteAsset"] == settings.BINANCE_SYMBOLS_QUOTE_ASSET
+    )
+
+async def extract_symbol(rest: BinanceREST, symbol: str, limit: int, watermark: dict | None = None):
+    """
+    Extrae las velas cerradas de `symbol` y sus aggTrades.
+
+    Con watermark solo se pide el delta: velas posteriores a `last_open_time`
+    y trades posteriores a `last_agg_trade_id`. Sin watermark (primera
+    ejecución) se toman las últimas `limit` velas.
+    """
+    start_time = watermark["last_open_time"] + INTERVAL_MS if watermark else None
+    klines = await extract_klines(rest, symbol, limit, start_time)
+
+    # la vela en curso se descarta: el watermark solo cubre velas cerradas
+    if not klines.is_empty():
+        klines = klines.filter(pl.col("close_time") < int(time.time() * 1000))
+    if klines.is_empty():
+        return None
+
+    last_agg_id = watermark.get("last_agg_trade_id") if watermark else None
+
+    # Una sola pasada paginada sobre toda la ventana de extracción
+    aggtrades = await extract_aggtrades(
+        rest,
+        symbol,
+        int(klines["open_time"].min()),
+        int(klines["close_time"].max()),
+        from_id=last_agg_id + 1 if last_agg_id is not None else None,
+    )
+    return klines, bucket_aggtrades(klines, aggtrades)
+
+async def extract_window(rest: BinanceREST, symbol: str, start_time: int, end_time: int):
+    """
+    Velas de `symbol` con open_time en [start_time, end_time) y sus
+    aggTrades agrupados, o None si no hay velas cerradas en la ventana.
+    """
+    klines = await extract_klines(rest, symbol, None, start_time, end_time - 1)
+    if not klines.is_empty():
+        klines = klines.filter(
+            (pl.col("open_time") < end_time) & (pl.col("close_time") < int(time.time() * 1000))
+        )
+    if klines.is_empty():
+        return None
+
+    aggtrades = await extract_aggtrades(
+        rest,
+        symbol,
+        int(klines["open_time"].min()),
+        int(klines["close_time"].max()),
+    )
+    return klines, bucket_aggtrades(klines, aggtrades)
+
+async def extract_symbols(
+    symbols: list[str],
+    limit: int,
+    budget: WeightBudget | None = None,
+    max_concurrency: int = 10,
+    watermarks: dict[str, dict] | None = None
+):
+    watermarks = watermarks or {}
+    async with BinanceREST(budget=budget, max_concurrency=max_concurrency) as rest:
+        results = await asyncio.gather(*[
+            extract_symbol(rest, s, limit, watermarks.get(s)) for s in symbols
+        ])
+
+    results = [r for r in results if r is not None]
+    if not results:
+        return None
+
+    klines = pl.concat([k for k, _ in results], how="vertical_relaxed")
+    aggtrades = pl.concat([a for _, a in results], how="vertical_relaxed")
+    return klines, aggtrades
+
+def _write_extract(result, directory: Path, suffix: str) -> dict:
+    """Escribe el resultado de un shard en staging y devuelve las rutas."""
+    if result is None:
+        return {"klines": [], "aggtrades": []}
+    klines, aggtrades = result
+    return {
+        "klines": [write_frame(klines, directory, f"klines-{suffix}")],
+        "aggtrades": [write_frame(aggtrades, directory, f"aggtrades-{suffix}")],
+    }
+
+# ---------- Fan-out en un pool de procesos ----------
+
+_worker_budget: WeightBudget | None = None
+
+def _init_worker(budget: SharedWeightBudget):
+    global _worker_budget
+    _worker_budget = budget
+
+def _extract_shard(
+    symbols: list[str],
+    limit: int,
+    max_concurrency: int,
+    watermarks: dict[str, dict],
+    directory: str,
+    shard: int
+):
+    result = asyncio.run(extract_symbols(symbols, limit, _worker_budget, max_concurrency, watermarks))
+    # cada worker escribe su propio archivo: al padre solo vuelven rutas
+    return _write_extract(result, Path(directory), str(shard))
+
+def extract_all(**context):
+    """
+    Extrae todos los símbolos y deja velas y aggTrades en staging.
+    Por XCom solo se devuelven las rutas:
+    {"klines": [ruta, ...], "aggtrades": [ruta, ...]}
+    """
+    async def _resolve():
+        async with BinanceREST() as rest:
+            symbols = await resolve_symbols(rest)
+        try:
+            return symbols, await load_watermarks(symbols, INTERVAL)
+        finally:
+            # el cliente de Mongo queda ligado a este loop
+            close_db()
+
+    symbols, watermarks = asyncio.run(_resolve())
+    limit = settings.EXTRACT_KLINE_LIMIT
+    concurrency = settings.EXTRACT_MAX_CONCURRENCY
+    workers = min(settings.EXTRACT_WORKERS, len(symbols))
+    directory = run_dir(context)
+
+    if workers <= 1:
+        result = asyncio.run(extract_symbols(symbols, limit, max_concurrency=concurrency, watermarks=watermarks))
+        return _write_extract(result, directory, "0")
+
+    # Los símbolos se reparten entre procesos que descuentan de un único
+    # presupuesto de peso compartido
+    ctx = multiprocessing.get_context("spawn")
+    budget = SharedWeightBudget(ctx, settings.BINANCE_WEIGHT_LIMIT)
+    shards = [symbols[i::workers] for i in range(workers)]
+
+    # Lo que se manda por XCom: rutas de staging, no filas
+    refs = {
+        "klines": [],     # velas crudas por shard
+        "aggtrades": [],  # un trade por fila (symbol, kline_open, campos del trade) por shard
     }
-    return payload
\ No newline at end of file
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(budget,),
+    ) as pool:
+        shard_watermarks = [{s: watermarks[s] for s in shard if s in watermarks} for shard in shards]
+        for shard_refs in pool.map(
+            _extract_shard,
+            shards,
+            repeat(limit),
+            repeat(concurrency),
+            shard_watermarks,
+            repeat(str(directory)),
+            range(workers),
+        ):
+            refs["klines"].extend(shard_refs["klines"])
+            refs["aggtrades"].extend(shard_refs["aggtrades"])
+    return refs
@@ -0,0 +1,167 @@
+"""
+Carga rápida sin validación por fila: columnas Polars/Arrow → BSON.
+
+El camino normal construye un dict por fila, un `Kline` de pydantic con sus
+`AggTrade` anidados y luego Beanie lo vuelve a serializar. Aquí el esquema
+se comprueba una sola vez sobre el frame (columnas, tipos y nulos), se
+renombra/castea a los campos de `Kline` con expresiones columnares y las
+filas se codifican a `RawBSONDocument`, que pymongo envía sin volver a
+recorrerlo, sin dict por fila: cada forma de documento (largo de los
+strings, ints que caben en int32) es una plantilla `struct` con las claves
+y los tipos BSON ya puestos, y Polars entrega los valores en el orden de la
+plantilla.
+
+Se activa con `LOAD_FAST_PATH=true`.
+"""
+import struct
+
+import polars as pl
+from bson.raw_bson import RawBSONDocument
+
+from binance_wss.app.db import get_db
+from binance_wss.data.aggtrades import load_aggtrades, split_aggtrades, trade_partial_exprs
+from binance_wss.data.rollups import refresh_rollups, touched_ranges
+from binance_wss.data.transform import AGGTRADE_SCHEMA
+from binance_wss.data.partitions import partitioned_upsert
+from binance_wss.data.upsert import KLINE_KEY
+from binance_wss.data.watermark import advance_watermarks
+
+AGGTRADE_DTYPE = pl.List(pl.Struct({
+    **AGGTRADE_SCHEMA,
+    "timestamp": pl.Datetime("ms"),
+}))
+
+# columna del frame de transform → (campo de Kline, tipo)
+KLINE_FRAME_SCHEMA = {
+    "open_time": ("open_time", pl.Datetime("ms")),
+    "close_time": ("close_time", pl.Datetime("ms")),
+    "symbol": ("symbol", pl.Utf8),
+    "open": ("open_price", pl.Float64),
+    "close": ("close_price", pl.Float64),
+    "high": ("high_price", pl.Float64),
+    "low": ("low_price", pl.Float64),
+    "volume": ("volume", pl.Float64),
+    "quote_asset_volume": ("quote_asset_volume", pl.Float64),
+    "number_of_trades": ("number_of_trades", pl.Int64),
+    "taker_buy_base_asset_volume": ("taker_buy_base_asset_volume", pl.Float64),
+    "taker_buy_quote_asset_volume": ("taker_buy_quote_asset_volume", pl.Float64),
+    "aggtrades": ("aggtrades", AGGTRADE_DTYPE),
+}
+
+# como `bson.encode`: un int de Python va como int32 si cabe y si no como int64
+INT32_RANGE = (-2**31, 2**31 - 1)
+
+
+def to_kline_frame(df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Valida el frame de transform a nivel de columnas y lo devuelve con los
+    nombres y tipos de `Kline`. Lanza ValueError si falta una columna, un
+    cast no es posible o hay nulos.
+    """
+    missing = [column for column in KLINE_FRAME_SCHEMA if column not in df.columns]
+    if missing:
+        raise ValueError(f"Transformed frame is missing columns: {missing}")
+
+    try:
+        frame = df.select(
+            *[
+                pl.col(column).cast(dtype, strict=True).alias(field)
+                for column, (field, dtype) in KLINE_FRAME_SCHEMA.items()
+            ],
+            pl.lit("1m").alias("interval"),
+        ).with_columns(pl.col("aggtrades").fill_null([]))
+        frame = frame.with_columns(trade_partial_exprs())
+    except pl.exceptions.PolarsError as e:
+        raise ValueError(f"Transformed frame does not match the Kline schema: {e}") from e
+
+    nulls = [name for name, count in frame.null_count().row(0, named=True).items() if count]
+    if nulls:
+        raise ValueError(f"Transformed frame has nulls in: {nulls}")
+    return frame
+
+
+def _template(schema: pl.Schema, int32: dict[str, bool], lengths: dict[str, int]) -> tuple[struct.Struct, list[pl.Expr]]:
+    """
+    Plantilla de una forma de documento: el `struct` del documento BSON
+    completo y las expresiones que dan sus valores en orden (largo total,
+    y por campo el byte de tipo con la clave y el valor).
+    """
+    parts, exprs = [], []
+    for name, dtype in schema.items():
+        key = name.encode() + b"\0"
+        if dtype == pl.Utf8:
+            size = lengths[name] + 1
+            code, fmt, values = 0x02, f"i{size}s", [pl.lit(size, pl.Int32), pl.col(name).cast(pl.Binary)]
+        elif dtype == pl.Float64:
+            code, fmt, values = 0x01, "d", [pl.col(name)]
+        elif dtype == pl.Boolean:
+            code, fmt, values = 0x08, "?", [pl.col(name)]
+        elif isinstance(dtype, pl.Datetime):
+            code, fmt, values = 0x09, "q", [pl.col(name).dt.epoch("ms")]
+        elif dtype.is_integer():
+            code, fmt = (0x10, "i") if int32[name] else (0x12, "q")
+            values = [pl.col(name)]
+        else:
+            raise TypeError(f"Cannot encode column {name!r} of type {dtype} as BSON")
+        parts.append(f"{len(key) + 1}s{fmt}")
+        exprs += [pl.lit(bytes([code]) + key), *values]
+
+    document = struct.Struct(f"<i{''.join(parts)}x")
+    exprs = [pl.lit(document.size, pl.Int32), *exprs]
+    return document, [expr.alias(f"__{i}") for i, expr in enumerate(exprs)]
+
+
+def encode_klines(frame: pl.DataFrame) -> list[RawBSONDocument]:
+    """
+    Codifica cada fila de un frame ya validado (sin `aggtrades`) como
+    documento BSON, en el orden del frame y con los mismos bytes que
+    `bson.encode` del dict de la fila.
+    """
+    if frame.is_empty():
+        return []
+    ints = [name for name, dtype in frame.schema.items() if dtype.is_integer()]
+    strings = [name for name, dtype in frame.schema.items() if dtype == pl.Utf8]
+    shape = {
+        **{f"__int32 {name}": pl.col(name).is_between(*INT32_RANGE) for name in ints},
+        **{f"__len {name}": pl.col(name).str.len_bytes() for name in strings},
+    }
+    keyed = frame.with_columns(pl.int_range(pl.len()).alias("__row"), **shape)
+
+    docs: list[RawBSONDocument] = [None] * frame.height
+    for group in keyed.partition_by(list(shape), maintain_order=True) if shape else [keyed]:
+        first = group.row(0, named=True)
+        document, exprs = _template(
+            frame.schema,
+            {name: first[f"__int32 {name}"] for name in ints},
+            {name: first[f"__len {name}"] for name in strings},
+        )
+        for row, values in zip(group["__row"], group.select(exprs).iter_rows()):
+            docs[row] = RawBSONDocument(document.pack(*values))
+    return docs
+
+
+def frame_watermarks(frame: pl.DataFrame) -> list[dict]:
+    """Equivalente columnar de `compute_watermarks`."""
+    marks = frame.group_by("symbol", "interval").agg(
+        pl.col("open_time").max().alias("last_open_time"),
+        pl.col("aggtrades").list.eval(pl.element().struct.field("agg_trade_id").max())
+        .list.first().max().alias("last_agg_trade_id"),
+    )
+    return marks.to_dicts()
+
+
+async def load_frame(df: pl.DataFrame) -> dict:
+    """Upsert directo del frame de transform, sin pasar por pydantic/Beanie."""
+    frame = to_kline_frame(df)
+    klines, aggtrades = split_aggtrades(frame)
+    await get_db()
+
+    report = await partitioned_upsert(
+        encode_klines(klines),
+        filters=klines.select(KLINE_KEY).to_dicts(),
+    )
+    report["aggtrades"] = (await load_aggtrades(aggtrades))["inserted"] if aggtrades.height else 0
+    if not frame.is_empty():
+        await refresh_rollups(touched_ranges(klines.select("symbol", "open_time").iter_rows()))
+        await advance_watermarks(frame_watermarks(frame))
+    return report
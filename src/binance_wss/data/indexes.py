@@ -0,0 +1,216 @@
+"""
+Índices de las velas y comprobación de planes con explain().
+
+`check` lanza contra el mongod configurado cada forma de consulta de la
+API (`GET /klines`, `/klines/stats/count`, los tramos de los KPIs y los
+aggTrades de una vela) con explain() en las velas 1m (o sus particiones),
+los rollups y los aggTrades, y falla si algún plan ganador tiene un
+COLLSCAN o un SORT en memoria. Los órdenes de `GET /klines` sin índice (ver
+`in_memory_sort`) se ordenan en memoria a propósito: se informan en
+`known` y no cuentan como fallo. Sale con código 1 si alguna falla, así que
+sirve como prueba de regresión tras tocar índices o consultas:
+
+    python -m binance_wss.data.indexes check
+    python -m binance_wss.data.indexes sync [--drop-stale]
+
+`sync` crea los índices de los modelos (y los de cada partición) y, con
+`--drop-stale`, borra los que ya no están en el conjunto (Beanie no borra
+índices al iniciar).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterator
+
+from binance_wss.app.db import get_db
+from binance_wss.app.models.mongo_models import KLINE_SORT_FIELDS, SYMBOL_SORT_FIELDS, AggTradeEvent, Kline
+from binance_wss.app.services.partition_service import INDICES, PartitionService
+from binance_wss.app.services.rollup_service import ROLLUPS, RollupService, fecha_a_ms
+
+logger = logging.getLogger(__name__)
+
+# etapas que indican que la consulta no está cubierta por un índice
+BAD_STAGES = {"COLLSCAN", "SORT", "$sort"}
+
+LIST_LIMIT = 100
+
+
+def stages(plan: Any) -> Iterator[str]:
+    """
+    Nombres de las etapas de un explain(): las `stage` del plan ganador
+    (find clásico o SBE) y las etapas de agregación (`$cursor`, `$sort`,
+    `$_internalUnpackBucket`... de las colecciones time-series). Los planes
+    rechazados no cuentan.
+    """
+    if isinstance(plan, dict):
+        for key, value in plan.items():
+            if key in ("rejectedPlans", "allPlansExecution", "slotBasedPlan"):
+                continue
+            if key == "stage" and isinstance(value, str):
+                yield value
+            elif key == "stages" and isinstance(value, list):
+                for step in value:
+                    if isinstance(step, dict):
+                        yield from (name for name in step if name.startswith("$"))
+                    yield from stages(step)
+            else:
+                yield from stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from stages(item)
+
+
+def in_memory_sort(query: dict, sort: list | None) -> bool:
+    """
+    Orden de `GET /klines` que ningún índice sigue: cualquier campo de
+    `KLINE_SORT_FIELDS` salvo open_time, o los de `SYMBOL_SORT_FIELDS` sin
+    filtrar por symbol. Se resuelve con un SORT en memoria acotado por el
+    límite de la página.
+    """
+    if not sort:
+        return False
+    field = sort[0][0]
+    return field != "open_time" and not ("symbol" in query and field in SYMBOL_SORT_FIELDS)
+
+
+def shapes(symbol: str, start: datetime, end: datetime) -> list[tuple[str, dict, list | None, int | None]]:
+    """
+    Formas de consulta sobre velas (1m o rollup): (nombre, filtro, orden,
+    límite). Las mismas que arman `list_klines` (con cada `sort_by` que acepta),
+    `get_count` y los tramos de KPIs de `RollupService.parciales_tramo` y
+    `RollupService.velas_1m` (vía `RollupService.consulta`).
+    """
+    rango = {"$gte": start, "$lte": end}
+    tramo_symbol = RollupService.consulta(symbol, fecha_a_ms(start), fecha_a_ms(end))
+    tramo = RollupService.consulta(None, fecha_a_ms(start), fecha_a_ms(end))
+    return [
+        ("klines", {}, [("open_time", -1)], LIST_LIMIT),
+        ("klines symbol", {"symbol": symbol}, [("open_time", -1)], LIST_LIMIT),
+        ("klines symbol asc", {"symbol": symbol}, [("open_time", 1)], LIST_LIMIT),
+        ("klines rango", {"open_time": rango}, [("open_time", -1)], LIST_LIMIT),
+        ("klines symbol rango", {"symbol": symbol, "open_time": rango}, [("open_time", -1)], LIST_LIMIT),
+        *[
+            shape
+            for field in KLINE_SORT_FIELDS if field != "open_time"
+            for shape in (
+                (f"klines {field}", {}, [(field, -1)], LIST_LIMIT),
+                (f"klines symbol {field}", {"symbol": symbol}, [(field, -1)], LIST_LIMIT),
+                (f"klines symbol {field} asc", {"symbol": symbol}, [(field, 1)], LIST_LIMIT),
+                (f"klines symbol rango {field}", {"symbol": symbol, "open_time": rango}, [(field, -1)], LIST_LIMIT),
+            )
+        ],
+        ("count symbol rango", {"symbol": symbol, "open_time": rango}, None, None),
+        ("kpis tramo symbol", tramo_symbol, None, None),
+        ("kpis tramo", tramo, None, None),
+    ]
+
+
+async def explain(collection, query: dict, sort: list | None = None, limit: int | None = None) -> dict:
+    cursor = collection.find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    if limit:
+        cursor = cursor.limit(limit)
+    return await cursor.explain()
+
+
+async def check(symbol: str = "BTCUSDT", days: int = 7) -> dict:
+    """
+    Lanza cada forma con explain() y devuelve {"checked", "failed",
+    "failures", "known"} con las etapas prohibidas de cada consulta que
+    falla; las de `in_memory_sort` van a `known`.
+    """
+    await get_db()
+    end = datetime.now(timezone.utc).replace(tzinfo=None, second=0, microsecond=0)
+    start = end - timedelta(days=days)
+
+    # colecciones de velas: las particiones del rango (o la colección única) y los rollups
+    names = await PartitionService.particiones(symbol, fecha_a_ms(start), fecha_a_ms(end) + 1)
+    if not names:
+        # base vacía: se crea la partición del símbolo con sus índices
+        names = [PartitionService.nombre(symbol, start)]
+        await PartitionService.asegurar(names[0])
+    collections = [(name, PartitionService.coleccion(name)) for name in names]
+    collections += [(interval, RollupService.coleccion(interval).get_pymongo_collection()) for interval in ROLLUPS]
+
+    cases = [
+        (f"{label} [{name}]", collection, query, sort, limit)
+        for name, collection in collections
+        for label, query, sort, limit in shapes(symbol, start, end)
+    ]
+    # trades de una vela / de un rango de velas: symbol + timestamp, por timestamp
+    trades = {"symbol": symbol, "timestamp": {"$gte": start, "$lt": end}}
+    cases.append(("aggtrades symbol rango [aggtrades]", AggTradeEvent.get_pymongo_collection(), trades, [("timestamp", 1)], None))
+
+    plans = await asyncio.gather(*[explain(collection, query, sort, limit) for _, collection, query, sort, limit in cases])
+
+    failures, known = [], []
+    for (label, _, query, sort, _), plan in zip(cases, plans):
+        bad = sorted(set(stages(plan)) & BAD_STAGES)
+        if bad and in_memory_sort(query, sort):
+            known.append({"query": label, "stages": bad})
+        elif bad:
+            failures.append({"query": label, "stages": bad})
+            logger.error("%s: %s (filter %s, sort %s)", label, ", ".join(bad), query, sort)
+    return {"checked": len(cases), "failed": len(failures), "failures": failures, "known": known}
+
+
+def _key(pairs) -> tuple:
+    return tuple((field, int(direction)) for field, direction in pairs)
+
+
+async def sync(drop_stale: bool = False) -> dict:
+    """
+    Crea los índices de los modelos y de las particiones existentes. Con
+    `drop_stale` borra de las velas, sus particiones y los rollups los
+    índices que no están en el conjunto actual.
+    """
+    await get_db()
+    names = await PartitionService.existentes(refrescar=True)
+    for name in names:
+        await PartitionService.coleccion(name).create_indexes(INDICES)
+
+    expected = {name: INDICES for name in names}
+    expected[Kline.get_collection_name()] = INDICES
+    for interval in ROLLUPS:
+        document = RollupService.coleccion(interval)
+        expected[document.get_collection_name()] = document.Settings.indexes
+
+    dropped = []
+    if drop_stale:
+        database = Kline.get_pymongo_collection().database
+        for name, models in expected.items():
+            keep = {_key(model.document["key"].items()) for model in models}
+            collection = database[name]
+            for index_name, index in (await collection.index_information()).items():
+                if index_name != "_id_" and _key(index["key"]) not in keep:
+                    await collection.drop_index(index_name)
+                    dropped.append(f"{name}.{index_name}")
+                    logger.info("Dropped stale index %s.%s", name, index_name)
+
+    return {"partitions": len(names), "dropped": dropped}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Índices de las velas y comprobación de planes")
+    sub = parser.add_subparsers(dest="command", required=True)
+    check_parser = sub.add_parser("check", help="explain() de cada forma de consulta; falla con COLLSCAN o SORT")
+    check_parser.add_argument("--symbol", default="BTCUSDT")
+    check_parser.add_argument("--days", type=int, default=7)
+    sync_parser = sub.add_parser("sync", help="Crear los índices (y borrar los que sobran con --drop-stale)")
+    sync_parser.add_argument("--drop-stale", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "check":
+        report = asyncio.run(check(args.symbol, args.days))
+        print(json.dumps(report))
+        sys.exit(1 if report["failed"] else 0)
+    print(json.dumps(asyncio.run(sync(args.drop_stale))))
+
+
+if __name__ == "__main__":
+    main()
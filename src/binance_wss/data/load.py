@@ -1,14 +1,21 @@
 # binance_wss/load/mongo_loader.py
 
 import asyncio
-import nest_asyncio
+import logging
 import polars as pl
 
 from datetime import datetime, timezone
-from binance_wss.app.db import get_db
-from binance_wss.app.models.mongo_models import Kline, AggTrade
+from binance_wss.app.db import close_db, get_db
+from binance_wss.app.models.mongo_models import Kline
+from binance_wss.app.settings import settings
+from pymongo.errors import ConnectionFailure
 
-nest_asyncio.apply()
+from binance_wss.data import fast_load, spool
+from binance_wss.data.aggtrades import explode_rows, trade_partials
+from binance_wss.data.staging import cleanup, read_frame
+from binance_wss.data.watermark import upsert_with_watermarks
+
+logger = logging.getLogger(__name__)
 
 def to_datetime_ms(value):
     """
@@ -22,25 +29,58 @@ def to_datetime_ms(value):
     raise TypeError(f"Don't convert to datetime: {value} ({type(value)})")
 
 def load_to_mongo_task(**context):
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(load_to_mongo(**context))
+    # el worker de Airflow no tiene un loop corriendo: se crea uno por ejecución
+    return asyncio.run(_run_load(**context))
+
+
+async def _run_load(**context):
+    try:
+        return await load_to_mongo(**context)
+    finally:
+        # el cliente queda ligado a este loop, que termina con la task
+        close_db()
 
 
 async def load_to_mongo(**context):
     """
     Task de carga (L de ETL):
     - Inicializa la conexión a Mongo/Beanie.
-    - Lee del XCom lo que devolvió el task 'transform' (lista[dict]).
-    - Construye instancias de Kline y las inserta en la colección.
-    """
-    db = await get_db()
+    - Lee del XCom la ruta que devolvió el task 'transform' y carga el
+      archivo de staging.
+    - Construye instancias de Kline y las escribe con upserts masivos por
+      (symbol, interval, open_time), así que reintentar la task no duplica
+      velas. Los aggTrades van a la colección time-series `aggtrades`.
+      Después avanza el watermark de cada símbolo.
+    - Antes reproduce lo que haya quedado en el spool local; si Mongo no
+      responde, el frame se añade al spool y la task termina sin error.
 
+    Devuelve la profundidad del spool (queda en el XCom de la task).
+    """
     ti = context["ti"]
-    rows = ti.xcom_pull(task_ids="transform")
+    ref = ti.xcom_pull(task_ids="transform")  # ruta de staging o None
+
+    frame = read_frame(ref) if ref else None
+    try:
+        await spool.drain(load_frame)
+        if frame is not None:
+            report = await load_frame(frame)
+            logger.info("Loaded klines: %s", report)
+    except ConnectionFailure as e:
+        if frame is None:
+            raise
+        logger.error("MongoDB unavailable (%s): spooling %d rows", e, frame.height)
+        spool.append(frame)
+
+    depth = spool.depth()
+    logger.info("Spool depth: %s", depth)
+
+    # cargado o en el spool: la carpeta de staging de la ejecución ya no hace falta
+    if ref:
+        cleanup(ref)
+    return depth
 
-    if not rows:
-        return
 
+def build_klines(rows: list[dict]) -> list[Kline]:
     records: list[Kline] = []
 
     for row in rows:
@@ -61,9 +101,29 @@ async def load_to_mongo(**context):
             "number_of_trades": int(row["number_of_trades"]),
             "taker_buy_base_asset_volume": float(row["taker_buy_base_asset_volume"]),
             "taker_buy_quote_asset_volume": float(row["taker_buy_quote_asset_volume"]),
-            "aggtrades": row.get("aggtrades", [])
+            **trade_partials(row.get("aggtrades") or []),
         }
         records.append(Kline(**kline_data))
 
-    if records:
-        await Kline.insert_many(records)
+    return records
+
+
+async def load_frame(df: pl.DataFrame) -> dict:
+    """Carga el frame de transform por el camino rápido o el de Beanie según `LOAD_FAST_PATH`."""
+    if settings.LOAD_FAST_PATH:
+        return await fast_load.load_frame(df)
+    return await load_rows(df.to_dicts())
+
+
+async def load_rows(rows: list[dict]) -> dict:
+    """
+    Carga las filas que produce transform: las velas por upsert y sus
+    aggTrades en la colección time-series. Devuelve el reporte del upsert:
+    velas insertadas, actualizadas, docs/sec y aggTrades nuevos.
+    """
+    if not rows:
+        return {"docs": 0, "inserted": 0, "updated": 0, "modified": 0, "seconds": 0.0, "docs_per_sec": 0.0, "aggtrades": 0}
+
+    await get_db()
+    klines = build_klines(rows)
+    return await upsert_with_watermarks(klines, explode_rows(rows))
@@ -0,0 +1,104 @@
+"""
+Migra los aggTrades embebidos en `Kline.aggtrades` a la colección
+time-series `aggtrades`.
+
+Recorre por lotes las velas que todavía tienen el array, inserta sus
+trades (solo los que no estén ya, igual que el loader) y después hace
+`$unset` del array en esas velas. Si se interrumpe basta con relanzarlo:
+las velas ya migradas no tienen el campo y no se vuelven a leer.
+
+Al migrar también se guardan en cada vela sus parciales de aggTrades
+(conteos de compradores/vendedores y cantidad). Para velas migradas antes
+de existir esos campos, `--recount` los recalcula desde la colección
+`aggtrades`. En ambos casos después hay que reconstruir los rollups.
+
+Uso:
+    python -m binance_wss.data.migrate_aggtrades --batch-size 500
+    python -m binance_wss.data.migrate_aggtrades --dry-run
+    python -m binance_wss.data.migrate_aggtrades --recount
+    python -m binance_wss.data.rollups rebuild
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+from binance_wss.app.db import get_db
+from binance_wss.app.models.mongo_models import Kline
+from pymongo import UpdateOne
+
+from binance_wss.data.aggtrades import load_aggtrades, recount_partials, trade_partials
+
+logger = logging.getLogger(__name__)
+
+
+async def migrate(batch_size: int = 500, dry_run: bool = False, recount: bool = False) -> dict:
+    await get_db()
+    if recount:
+        await recount_partials()
+        return {"recounted": True}
+
+    collection = Kline.get_pymongo_collection()
+    pending = {"aggtrades": {"$exists": True}}
+
+    report = {"klines": 0, "aggtrades": 0, "inserted": 0}
+    if dry_run:
+        report["klines"] = await collection.count_documents(pending)
+        counted = await Kline.aggregate([
+            {"$match": pending},
+            {"$group": {"_id": None, "n": {"$sum": {"$size": {"$ifNull": ["$aggtrades", []]}}}}},
+        ]).to_list()
+        report["aggtrades"] = counted[0]["n"] if counted else 0
+        return report
+
+    t0 = time.perf_counter()
+    while True:
+        docs = await collection.find(
+            pending, {"symbol": 1, "aggtrades": 1}
+        ).limit(batch_size).to_list(None)
+        if not docs:
+            break
+
+        trades = [
+            {"symbol": doc["symbol"], **trade}
+            for doc in docs
+            for trade in doc["aggtrades"] or []
+        ]
+        if trades:
+            report["inserted"] += (await load_aggtrades(trades))["inserted"]
+
+        # solo se quita el array cuando sus trades ya están en la colección nueva;
+        # a la vez se guardan en la vela sus parciales de aggTrades
+        await collection.bulk_write([
+            UpdateOne(
+                {"_id": doc["_id"]},
+                {"$unset": {"aggtrades": ""}, "$set": trade_partials(doc["aggtrades"] or [])},
+            )
+            for doc in docs
+        ], ordered=False)
+        report["klines"] += len(docs)
+        report["aggtrades"] += len(trades)
+        logger.info("Migrated %d klines, %d aggtrades", report["klines"], report["aggtrades"])
+
+    report["seconds"] = round(time.perf_counter() - t0, 2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrar aggTrades embebidos a la colección time-series")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="Solo contar lo pendiente")
+    parser.add_argument(
+        "--recount",
+        action="store_true",
+        help="Recalcular los parciales de aggTrades de las velas desde la colección `aggtrades`",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(asyncio.run(migrate(args.batch_size, args.dry_run, args.recount))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Escritura de velas 1m en colecciones particionadas (`KLINE_PARTITIONING`).
+
+El loader agrupa cada lote por la partición de cada vela (símbolo y/o mes,
+ver `PartitionService`) y hace el upsert de cada grupo en su colección, con
+los grupos en paralelo. Con "none" es un `bulk_upsert` sobre la colección
+de `Kline`, igual que antes.
+
+Para repartir en particiones las velas de la colección única:
+    python -m binance_wss.data.partitions migrate --batch-size 5000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+from binance_wss.app.db import get_db
+from binance_wss.app.models.mongo_models import Kline
+from binance_wss.app.services.partition_service import PartitionService
+from binance_wss.app.settings import settings
+from binance_wss.data.upsert import KLINE_KEY, bulk_upsert
+
+logger = logging.getLogger(__name__)
+
+
+async def partitioned_upsert(docs: list, filters: list[dict] | None = None, batch_size: int | None = None) -> dict:
+    """
+    `bulk_upsert` de velas por (symbol, interval, open_time) en su partición.
+    Si se pasan `filters` (la clave de cada doc) la partición se lee de ellos.
+    Devuelve el reporte de `bulk_upsert` sumado sobre las particiones.
+    """
+    if not PartitionService.activo():
+        return await bulk_upsert(Kline.get_pymongo_collection(), docs, filters=filters, batch_size=batch_size)
+
+    keys = filters if filters is not None else [{field: doc[field] for field in KLINE_KEY} for doc in docs]
+    groups: dict[str, tuple[list, list]] = {}
+    for doc, key in zip(docs, keys):
+        group = groups.setdefault(PartitionService.nombre(key["symbol"], key["open_time"]), ([], []))
+        group[0].append(doc)
+        group[1].append(key)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[PartitionService.asegurar(name) for name in groups])
+    reports = await asyncio.gather(*[
+        bulk_upsert(PartitionService.coleccion(name), group_docs, filters=group_keys, batch_size=batch_size)
+        for name, (group_docs, group_keys) in groups.items()
+    ])
+    elapsed = time.perf_counter() - t0
+
+    report = {"docs": len(docs)}
+    for field in ("inserted", "updated", "modified"):
+        report[field] = sum(r[field] for r in reports)
+    report["partitions"] = len(groups)
+    report["seconds"] = round(elapsed, 3)
+    report["docs_per_sec"] = round(len(docs) / elapsed, 1) if elapsed else 0.0
+    return report
+
+
+async def migrate(batch_size: int = 5000) -> dict:
+    """
+    Copia las velas de la colección de `Kline` a sus particiones. Es un
+    upsert, así que se puede relanzar; la colección original no se toca.
+    """
+    await get_db()
+    if not PartitionService.activo():
+        raise ValueError("KLINE_PARTITIONING is 'none': nothing to migrate")
+
+    collection = Kline.get_pymongo_collection()
+    report = {"klines": 0, "partitions": set()}
+    last_id = None
+    t0 = time.perf_counter()
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        docs = await collection.find(query).sort("_id", 1).limit(batch_size).to_list(None)
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+        for doc in docs:
+            doc.pop("_id")
+            report["partitions"].add(PartitionService.nombre(doc["symbol"], doc["open_time"]))
+
+        await partitioned_upsert(docs)
+        report["klines"] += len(docs)
+        logger.info("Migrated %d klines", report["klines"])
+
+    return {
+        "klines": report["klines"],
+        "partitions": len(report["partitions"]),
+        "mode": settings.KLINE_PARTITIONING,
+        "seconds": round(time.perf_counter() - t0, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Velas 1m en colecciones particionadas")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = sub.add_parser("migrate", help="Copiar la colección única a las particiones")
+    migrate_parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(asyncio.run(migrate(args.batch_size))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Cliente REST asíncrono para Binance con control de peso (rate limit).
+
+Binance limita las peticiones por peso usado en la ventana del minuto actual
+y lo informa en la cabecera `X-MBX-USED-WEIGHT-1M`. Ante un exceso responde
+429 (o 418 si se insiste) con `Retry-After`. `WeightBudget` lleva la cuenta
+de ese presupuesto y `BinanceREST` la respeta antes de cada petición.
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Optional
+
+import aiohttp
+
+from binance_wss.app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Peso de cada endpoint usado (https://developers.binance.com/docs/binance-spot-api-docs/rest-api)
+ENDPOINT_WEIGHTS = {
+    "/api/v3/klines": 2,
+    "/api/v3/aggTrades": 4,
+    "/api/v3/exchangeInfo": 20,
+}
+
+DEFAULT_WEIGHT_LIMIT = 6000
+
+
+class BinanceAPIError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Binance API error {status}: {message}")
+        self.status = status
+
+
+class _Cell:
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+
+class WeightBudget:
+    """
+    Presupuesto de peso por minuto compartido por todas las peticiones.
+
+    `reserve` descuenta el peso antes de enviar, `observe` sincroniza con el
+    peso que reporta Binance y `block` congela todo el tráfico tras un 429/418.
+    """
+
+    def __init__(self, limit: int = DEFAULT_WEIGHT_LIMIT, safety: float = 0.9):
+        self.limit = int(limit * safety)
+        self._lock = threading.Lock()
+        self._window = _Cell(0)
+        self._used = _Cell(0)
+        self._blocked_until = _Cell(0.0)
+
+    def reserve(self, weight: int) -> float:
+        """Reserva `weight`; devuelve 0 si se puede enviar ya o los segundos a esperar."""
+        with self._lock:
+            now = time.time()
+            if now < self._blocked_until.value:
+                return self._blocked_until.value - now
+
+            window = int(now // 60)
+            if window != self._window.value:
+                self._window.value = window
+                self._used.value = 0
+
+            if self._used.value + weight > self.limit:
+                return (window + 1) * 60 - now + 0.05
+
+            self._used.value += weight
+            return 0.0
+
+    def observe(self, used_weight: int):
+        with self._lock:
+            if int(time.time() // 60) == self._window.value:
+                self._used.value = max(self._used.value, used_weight)
+
+    def block(self, seconds: float):
+        with self._lock:
+            self._blocked_until.value = max(self._blocked_until.value, time.time() + seconds)
+
+
+class SharedWeightBudget(WeightBudget):
+    """
+    `WeightBudget` en memoria compartida para varios procesos.
+
+    Todos los workers de un pool descuentan del mismo presupuesto, así el
+    límite de peso de la IP se respeta globalmente. Se pasa a los workers
+    en `initargs` del pool.
+    """
+
+    def __init__(self, ctx, limit: int = DEFAULT_WEIGHT_LIMIT, safety: float = 0.9):
+        self.limit = int(limit * safety)
+        self._lock = ctx.Lock()
+        self._window = ctx.Value("q", 0, lock=False)
+        self._used = ctx.Value("q", 0, lock=False)
+        self._blocked_until = ctx.Value("d", 0.0, lock=False)
+
+
+class BinanceREST:
+    """
+    Sesión HTTP reutilizable (pool de conexiones) con concurrencia acotada
+    y respeto del presupuesto de peso de Binance.
+
+    Uso:
+        async with BinanceREST() as rest:
+            data = await rest.get("/api/v3/klines", {"symbol": "ETHUSDT", "interval": "1m"})
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        budget: Optional[WeightBudget] = None,
+        max_concurrency: int = 10,
+        max_retries: int = 5,
+        timeout: float = 30.0,
+    ):
+        base_url = (base_url or settings.BINANCE_API_BASE_URL).rstrip("/")
+        self.base_url = base_url.removesuffix("/api")
+        self.budget = budget or WeightBudget(settings.BINANCE_WEIGHT_LIMIT)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.requests = 0
+        self._sem = asyncio.Semaphore(max_concurrency)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self):
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_concurrency, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._session.close()
+
+    async def _acquire(self, weight: int):
+        while True:
+            wait = self.budget.reserve(weight)
+            if wait <= 0:
+                return
+            logger.info("Weight budget exhausted, waiting %.2fs", wait)
+            await asyncio.sleep(wait)
+
+    async def get(self, path: str, params: Optional[dict] = None, weight: Optional[int] = None) -> Any:
+        weight = weight if weight is not None else ENDPOINT_WEIGHTS.get(path, 1)
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+        url = f"{self.base_url}{path}"
+
+        for attempt in range(self.max_retries + 1):
+            async with self._sem:
+                await self._acquire(weight)
+                try:
+                    async with self._session.get(url, params=params) as resp:
+                        self.requests += 1
+                        used = resp.headers.get("X-MBX-USED-WEIGHT-1M") or resp.headers.get("X-MBX-USED-WEIGHT")
+                        if used:
+                            self.budget.observe(int(used))
+
+                        if resp.status in (429, 418):
+                            retry_after = float(resp.headers.get("Retry-After", 60))
+                            logger.warning("Rate limited (%s), retrying after %.0fs", resp.status, retry_after)
+                            self.budget.block(retry_after)
+                            continue
+
+                        if resp.status >= 500:
+                            error = BinanceAPIError(resp.status, await resp.text())
+                        elif resp.status >= 400:
+                            raise BinanceAPIError(resp.status, await resp.text())
+                        else:
+                            return await resp.json()
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    error = e
+
+            logger.warning("Request %s failed (%s), attempt %d", path, error, attempt + 1)
+            await asyncio.sleep(min(2 ** attempt, 30))
+
+        raise BinanceAPIError(-1, f"{path} failed after {self.max_retries + 1} attempts")
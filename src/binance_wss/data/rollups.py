@@ -0,0 +1,289 @@
+"""
+Mantenimiento incremental de los rollups de velas (5m, 15m, 1h, 1d).
+
+Tras cargar un lote de velas 1m se recalculan, para cada símbolo y cada
+intervalo, solo los buckets que el lote tocó: una agregación sobre las
+velas 1m de esos buckets que escribe el resultado con `$merge` (reemplazo
+por (symbol, open_time)). Recalcular en lugar de sumar deltas hace que
+recargar una ventana sea idempotente y que un bucket parcial se complete
+solo cuando llegan sus velas.
+
+Los días con partición en la capa fría (`archive`) ya no tienen todas sus
+velas en Mongo: sus buckets se recalculan con Polars a partir de las velas
+de Mongo más las archivadas (gana Mongo) y se escriben por upsert, para no
+reemplazar un bucket completo con solo las velas recargadas.
+
+Cada recálculo avanza también el `DataWatermark` de los símbolos tocados,
+con el que la API invalida su caché de KPIs.
+
+Para construir los rollups de velas cargadas antes de existir:
+    python -m binance_wss.data.rollups rebuild [SYMBOL ...]
+"""
+import argparse
+import asyncio
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Iterable
+
+import polars as pl
+from pymongo import ReplaceOne, UpdateOne
+
+from binance_wss.app.db import get_db
+from binance_wss.app.models.mongo_models import DataWatermark
+from binance_wss.app.services.partition_service import PartitionService
+from binance_wss.app.services.rollup_service import ROLLUPS, fecha_a_ms
+from binance_wss.data import archive
+
+logger = logging.getLogger(__name__)
+
+# rebuild por tramos de 30 días (múltiplo de todos los buckets)
+REBUILD_CHUNK_MS = 30 * 86_400_000
+
+# volatilidad de una vela 1m, igual que KPIService: (high - low) / low * 100
+VOLATILITY_EXPR = {
+    "$cond": [
+        {"$gt": ["$low_price", 0]},
+        {"$multiply": [{"$divide": [{"$subtract": ["$high_price", "$low_price"]}, "$low_price"]}, 100]},
+        0,
+    ]
+}
+
+
+ROLLUP_FIELDS = (
+    "close_time", "open_price", "close_price", "high_price", "low_price",
+    "volume", "quote_asset_volume", "number_of_trades",
+    "taker_buy_base_asset_volume", "taker_buy_quote_asset_volume",
+    "kline_count", "volatility_sum", "volatility_max",
+    "aggtrade_count", "aggtrade_buyer_count", "aggtrade_seller_count", "aggtrade_quantity",
+)
+
+
+# columnas de las velas 1m con las que se calcula un bucket
+SOURCE_SCHEMA = {"symbol": pl.Utf8, **{
+    field: dtype for field, dtype in archive.KLINE_ARCHIVE_SCHEMA.items() if field != "interval"
+}}
+
+
+def _ms_to_datetime(value: int) -> datetime:
+    return datetime.fromtimestamp(value / 1000.0, tz=timezone.utc)
+
+
+def touched_ranges(rows: Iterable[tuple[str, datetime]]) -> dict[str, tuple[int, int]]:
+    """{symbol: (min open_time, max open_time)} en epoch ms de un lote de velas 1m."""
+    ranges: dict[str, tuple[int, int]] = {}
+    for symbol, open_time in rows:
+        ms = fecha_a_ms(open_time)
+        low, high = ranges.get(symbol, (ms, ms))
+        ranges[symbol] = (min(low, ms), max(high, ms))
+    return ranges
+
+
+def _source_match(symbol: str, start_ms: int, end_ms: int) -> dict:
+    """Velas 1m de `symbol` con open_time en [start_ms, end_ms)."""
+    return {"$match": {
+        "symbol": symbol,
+        "interval": "1m",
+        "open_time": {"$gte": _ms_to_datetime(start_ms), "$lt": _ms_to_datetime(end_ms)},
+    }}
+
+
+def rollup_pipeline(interval: str, symbol: str, start_ms: int, end_ms: int) -> list[dict]:
+    """Recalcula los buckets de `interval` en [start_ms, end_ms) y los escribe con $merge."""
+    document, bucket_ms = ROLLUPS[interval]
+    open_ms = {"$toLong": "$open_time"}
+
+    return [
+        _source_match(symbol, start_ms, end_ms),
+        {"$sort": {"open_time": 1}},
+        {"$group": {
+            "_id": {"$toDate": {"$subtract": [open_ms, {"$mod": [open_ms, bucket_ms]}]}},
+            "close_time": {"$max": "$close_time"},
+            "open_price": {"$first": "$open_price"},
+            "close_price": {"$last": "$close_price"},
+            "high_price": {"$max": "$high_price"},
+            "low_price": {"$min": "$low_price"},
+            "volume": {"$sum": "$volume"},
+            "quote_asset_volume": {"$sum": "$quote_asset_volume"},
+            "number_of_trades": {"$sum": "$number_of_trades"},
+            "taker_buy_base_asset_volume": {"$sum": "$taker_buy_base_asset_volume"},
+            "taker_buy_quote_asset_volume": {"$sum": "$taker_buy_quote_asset_volume"},
+            "kline_count": {"$sum": 1},
+            "volatility_sum": {"$sum": VOLATILITY_EXPR},
+            "volatility_max": {"$max": VOLATILITY_EXPR},
+            # velas cargadas antes de tener los parciales de aggTrades cuentan como 0
+            **{
+                field: {"$sum": {"$ifNull": [f"${field}", 0]}}
+                for field in ("aggtrade_count", "aggtrade_buyer_count", "aggtrade_seller_count", "aggtrade_quantity")
+            },
+        }},
+        {"$project": {
+            "_id": 0,
+            "symbol": {"$literal": symbol},
+            "interval": {"$literal": interval},
+            "open_time": "$_id",
+            **{field: 1 for field in ROLLUP_FIELDS},
+        }},
+        {"$merge": {
+            "into": document.get_collection_name(),
+            "on": ["symbol", "open_time"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }},
+    ]
+
+
+def rollup_frame(interval: str, candles: pl.DataFrame) -> pl.DataFrame:
+    """Lo mismo que `rollup_pipeline` sobre un frame de velas 1m (columnas `SOURCE_SCHEMA`)."""
+    bucket_ms = ROLLUPS[interval][1]
+    open_ms = pl.col("open_time").dt.epoch("ms")
+    low, high = pl.col("low_price"), pl.col("high_price")
+    volatility = pl.when(low > 0).then((high - low) / low * 100).otherwise(0.0)
+
+    return (
+        candles.sort("open_time")
+        .group_by("symbol", (open_ms - open_ms % bucket_ms).cast(pl.Datetime("ms")).alias("open_time"), maintain_order=True)
+        .agg(
+            pl.col("close_time").max(),
+            pl.col("open_price").first(),
+            pl.col("close_price").last(),
+            high.max(),
+            low.min(),
+            pl.col("volume", "quote_asset_volume", "number_of_trades",
+                   "taker_buy_base_asset_volume", "taker_buy_quote_asset_volume").sum(),
+            pl.len().cast(pl.Int64).alias("kline_count"),
+            volatility.sum().alias("volatility_sum"),
+            volatility.max().alias("volatility_max"),
+            pl.col("aggtrade_count", "aggtrade_buyer_count", "aggtrade_seller_count").fill_null(0).sum(),
+            pl.col("aggtrade_quantity").fill_null(0.0).sum(),
+        )
+        .select("symbol", pl.lit(interval).alias("interval"), "open_time", *ROLLUP_FIELDS)
+    )
+
+
+async def refresh_archived(interval: str, symbol: str, start_ms: int, end_ms: int):
+    """
+    Recalcula los buckets de `interval` en [start_ms, end_ms), días con
+    partición archivada, con las velas de Mongo más las de la capa fría que
+    no están en Mongo, y los escribe por upsert en (symbol, open_time).
+    """
+    document, _ = ROLLUPS[interval]
+    pipeline = [
+        _source_match(symbol, start_ms, end_ms),
+        {"$project": {"_id": 0, **{field: 1 for field in SOURCE_SCHEMA}}},
+    ]
+    rows, cold = await asyncio.gather(
+        PartitionService.agregar(symbol, start_ms, end_ms, pipeline),
+        asyncio.to_thread(archive.read_kline_frame, symbol, start_ms, end_ms, list(SOURCE_SCHEMA)),
+    )
+    hot = pl.from_dicts(rows, schema=SOURCE_SCHEMA) if rows else pl.DataFrame(schema=SOURCE_SCHEMA)
+    cold = cold.cast(SOURCE_SCHEMA).join(hot.select("open_time"), on="open_time", how="anti")
+
+    ops = [
+        ReplaceOne({"symbol": bucket["symbol"], "open_time": bucket["open_time"]}, bucket, upsert=True)
+        for bucket in rollup_frame(interval, pl.concat([hot, cold])).iter_rows(named=True)
+    ]
+    if ops:
+        await document.get_pymongo_collection().bulk_write(ops, ordered=False)
+
+
+def archived_segments(symbol: str, start_ms: int, end_ms: int) -> list[tuple[int, int, bool]]:
+    """Parte [start_ms, end_ms) por días en tramos (inicio, fin, archivado) consecutivos."""
+    segments: list[tuple[int, int, bool]] = []
+    day = start_ms - start_ms % archive.DAY_MS
+    while day < end_ms:
+        archived = archive.partition_path("klines", symbol, _ms_to_datetime(day).date()).exists()
+        low, high = max(start_ms, day), min(end_ms, day + archive.DAY_MS)
+        if segments and segments[-1][2] == archived:
+            segments[-1] = (segments[-1][0], high, archived)
+        else:
+            segments.append((low, high, archived))
+        day += archive.DAY_MS
+    return segments
+
+
+async def refresh_rollups(ranges: dict[str, tuple[int, int]]):
+    """
+    Recalcula en todos los intervalos los buckets que tocan `ranges` (de
+    `touched_ranges`). Con velas particionadas cada pipeline corre en las
+    particiones del rango: un bucket (como mucho un día) nunca cruza dos.
+    Por lo mismo los días archivados se pueden separar del resto
+    (`refresh_archived`).
+    """
+    runs = []
+    for symbol, (first_open, last_open) in ranges.items():
+        for interval, (_, bucket_ms) in ROLLUPS.items():
+            start = first_open - first_open % bucket_ms
+            end = last_open - last_open % bucket_ms + bucket_ms
+            for low, high, archived in archived_segments(symbol, start, end):
+                if archived:
+                    runs.append(refresh_archived(interval, symbol, low, high))
+                else:
+                    runs.append(PartitionService.agregar(symbol, low, high, rollup_pipeline(interval, symbol, low, high)))
+
+    await asyncio.gather(*runs)
+    await bump_data_watermarks(ranges)
+    logger.info("Refreshed rollups for %d symbols", len(ranges))
+
+
+async def bump_data_watermarks(ranges: dict[str, tuple[int, int]]):
+    """
+    Avanza el `DataWatermark` de cada símbolo tocado: `newest` con el
+    máximo open_time escrito y `epoch` + 1 si el lote reescribe velas en
+    o antes de la más nueva que ya había (no es solo un append).
+    """
+    if not ranges:
+        return
+    now = datetime.now(timezone.utc)
+    updates = []
+    for symbol, (first_open, last_open) in ranges.items():
+        first, last = _ms_to_datetime(first_open), _ms_to_datetime(last_open)
+        epoch = {"$ifNull": ["$epoch", 0]}
+        updates.append(UpdateOne({"symbol": symbol}, [{"$set": {
+            # en un mismo $set, "$newest" y "$epoch" son los valores previos
+            "epoch": {"$cond": [{"$lte": [first, "$newest"]}, {"$add": [epoch, 1]}, epoch]},
+            "newest": {"$max": ["$newest", last]},
+            "updated_at": now,
+        }}], upsert=True))
+    await DataWatermark.get_pymongo_collection().bulk_write(updates, ordered=False)
+
+
+async def rebuild(symbols: list[str] | None = None) -> dict:
+    """Recalcula todos los rollups a partir de las velas 1m guardadas."""
+    await get_db()
+    match = {"interval": "1m"}
+    if symbols:
+        match["symbol"] = {"$in": symbols}
+
+    # un resultado por símbolo y partición: se juntan por símbolo
+    bounds: dict[str, tuple[int, int]] = {}
+    for bound in await PartitionService.agregar(None, None, None, [
+        {"$match": match},
+        {"$group": {"_id": "$symbol", "first": {"$min": "$open_time"}, "last": {"$max": "$open_time"}}},
+    ]):
+        first, last = fecha_a_ms(bound["first"]), fecha_a_ms(bound["last"])
+        known = bounds.get(bound["_id"], (first, last))
+        bounds[bound["_id"]] = (min(known[0], first), max(known[1], last))
+
+    chunks = 0
+    for symbol, (first, last) in bounds.items():
+        for start in range(first - first % REBUILD_CHUNK_MS, last + 1, REBUILD_CHUNK_MS):
+            await refresh_rollups({symbol: (start, min(start + REBUILD_CHUNK_MS, last + 1) - 1)})
+            chunks += 1
+
+    return {"symbols": len(bounds), "chunks": chunks}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rollups de velas 5m/15m/1h/1d")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = sub.add_parser("rebuild", help="Recalcular los rollups desde las velas 1m")
+    rebuild_parser.add_argument("symbols", nargs="*")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(asyncio.run(rebuild(args.symbols or None))))
+
+
+if __name__ == "__main__":
+    main()
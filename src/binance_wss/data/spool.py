@@ -0,0 +1,279 @@
+"""
+Spool local de escritura anticipada para el load.
+
+Si Mongo no responde (tras los reintentos por lote), el load añade el frame
+de transform al final de `SPOOL_DIR/spool.log` en lugar de fallar, y la task
+termina bien sin volver a extraer. Cada registro es
+
+    [longitud del payload: u64][crc32: u32][filas: u32][payload: Arrow IPC stream]
+
+con big-endian, y se escribe con fsync. Un registro incompleto al final
+(caída a mitad de escritura) se detecta por la longitud y se ignora.
+
+El drenado rota `spool.log` a un segmento `segment-<ns>.spool`, lo reproduce
+en lotes grandes (`SPOOL_DRAIN_BATCH_ROWS` filas) con el mismo `load_frame`
+y guarda tras cada lote el offset ya cargado. Reproducir un registro dos
+veces (caída entre el load y el offset) no duplica nada: las velas son
+upserts por (symbol, interval, open_time), los aggTrades se deduplican por
+`agg_trade_id` y los watermarks avanzan con `$max`.
+
+Un registro completo con crc distinto no se salta ni se borra: el drenado
+carga lo anterior, guarda el offset y aparta el segmento como
+`segment-<ns>.corrupt` (con su `.offset`) para revisarlo a mano; `status`
+los cuenta en `quarantined`.
+
+Uso:
+    python -m binance_wss.data.spool status
+    python -m binance_wss.data.spool drain
+"""
+import argparse
+import asyncio
+import fcntl
+import io
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+import polars as pl
+
+from binance_wss.app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct(">QII")
+ACTIVE = "spool.log"
+
+
+def _dir() -> Path:
+    path = Path(settings.SPOOL_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+@contextmanager
+def _locked(name: str, blocking: bool = True):
+    """flock exclusivo sobre `SPOOL_DIR/<name>`; si no bloquea y está tomado, devuelve False."""
+    with open(_dir() / name, "a") as handle:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def append(frame: pl.DataFrame) -> dict:
+    """Añade un frame al spool activo (durable al volver). Devuelve la profundidad."""
+    buffer = io.BytesIO()
+    frame.write_ipc_stream(buffer)
+    payload = buffer.getvalue()
+
+    with _locked("append.lock"):
+        _truncate_torn(_dir() / ACTIVE)
+        with open(_dir() / ACTIVE, "ab") as handle:
+            handle.write(HEADER.pack(len(payload), zlib.crc32(payload), frame.height))
+            handle.write(payload)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    logger.warning("Spooled %d rows (%d bytes)", frame.height, len(payload))
+    return depth()
+
+
+def _headers(path: Path, offset: int = 0) -> Iterator[tuple[int, int, int, int]]:
+    """(offset, longitud, crc, filas) de cada registro completo a partir de `offset`."""
+    size = path.stat().st_size
+    with open(path, "rb") as handle:
+        handle.seek(offset)
+        while offset + HEADER.size <= size:
+            length, crc, rows = HEADER.unpack(handle.read(HEADER.size))
+            if offset + HEADER.size + length > size:
+                break
+            yield offset, length, crc, rows
+            handle.seek(length, os.SEEK_CUR)
+            offset += HEADER.size + length
+
+
+class CorruptRecord(Exception):
+    """Registro con crc distinto en `offset`: el segmento no se puede leer más allá."""
+
+    def __init__(self, path: Path, offset: int):
+        super().__init__(f"Corrupt spool record at {path.name}:{offset}")
+        self.offset = offset
+
+
+def _truncate_torn(path: Path):
+    # un append que se cayó a medias dejaría ilegibles los registros siguientes
+    if not path.exists():
+        return
+    end = 0
+    for start, length, _, _ in _headers(path):
+        end = start + HEADER.size + length
+    if end < path.stat().st_size:
+        logger.warning("Truncating torn spool tail at %s:%d", path.name, end)
+        os.truncate(path, end)
+
+
+def read_records(path: Path, offset: int = 0) -> Iterator[tuple[int, pl.DataFrame]]:
+    """
+    (offset tras el registro, frame) de cada registro a partir de `offset`.
+    Lanza `CorruptRecord` al llegar a uno con crc distinto.
+    """
+    with open(path, "rb") as handle:
+        for start, length, crc, _ in _headers(path, offset):
+            handle.seek(start + HEADER.size)
+            payload = handle.read(length)
+            if zlib.crc32(payload) != crc:
+                raise CorruptRecord(path, start)
+            yield start + HEADER.size + length, pl.read_ipc_stream(io.BytesIO(payload))
+
+
+def _offset_path(segment: Path) -> Path:
+    return segment.with_suffix(".offset")
+
+
+def _committed(segment: Path) -> int:
+    path = _offset_path(segment)
+    return int(path.read_text()) if path.exists() else 0
+
+
+def _commit(segment: Path, offset: int):
+    path = _offset_path(segment)
+    tmp = path.with_suffix(".offset.tmp")
+    tmp.write_text(str(offset))
+    os.replace(tmp, path)
+
+
+def _segments() -> list[Path]:
+    return sorted(_dir().glob("segment-*.spool"))
+
+
+def depth() -> dict:
+    """
+    Registros, filas y bytes pendientes (spool activo + segmentos sin
+    drenar) y segmentos apartados por un registro corrupto.
+    """
+    report = {
+        "segments": 0, "records": 0, "rows": 0, "bytes": 0, "oldest_seconds": 0.0,
+        "quarantined": len(list(_dir().glob("segment-*.corrupt"))),
+    }
+    files = [(segment, _committed(segment)) for segment in _segments()]
+    active = _dir() / ACTIVE
+    if active.exists():
+        files.append((active, 0))
+
+    oldest = None
+    for path, offset in files:
+        pending = list(_headers(path, offset))
+        if not pending:
+            continue
+        report["segments"] += 1
+        report["records"] += len(pending)
+        report["rows"] += sum(rows for *_, rows in pending)
+        report["bytes"] += sum(HEADER.size + length for _, length, _, _ in pending)
+        mtime = path.stat().st_mtime
+        oldest = mtime if oldest is None else min(oldest, mtime)
+
+    if oldest is not None:
+        report["oldest_seconds"] = round(time.time() - oldest, 1)
+    return report
+
+
+def _rotate():
+    # con el lock de escritura tomado ningún append queda a medias en el segmento
+    with _locked("append.lock"):
+        active = _dir() / ACTIVE
+        if active.exists() and active.stat().st_size:
+            os.replace(active, _dir() / f"segment-{time.time_ns()}.spool")
+
+
+async def drain(load_frame, batch_rows: int | None = None) -> dict:
+    """
+    Reproduce todo lo pendiente en el spool, en orden, con `load_frame`
+    (la corrutina de carga de `load`). Si otro proceso está drenando, no
+    hace nada. Un error al cargar se propaga y deja el offset en el último
+    lote confirmado. Un segmento con un registro corrupto se carga hasta
+    ese registro y se aparta como `.corrupt`.
+    """
+    batch_rows = batch_rows or settings.SPOOL_DRAIN_BATCH_ROWS
+    report = {"records": 0, "rows": 0, "batches": 0, "quarantined": 0}
+
+    with _locked("drain.lock", blocking=False) as acquired:
+        if not acquired:
+            return {**report, "skipped": True}
+
+        _rotate()
+        for segment in _segments():
+            frames, rows, end, corrupt = [], 0, _committed(segment), None
+            try:
+                for end, frame in read_records(segment, end):
+                    frames.append(frame)
+                    rows += frame.height
+                    report["records"] += 1
+                    if rows >= batch_rows:
+                        await load_frame(pl.concat(frames, how="vertical_relaxed"))
+                        _commit(segment, end)
+                        report["rows"] += rows
+                        report["batches"] += 1
+                        frames, rows = [], 0
+            except CorruptRecord as e:
+                corrupt = e
+            if frames:
+                await load_frame(pl.concat(frames, how="vertical_relaxed"))
+                report["rows"] += rows
+                report["batches"] += 1
+
+            if corrupt:
+                # lo de después del registro corrupto no se pierde: el segmento
+                # queda apartado con el offset de lo ya cargado
+                _commit(segment, end)
+                os.replace(segment, segment.with_suffix(".corrupt"))
+                report["quarantined"] += 1
+                logger.error("%s: quarantined as %s", corrupt, segment.with_suffix(".corrupt").name)
+                continue
+
+            segment.unlink()
+            _offset_path(segment).unlink(missing_ok=True)
+            logger.info("Drained spool segment %s", segment.name)
+
+    if report["records"]:
+        logger.info("Spool drained: %s", report)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spool local del load")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="Profundidad del spool")
+    drain_parser = sub.add_parser("drain", help="Reproducir el spool en Mongo")
+    drain_parser.add_argument("--batch-rows", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "status":
+        print(json.dumps(depth()))
+        return
+
+    from binance_wss.app.db import close_db
+    from binance_wss.data.load import load_frame
+
+    async def _drain():
+        try:
+            return await drain(load_frame, args.batch_rows)
+        finally:
+            close_db()
+
+    print(json.dumps(asyncio.run(_drain())))
+
+
+if __name__ == "__main__":
+    main()
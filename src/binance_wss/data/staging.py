@@ -0,0 +1,57 @@
+"""
+Almacenamiento intermedio columnar entre las tasks del ETL.
+
+Cada task escribe sus DataFrames como Arrow IPC (o Parquet) en
+`ETL_STAGING_DIR/<dag_id>/<run_id>/` y por XCom solo viaja la ruta. La
+siguiente task los lee con memory-map, sin serializar fila a fila a JSON
+en la base de metadatos de Airflow.
+"""
+import re
+import shutil
+import uuid
+from pathlib import Path
+
+import polars as pl
+
+from binance_wss.app.settings import settings
+
+
+def run_dir(context: dict | None = None) -> Path:
+    """Carpeta de staging de la ejecución del DAG (o una nueva si no hay contexto)."""
+    base = Path(settings.ETL_STAGING_DIR)
+    if context and context.get("run_id"):
+        dag_id = context["dag"].dag_id if context.get("dag") else "dag"
+        run_id = re.sub(r"[^A-Za-z0-9_.-]", "_", str(context["run_id"]))
+        path = base / dag_id / run_id
+    else:
+        path = base / "adhoc" / uuid.uuid4().hex
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def write_frame(df: pl.DataFrame, directory: Path, name: str) -> str:
+    if settings.ETL_STAGING_FORMAT == "parquet":
+        path = directory / f"{name}.parquet"
+        df.write_parquet(path)
+    else:
+        path = directory / f"{name}.arrow"
+        df.write_ipc(path, compression="uncompressed")
+    return str(path)
+
+
+def read_frame(path: str | list[str]) -> pl.DataFrame:
+    """Lee uno o varios archivos de staging (IPC con memory-map, sin copia)."""
+    paths = [path] if isinstance(path, str) else path
+    if not paths:
+        return pl.DataFrame()
+
+    frames = [
+        pl.read_parquet(p) if p.endswith(".parquet") else pl.read_ipc(p, memory_map=True)
+        for p in paths
+    ]
+    return frames[0] if len(frames) == 1 else pl.concat(frames, how="vertical_relaxed")
+
+
+def cleanup(path: str):
+    """Borra la carpeta de staging de una ejecución ya cargada."""
+    shutil.rmtree(Path(path).parent, ignore_errors=True)
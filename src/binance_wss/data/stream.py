@@ -0,0 +1,406 @@
+"""
+Ingesta en tiempo real desde los combined streams de Binance.
+
+Se suscribe a `<symbol>@kline_<interval>` y `<symbol>@aggTrade` para muchos
+símbolos repartidos en pocas conexiones multiplexadas, agrupa los aggTrades
+en su vela y escribe las velas cerradas por lotes en la colección de `Kline`.
+
+Uso:
+    python -m binance_wss.data.stream run BTCUSDT ETHUSDT BNBUSDT
+    python -m binance_wss.data.stream record frames.jsonl BTCUSDT --count 500
+    python -m binance_wss.data.stream replay frames.jsonl --port 8765
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+from websockets.asyncio.client import connect
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+from binance_wss.app.db import get_db
+from binance_wss.app.models.mongo_models import Kline
+from binance_wss.app.settings import settings
+from binance_wss.data.aggtrades import explode_rows, trade_partials
+from binance_wss.data.watermark import upsert_with_watermarks
+
+logger = logging.getLogger(__name__)
+
+INTERVAL_MS = {
+    "1m": 60_000,
+    "3m": 3 * 60_000,
+    "5m": 5 * 60_000,
+    "15m": 15 * 60_000,
+    "30m": 30 * 60_000,
+    "1h": 60 * 60_000,
+}
+
+# Binance admite hasta 1024 streams por conexión
+MAX_STREAMS_PER_CONNECTION = 1024
+
+
+def _ms_to_datetime(value: int) -> datetime:
+    return datetime.fromtimestamp(value / 1000.0, tz=timezone.utc)
+
+
+async def write_klines(rows: list[dict]):
+    """Sink por defecto: upsert del lote de velas cerradas y avance de sus watermarks."""
+    await get_db()
+    rows = [dict(row) for row in rows]  # el ingester puede re-encolar el lote si falla
+    aggtrades = explode_rows(rows)
+    await upsert_with_watermarks([Kline(**row) for row in rows], aggtrades)
+
+
+class StreamIngester:
+    """
+    Ingestor de larga duración sobre los combined streams de Binance.
+
+    - Reparte los streams en conexiones de hasta `streams_per_connection`.
+    - Reconecta con backoff exponencial cuando la conexión se cae.
+    - Detecta huecos en las velas cerradas (open_time) y en los aggTrades
+      (agg_trade_id) y los registra en `gaps` (y en `on_gap` si se indica).
+    - Acumula las velas cerradas (dicts con el esquema de `Kline`) y las
+      escribe por lotes mediante `sink`.
+    - Un frame ilegible se registra en el log y en `bad_frames` y se salta.
+    """
+
+    def __init__(
+        self,
+        symbols: list[str],
+        interval: str = "1m",
+        base_url: Optional[str] = None,
+        streams_per_connection: int = 200,
+        batch_size: int = 100,
+        flush_interval: float = 5.0,
+        close_grace: float = 2.0,
+        max_backoff: float = 60.0,
+        sink: Optional[Callable[[list[dict]], Awaitable[None]]] = None,
+        on_gap: Optional[Callable[[dict], None]] = None,
+    ):
+        if interval not in INTERVAL_MS:
+            raise ValueError(f"Unsupported interval: {interval}")
+        if not 2 <= streams_per_connection <= MAX_STREAMS_PER_CONNECTION:
+            raise ValueError(
+                f"streams_per_connection must be between 2 and {MAX_STREAMS_PER_CONNECTION}"
+            )
+
+        self.symbols = [s.upper() for s in symbols]
+        self.interval = interval
+        self.interval_ms = INTERVAL_MS[interval]
+        self.base_url = (base_url or settings.BINANCE_WS_BASE_URL).rstrip("/")
+        self.streams_per_connection = streams_per_connection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.close_grace = close_grace
+        self.max_backoff = max_backoff
+        self.sink = sink or write_klines
+        self.on_gap = on_gap
+
+        self.gaps: list[dict] = []
+        self.reconnects = 0
+        self.written = 0
+        self.bad_frames = 0
+
+        # symbol -> open_time(ms) -> aggtrades de esa vela
+        self._pending_trades: dict[str, dict[int, list[dict]]] = defaultdict(lambda: defaultdict(list))
+        # velas cerradas esperando `close_grace` por aggTrades rezagados
+        self._closing: list[tuple[float, dict]] = []
+        self._batch: list[dict] = []
+        self._last_open: dict[str, int] = {}
+        self._last_agg_id: dict[str, int] = {}
+        self._stop = asyncio.Event()
+
+    # ---------- Conexiones ----------
+
+    def stream_names(self, symbols: list[str]) -> list[str]:
+        names = []
+        for symbol in symbols:
+            s = symbol.lower()
+            names.append(f"{s}@kline_{self.interval}")
+            names.append(f"{s}@aggTrade")
+        return names
+
+    def connection_urls(self) -> list[str]:
+        """Reparte los símbolos en URLs de combined stream (2 streams por símbolo)."""
+        per_conn = self.streams_per_connection // 2
+        urls = []
+        for i in range(0, len(self.symbols), per_conn):
+            streams = self.stream_names(self.symbols[i:i + per_conn])
+            urls.append(f"{self.base_url}/stream?streams={'/'.join(streams)}")
+        return urls
+
+    async def _run_connection(self, url: str):
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                async with connect(url, ping_interval=20, ping_timeout=20, max_queue=1024) as ws:
+                    logger.info("Connected to %s", url[:120])
+                    backoff = 1.0
+                    async for raw in ws:
+                        try:
+                            await self.handle_message(json.loads(raw))
+                        except Exception:
+                            # un frame malformado o inesperado no tumba la conexión
+                            self.bad_frames += 1
+                            logger.exception("Skipping unreadable frame: %.200r", raw)
+                        if self._stop.is_set():
+                            return
+            except (ConnectionClosed, OSError, asyncio.TimeoutError) as e:
+                logger.warning("Stream connection lost (%s), reconnecting in %.1fs", e, backoff)
+
+            if self._stop.is_set():
+                return
+            self.reconnects += 1
+            # Binance corta las conexiones a las 24h: siempre se reconecta
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=backoff)
+            except asyncio.TimeoutError:
+                pass
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def _run_flusher(self):
+        last_flush = time.monotonic()
+        tick = min(self.flush_interval, self.close_grace) or 0.5
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=tick)
+            except asyncio.TimeoutError:
+                pass
+            self._finalize_due(time.monotonic())
+            now = time.monotonic()
+            if len(self._batch) >= self.batch_size or now - last_flush >= self.flush_interval:
+                await self.flush()
+                last_flush = now
+
+    async def run(self):
+        tasks = [asyncio.create_task(self._run_connection(url)) for url in self.connection_urls()]
+        tasks.append(asyncio.create_task(self._run_flusher()))
+        stopper = asyncio.create_task(self._stop.wait())
+        try:
+            done, _ = await asyncio.wait(tasks + [stopper], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is not stopper and task.exception():
+                    raise task.exception()
+        finally:
+            self._stop.set()
+            for task in tasks + [stopper]:
+                task.cancel()
+            await asyncio.gather(*tasks, stopper, return_exceptions=True)
+            # Al parar se escribe todo lo pendiente
+            self._finalize_due(float("inf"))
+            await self.flush()
+
+    def stop(self):
+        self._stop.set()
+
+    # ---------- Mensajes ----------
+
+    async def handle_message(self, message: dict):
+        data = message.get("data", message)
+        event = data.get("e")
+
+        if event == "aggTrade":
+            self._on_aggtrade(data)
+        elif event == "kline":
+            self._on_kline(data)
+
+        if len(self._batch) >= self.batch_size:
+            await self.flush()
+
+    def _record_gap(self, gap: dict):
+        logger.warning("Gap detected: %s", gap)
+        self.gaps.append(gap)
+        if self.on_gap:
+            self.on_gap(gap)
+
+    def _on_aggtrade(self, data: dict):
+        symbol = data["s"]
+        agg_id = int(data["a"])
+
+        last = self._last_agg_id.get(symbol)
+        if last is not None:
+            if agg_id <= last:
+                return  # duplicado (p.ej. tras reconectar)
+            if agg_id > last + 1:
+                self._record_gap({
+                    "type": "aggTrade",
+                    "symbol": symbol,
+                    "from_id": last + 1,
+                    "to_id": agg_id - 1,
+                })
+        self._last_agg_id[symbol] = agg_id
+
+        ts = int(data["T"])
+        kline_open = ts - ts % self.interval_ms
+        self._pending_trades[symbol][kline_open].append({
+            "agg_trade_id": agg_id,
+            "price": float(data["p"]),
+            "quantity": float(data["q"]),
+            "first_trade_id": int(data["f"]),
+            "last_trade_id": int(data["l"]),
+            "timestamp": _ms_to_datetime(ts),
+            "is_buyer_maker": bool(data["m"]),
+            "is_best_match": bool(data.get("M", True)),
+        })
+
+    def _on_kline(self, data: dict):
+        k = data["k"]
+        if not k["x"]:
+            return  # solo se guardan velas cerradas
+
+        symbol = k["s"]
+        open_ms = int(k["t"])
+
+        last = self._last_open.get(symbol)
+        if last is not None:
+            if open_ms <= last:
+                return
+            if open_ms > last + self.interval_ms:
+                self._record_gap({
+                    "type": "kline",
+                    "symbol": symbol,
+                    "interval": self.interval,
+                    "from_open_time": last + self.interval_ms,
+                    "to_open_time": open_ms - self.interval_ms,
+                })
+        self._last_open[symbol] = open_ms
+
+        self._closing.append((time.monotonic() + self.close_grace, k))
+
+    def _finalize_due(self, now: float):
+        """Pasa al lote las velas cerradas cuyo periodo de gracia ya pasó."""
+        due = [k for deadline, k in self._closing if deadline <= now]
+        if not due:
+            return
+        self._closing = [(deadline, k) for deadline, k in self._closing if deadline > now]
+
+        for k in due:
+            symbol = k["s"]
+            open_ms = int(k["t"])
+            pending = self._pending_trades[symbol]
+            trades = pending.pop(open_ms, [])
+            # trades de velas que nunca cerraron (hueco) ya no se pueden asignar
+            for stale in [t for t in pending if t < open_ms]:
+                del pending[stale]
+            self._batch.append(self._build_kline(k, trades))
+
+    def _build_kline(self, k: dict, trades: list[dict]) -> dict:
+        return {
+            "open_time": _ms_to_datetime(int(k["t"])),
+            "close_time": _ms_to_datetime(int(k["T"])),
+            "symbol": k["s"],
+            "interval": k["i"],
+            "open_price": float(k["o"]),
+            "close_price": float(k["c"]),
+            "high_price": float(k["h"]),
+            "low_price": float(k["l"]),
+            "volume": float(k["v"]),
+            "quote_asset_volume": float(k["q"]),
+            "number_of_trades": int(k["n"]),
+            "taker_buy_base_asset_volume": float(k["V"]),
+            "taker_buy_quote_asset_volume": float(k["Q"]),
+            "aggtrades": sorted(trades, key=lambda t: t["agg_trade_id"]),
+            **trade_partials(trades),
+        }
+
+    async def flush(self):
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        try:
+            await self.sink(batch)
+            self.written += len(batch)
+        except Exception:
+            logger.exception("Failed to write %d klines, keeping them for the next flush", len(batch))
+            self._batch = batch + self._batch
+
+
+# ---------- Grabación y réplica de frames ----------
+
+async def record_frames(path: str, symbols: list[str], count: int, interval: str = "1m", base_url: Optional[str] = None):
+    """Graba `count` frames crudos del combined stream en un archivo JSONL."""
+    ingester = StreamIngester(symbols, interval=interval, base_url=base_url)
+    url = ingester.connection_urls()[0]
+    with open(path, "w", encoding="utf-8") as f:
+        async with connect(url) as ws:
+            for _ in range(count):
+                f.write(await ws.recv() + "\n")
+
+
+async def serve_replay(path: str, host: str = "127.0.0.1", port: int = 8765, delay: float = 0.0, close_after: bool = False):
+    """
+    Servidor WebSocket local que sustituye a Binance y re-emite frames grabados.
+
+    Cada conexión recibe los frames del archivo JSONL en orden. Con
+    `close_after=True` cierra la conexión al terminar, lo que permite
+    probar la reconexión y el descarte de duplicados del ingestor.
+    """
+    frames = [line for line in Path(path).read_text(encoding="utf-8").splitlines() if line.strip()]
+
+    async def handler(ws):
+        for frame in frames:
+            await ws.send(frame)
+            if delay:
+                await asyncio.sleep(delay)
+        if close_after:
+            await ws.close()
+        else:
+            await ws.wait_closed()
+
+    return await serve(handler, host, port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingesta de combined streams de Binance")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_p = sub.add_parser("run", help="Ingestar streams en Mongo")
+    run_p.add_argument("symbols", nargs="+")
+    run_p.add_argument("--interval", default="1m")
+    run_p.add_argument("--base-url", default=None)
+    run_p.add_argument("--streams-per-connection", type=int, default=200)
+    run_p.add_argument("--batch-size", type=int, default=100)
+    run_p.add_argument("--flush-interval", type=float, default=5.0)
+
+    rec_p = sub.add_parser("record", help="Grabar frames crudos a JSONL")
+    rec_p.add_argument("path")
+    rec_p.add_argument("symbols", nargs="+")
+    rec_p.add_argument("--count", type=int, default=500)
+    rec_p.add_argument("--interval", default="1m")
+
+    rep_p = sub.add_parser("replay", help="Servidor local que re-emite frames grabados")
+    rep_p.add_argument("path")
+    rep_p.add_argument("--host", default="127.0.0.1")
+    rep_p.add_argument("--port", type=int, default=8765)
+    rep_p.add_argument("--delay", type=float, default=0.0)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "run":
+        ingester = StreamIngester(
+            args.symbols,
+            interval=args.interval,
+            base_url=args.base_url,
+            streams_per_connection=args.streams_per_connection,
+            batch_size=args.batch_size,
+            flush_interval=args.flush_interval,
+        )
+        asyncio.run(ingester.run())
+    elif args.command == "record":
+        asyncio.run(record_frames(args.path, args.symbols, args.count, args.interval))
+    elif args.command == "replay":
+        async def _replay():
+            server = await serve_replay(args.path, args.host, args.port, args.delay)
+            await server.serve_forever()
+        asyncio.run(_replay())
+
+
+if __name__ == "__main__":
+    main()
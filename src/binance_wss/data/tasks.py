@@ -0,0 +1,22 @@
+"""
+Callables de las tasks de Airflow.
+
+El scheduler importa el DAG cada pocos segundos, así que este módulo no
+importa nada pesado al cargarse: Polars, los clientes HTTP, Motor/Beanie y
+los settings se importan dentro de cada task, solo cuando se ejecuta.
+"""
+
+
+def extract_task(**context):
+    from .extract import extract_all
+    return extract_all(**context)
+
+
+def transform_task(**context):
+    from .transform import transform_merge
+    return transform_merge(**context)
+
+
+def load_task(**context):
+    from .load import load_to_mongo_task
+    return load_to_mongo_task(**context)
@@ -1,11 +1,35 @@
 import polars as pl
+from pathlib import Path
+from .staging import read_frame, write_frame
+
+AGGTRADE_SCHEMA = {
+    "agg_trade_id": pl.Int64,
+    "price": pl.Float64,
+    "quantity": pl.Float64,
+    "first_trade_id": pl.Int64,
+    "last_trade_id": pl.Int64,
+    "timestamp": pl.Int64,
+    "is_buyer_maker": pl.Boolean,
+    "is_best_match": pl.Boolean,
+}
 
 def transform_merge(**context):
     ti = context["ti"]  # get data from xcom
-    data = ti.xcom_pull(task_ids="extract")  # dict con "klines" y "aggtrades"
+    refs = ti.xcom_pull(task_ids="extract")  # rutas de staging de "klines" y "aggtrades"
+
+    klines = read_frame(refs["klines"])
+    if klines.is_empty():
+        return None
+
+    result_df = merge_klines_aggtrades(klines, read_frame(refs["aggtrades"]))
 
+    # por XCom solo viaja la ruta del resultado
+    return write_frame(result_df, Path(refs["klines"][0]).parent, "transformed")
+
+def merge_klines_aggtrades(klines: pl.DataFrame, aggtrades: pl.DataFrame) -> pl.DataFrame:
+    """Une las velas con sus aggTrades (frame plano con clave symbol, kline_open)."""
     # KLINES 
-    kline_df = pl.DataFrame(data["klines"])
+    kline_df = klines.drop("ignore", strict=False)
 
     kline_df = kline_df.cast({
         "open_time": pl.Int64,
@@ -27,48 +51,25 @@ def transform_merge(**context):
         pl.col("close_time").cast(pl.Datetime("ms")),
     )
 
-    # AGGTRADES
-    aggtrades_list = data["aggtrades"]
-
-    processed_aggtrades = []
-    kline_open_times = []
-
-    for item in aggtrades_list:
-        open_time = item["kline_open"]       # epoch ms
-        agg_rows = item["aggtrades"]         # lista[dict]
-
-        agg_df = pl.DataFrame(agg_rows).cast({
-            "agg_trade_id": pl.Int64,
-            "price": pl.Float64,
-            "quantity": pl.Float64,
-            "first_trade_id": pl.Int64,
-            "last_trade_id": pl.Int64,
-            "timestamp": pl.Int64,
-            "is_buyer_maker": pl.Boolean,
-            "is_best_match": pl.Boolean,
-        }).with_columns(
-            pl.col("timestamp").cast(pl.Datetime("ms"))
+    # AGGTRADES: un único frame plano (symbol, kline_open, trade...), casteado una vez
+    trade_columns = list(AGGTRADE_SCHEMA)
+    nested = (
+        aggtrades
+        .cast({"kline_open": pl.Int64, **AGGTRADE_SCHEMA})
+        .with_columns(
+            pl.col("kline_open").cast(pl.Datetime("ms")),
+            pl.col("timestamp").cast(pl.Datetime("ms")),
         )
-
-        # guardamos como lista[dict] para poder serializar en XCom / Mongo
-        processed_aggtrades.append(agg_df.to_dicts())
-        kline_open_times.append(open_time)
-
-    # DataFrame con la estructura por kline
-    agg_struct_df = pl.DataFrame({
-        "kline_open": kline_open_times,     # epoch ms
-        "aggtrades": processed_aggtrades,   # lista[dict]
-    }).with_columns(
-        pl.col("kline_open").cast(pl.Datetime("ms"))  
+        .group_by("symbol", "kline_open")
+        .agg(pl.struct(trade_columns).sort_by("agg_trade_id").alias("aggtrades"))
     )
 
-    # JOIN
+    # JOIN: velas sin trades quedan con lista vacía
     result_df = kline_df.join(
-        agg_struct_df,
-        left_on="open_time",
-        right_on="kline_open",
+        nested,
+        left_on=["symbol", "open_time"],
+        right_on=["symbol", "kline_open"],
         how="left",
-    )
+    ).with_columns(pl.col("aggtrades").fill_null([]))
 
-    # devolver algo JSON-serializable
-    return result_df.to_dicts()
+    return result_df
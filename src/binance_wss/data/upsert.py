@@ -0,0 +1,112 @@
+"""
+Carga idempotente por upsert masivo.
+
+Cada documento se escribe con `UpdateOne(clave, {"$set": doc}, upsert=True)`
+en lotes `bulk_write(ordered=False)`, con varios lotes en vuelo a la vez.
+La clave de las velas es (symbol, interval, open_time), respaldada por un
+índice único en `Kline`, así que reintentos de Airflow o ventanas solapadas
+actualizan la vela existente en lugar de duplicarla. Por lo mismo un lote
+que falla por un error de red se puede reintentar entero (`with_retry`).
+"""
+import asyncio
+import logging
+import time
+
+from pymongo import UpdateOne
+from pymongo.errors import ConnectionFailure, PyMongoError
+
+from binance_wss.app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+KLINE_KEY = ("symbol", "interval", "open_time")
+
+
+def _retryable(exc: PyMongoError) -> bool:
+    # AutoReconnect, NetworkTimeout, ServerSelectionTimeoutError, ... o errores marcados por el servidor
+    return isinstance(exc, ConnectionFailure) or exc.has_error_label("RetryableWriteError")
+
+
+async def with_retry(write, what: str = "batch"):
+    """
+    Ejecuta `write()` (una corrutina nueva por intento) reintentando los
+    errores transitorios hasta `LOAD_RETRIES` veces con backoff exponencial.
+    Solo para escrituras idempotentes.
+    """
+    attempts = max(settings.LOAD_RETRIES, 1)
+    for attempt in range(1, attempts + 1):
+        try:
+            return await write()
+        except PyMongoError as exc:
+            if attempt == attempts or not _retryable(exc):
+                raise
+            delay = settings.LOAD_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1)
+            logger.warning("%s failed (%s), retry %d/%d in %.1fs", what, exc, attempt, attempts - 1, delay)
+            await asyncio.sleep(delay)
+
+
+def upsert_ops(
+    docs: list[dict],
+    key: tuple[str, ...] = KLINE_KEY,
+    filters: list[dict] | None = None,
+) -> list[UpdateOne]:
+    # `filters` evita leer la clave de cada doc (p. ej. RawBSONDocument, que se decodificaría)
+    if filters is None:
+        filters = [{field: doc[field] for field in key} for doc in docs]
+    return [
+        UpdateOne(flt, {"$set": doc}, upsert=True)
+        for flt, doc in zip(filters, docs)
+    ]
+
+
+async def bulk_upsert(
+    collection,
+    docs: list[dict],
+    key: tuple[str, ...] = KLINE_KEY,
+    batch_size: int | None = None,
+    parallel: int | None = None,
+    filters: list[dict] | None = None,
+) -> dict:
+    """
+    Upsert de `docs` en `collection` por `key`. Si se pasan `filters`
+    (uno por doc, en el mismo orden) se usan en lugar de extraer la clave.
+
+    Los lotes se escriben concurrentemente (`parallel` en vuelo) y cada uno
+    se reintenta por separado ante errores de red.
+
+    Devuelve {"docs", "inserted", "updated", "modified", "seconds", "docs_per_sec"}:
+    `updated` son los documentos que ya existían (matched) y `modified` los
+    que además cambiaron de contenido.
+    """
+    batch_size = batch_size or settings.LOAD_BATCH_SIZE
+    parallel = parallel or settings.LOAD_PARALLEL_BATCHES
+
+    report = {"docs": len(docs), "inserted": 0, "updated": 0, "modified": 0}
+    sem = asyncio.Semaphore(parallel)
+
+    async def _write(batch: list[dict], batch_filters: list[dict] | None):
+        ops = upsert_ops(batch, key, batch_filters)
+        async with sem:
+            result = await with_retry(
+                lambda: collection.bulk_write(ops, ordered=False),
+                f"{collection.name} bulk_write",
+            )
+        report["inserted"] += result.upserted_count
+        report["updated"] += result.matched_count
+        report["modified"] += result.modified_count
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[
+        _write(docs[i:i + batch_size], filters[i:i + batch_size] if filters else None)
+        for i in range(0, len(docs), batch_size)
+    ])
+    elapsed = time.perf_counter() - t0
+
+    report["seconds"] = round(elapsed, 3)
+    report["docs_per_sec"] = round(len(docs) / elapsed, 1) if elapsed else 0.0
+    logger.info(
+        "%s: %d docs upserted (%d inserted, %d updated) in %.2fs (%.0f docs/s)",
+        collection.name, report["docs"], report["inserted"], report["updated"],
+        elapsed, report["docs_per_sec"],
+    )
+    return report
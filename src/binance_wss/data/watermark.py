@@ -0,0 +1,107 @@
+"""
+Watermarks de extracción por (symbol, interval).
+
+Guardan el `open_time` de la última vela cerrada cargada y el último
+`agg_trade_id`, para que cada ejecución pida a Binance solo el delta.
+Se avanzan después de escribir las velas: como la carga es un upsert
+idempotente, si algo falla entre ambos pasos la siguiente ejecución vuelve
+a cargar la misma ventana sin duplicar velas.
+"""
+from datetime import datetime, timezone
+from typing import Iterable
+
+from binance_wss.app.db import get_db
+from binance_wss.app.models.mongo_models import Kline, Watermark
+from binance_wss.data.aggtrades import load_aggtrades
+from binance_wss.data.rollups import refresh_rollups, touched_ranges
+from binance_wss.data.partitions import partitioned_upsert
+
+
+def datetime_to_ms(value: datetime) -> int:
+    # Mongo devuelve datetimes naive en UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+
+async def load_watermarks(symbols: list[str], interval: str = "1m") -> dict[str, dict]:
+    """
+    Devuelve {symbol: {"last_open_time": ms, "last_agg_trade_id": int | None}}
+    para los símbolos que ya tienen watermark.
+    """
+    await get_db()
+    docs = await Watermark.find(
+        {"symbol": {"$in": symbols}, "interval": interval}
+    ).to_list()
+
+    return {
+        doc.symbol: {
+            "last_open_time": datetime_to_ms(doc.last_open_time),
+            "last_agg_trade_id": doc.last_agg_trade_id,
+        }
+        for doc in docs
+    }
+
+
+def compute_watermarks(klines: Iterable[Kline], aggtrades: Iterable[dict] = ()) -> list[dict]:
+    """Watermark resultante de un lote de velas y sus trades: máximos por (symbol, interval)."""
+    marks: dict[tuple[str, str], dict] = {}
+    for kline in klines:
+        key = (kline.symbol, kline.interval)
+        mark = marks.setdefault(key, {
+            "symbol": kline.symbol,
+            "interval": kline.interval,
+            "last_open_time": kline.open_time,
+            "last_agg_trade_id": None,
+        })
+        mark["last_open_time"] = max(mark["last_open_time"], kline.open_time)
+
+    last_trade: dict[str, int] = {}
+    for aggtrade in aggtrades:
+        symbol = aggtrade["symbol"]
+        last_trade[symbol] = max(last_trade.get(symbol, aggtrade["agg_trade_id"]), aggtrade["agg_trade_id"])
+    for mark in marks.values():
+        mark["last_agg_trade_id"] = last_trade.get(mark["symbol"])
+    return list(marks.values())
+
+
+async def advance_watermarks(marks: list[dict], session=None):
+    """
+    Avanza los watermarks con `$max`, de modo que nunca retroceden aunque
+    se recargue una ventana antigua.
+    """
+    collection = Watermark.get_pymongo_collection()
+    now = datetime.now(timezone.utc)
+
+    for mark in marks:
+        update = {
+            "$max": {"last_open_time": mark["last_open_time"]},
+            "$set": {"updated_at": now},
+        }
+        if mark["last_agg_trade_id"] is not None:
+            update["$max"]["last_agg_trade_id"] = mark["last_agg_trade_id"]
+
+        await collection.update_one(
+            {"symbol": mark["symbol"], "interval": mark["interval"]},
+            update,
+            upsert=True,
+            session=session,
+        )
+
+
+async def upsert_with_watermarks(records: list[Kline], aggtrades: list[dict] | None = None) -> dict:
+    """
+    Upsert de las velas por (symbol, interval, open_time), carga de sus
+    aggTrades en la colección time-series, recálculo de los buckets de
+    rollup que tocan y avance de los watermarks.
+    """
+    await get_db()
+    aggtrades = aggtrades or []
+
+    docs = [record.model_dump(exclude={"id", "revision_id"}) for record in records]
+    report = await partitioned_upsert(docs)
+    report["aggtrades"] = (await load_aggtrades(aggtrades))["inserted"] if aggtrades else 0
+    if records:
+        await refresh_rollups(touched_ranges((record.symbol, record.open_time) for record in records))
+    await advance_watermarks(compute_watermarks(records, aggtrades))
+    return report
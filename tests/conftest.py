@@ -0,0 +1,54 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+import pytest
+
+# `Settings` exige estas variables; los tests no usan Binance ni el .env
+for name, value in {
+    "BINANCE_API_KEY": "test",
+    "BINANCE_API_SECRET_KEY": "test",
+    "BINANCE_API_BASE_URL": "http://127.0.0.1:9",
+    "MONGODB_URI": "mongodb://localhost:27017",
+    "MONGODB_DB_NAME": "binance_wss_test",
+    "MONGODB_COLLECTION_NAME": "klines",
+}.items():
+    os.environ.setdefault(name, value)
+
+TEST_MONGODB_URI = os.environ.get("TEST_MONGODB_URI", "mongodb://localhost:27017")
+
+
+@pytest.fixture
+def mongo():
+    """
+    Beanie contra un mongod real (TEST_MONGODB_URI) en una base desechable,
+    con un event loop propio: `mongo.run(corrutina)`. El test se salta si no
+    hay servidor.
+    """
+    from beanie import init_beanie
+    from pymongo import AsyncMongoClient, MongoClient
+    from pymongo.errors import PyMongoError
+
+    from binance_wss.app import db
+
+    probe = MongoClient(TEST_MONGODB_URI, serverSelectionTimeoutMS=500)
+    try:
+        probe.admin.command("ping")
+    except PyMongoError:
+        pytest.skip(f"no mongod at {TEST_MONGODB_URI}")
+    finally:
+        probe.close()
+
+    loop = asyncio.new_event_loop()
+    name = f"binance_wss_test_{os.getpid()}"
+    client = AsyncMongoClient(TEST_MONGODB_URI)
+    loop.run_until_complete(init_beanie(database=client[name], document_models=db.DOCUMENT_MODELS))
+    # get_db() devuelve esta base sin volver a inicializar
+    db._db_client, db._db_initialized = client, True
+
+    yield SimpleNamespace(db=client[name], run=loop.run_until_complete)
+
+    db._db_client, db._db_initialized = None, False
+    loop.run_until_complete(client.drop_database(name))
+    loop.run_until_complete(client.close())
+    loop.close()
@@ -0,0 +1,63 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+CHECK = ROOT / "airflow-local" / "check_dag_parse.py"
+
+# cada import en un intérprete limpio: el resto de tests ya cargó Polars, Motor...
+SCRIPT = """
+import importlib, importlib.util, json, sys, time
+
+spec = importlib.util.spec_from_file_location("check_dag_parse", {check!r})
+check = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(check)
+
+if {dag!r}:
+    # Airflow se importa antes: su coste no depende de nuestro DAG
+    import airflow
+    from airflow.operators.python import PythonOperator
+check._block_network()
+preloaded = {{name for name in check.HEAVY_MODULES if name in sys.modules}}
+
+t0 = time.perf_counter()
+if {dag!r}:
+    spec = importlib.util.spec_from_file_location("binance_etl_dag", check.DAG_FILE)
+    spec.loader.exec_module(importlib.util.module_from_spec(spec))
+else:
+    importlib.import_module("binance_wss.data.tasks")
+elapsed = time.perf_counter() - t0
+
+loaded = [name for name in check.HEAVY_MODULES if name in sys.modules and name not in preloaded]
+print(json.dumps({{"elapsed": elapsed, "budget": check.BUDGET_SECONDS, "loaded": loaded}}))
+"""
+
+
+def _parse(dag: bool) -> dict:
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([str(ROOT / "src"), os.environ.get("PYTHONPATH", "")])}
+    result = subprocess.run(
+        [sys.executable, "-c", SCRIPT.format(check=str(CHECK), dag=dag)],
+        env=env, capture_output=True, text=True,
+    )
+    # NetworkAccessError (o cualquier error del import) sale con código distinto de 0
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout)
+
+
+def _assert_cheap(report: dict):
+    assert not {"polars", "binance", "motor"} & set(report["loaded"]), report["loaded"]
+    assert report["loaded"] == []
+    assert report["elapsed"] < report["budget"], report
+
+
+def test_tasks_module_imports_without_network_or_heavy_modules():
+    _assert_cheap(_parse(dag=False))
+
+
+def test_dag_file_parses_within_budget():
+    pytest.importorskip("airflow")
+    _assert_cheap(_parse(dag=True))
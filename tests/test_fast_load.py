@@ -0,0 +1,104 @@
+from datetime import datetime, timezone
+
+import polars as pl
+import pytest
+from bson import decode, encode
+
+from binance_wss.app.models.mongo_models import Kline
+from binance_wss.data.aggtrades import split_aggtrades
+from binance_wss.data.fast_load import encode_klines, to_kline_frame
+from binance_wss.data.load import build_klines
+from binance_wss.data.transform import merge_klines_aggtrades
+
+T0 = 1_700_000_040_000 // 60_000 * 60_000
+
+
+def _transformed(klines: int = 3) -> pl.DataFrame:
+    """Frame de transform: velas crudas de Binance con sus aggTrades; la segunda sin trades."""
+    opens = [T0 + i * 60_000 for i in range(klines)]
+    raw = pl.DataFrame({
+        "open_time": opens, "open": ["100.5"] * klines, "high": ["102"] * klines,
+        "low": ["99.25"] * klines, "close": ["101"] * klines, "volume": ["2.5"] * klines,
+        "close_time": [t + 59_999 for t in opens], "quote_asset_volume": ["250"] * klines,
+        "number_of_trades": [3] * klines, "taker_buy_base_asset_volume": ["1"] * klines,
+        "taker_buy_quote_asset_volume": ["100"] * klines, "ignore": ["0"] * klines,
+        "symbol": ["BTCUSDT"] * klines, "interval": ["1m"] * klines,
+    })
+    trades = [(agg_id, minute) for minute in range(klines) if minute != 1 for agg_id in range(minute * 10, minute * 10 + 3)]
+    aggtrades = pl.DataFrame({
+        "symbol": ["BTCUSDT"] * len(trades),
+        "kline_open": [T0 + minute * 60_000 for _, minute in trades],
+        "agg_trade_id": [agg_id for agg_id, _ in trades],
+        "price": ["100.75"] * len(trades),
+        "quantity": ["0.25"] * len(trades),
+        "first_trade_id": [agg_id for agg_id, _ in trades],
+        "last_trade_id": [agg_id for agg_id, _ in trades],
+        "timestamp": [T0 + minute * 60_000 + agg_id for agg_id, minute in trades],
+        "is_buyer_maker": [agg_id % 2 == 0 for agg_id, _ in trades],
+        "is_best_match": [True] * len(trades),
+    })
+    return merge_klines_aggtrades(raw, aggtrades)
+
+
+def _fast_docs(df: pl.DataFrame) -> list[dict]:
+    klines, _ = split_aggtrades(to_kline_frame(df))
+    return [decode(doc.raw) for doc in encode_klines(klines)]
+
+
+def test_raw_docs_have_the_kline_fields_and_bson_types():
+    docs = _fast_docs(_transformed())
+
+    fields = {name: field.annotation for name, field in Kline.model_fields.items() if name not in ("id", "revision_id")}
+    for doc in docs:
+        assert set(doc) == set(fields)
+        # datetimes como fecha BSON, ints como enteros (no floats) y floats como double
+        assert {name: type(value) for name, value in doc.items()} == fields
+    assert [doc["aggtrade_count"] for doc in docs] == [3, 0, 3]
+    assert docs[0]["open_time"] == datetime.fromtimestamp(T0 / 1000, timezone.utc).replace(tzinfo=None)
+
+
+def test_encode_klines_writes_the_same_bytes_as_bson_encode():
+    # varias formas de documento: largos de symbol distintos, ints de int32 y de int64, en filas mezcladas
+    frame = pl.DataFrame({
+        "open_time": pl.Series([T0 + i * 60_000 for i in range(6)]).cast(pl.Datetime("ms")),
+        "symbol": ["BTCUSDT", "1000PEPEUSDT", "BTCUSDT", "ÄUSDT", "BTCUSDT", "1000PEPEUSDT"],
+        "volume": [2.5, 0.0, -1.25, 1e300, 3.0, 7.5],
+        "number_of_trades": [3, 2**31 - 1, 2**31, -2**31, -2**31 - 1, 10**15],
+        "is_best_match": [True, False, True, True, False, True],
+    })
+
+    assert [doc.raw for doc in encode_klines(frame)] == [encode(row) for row in frame.iter_rows(named=True)]
+    assert encode_klines(frame.clear()) == []
+
+    klines, _ = split_aggtrades(to_kline_frame(_transformed()))
+    assert [doc.raw for doc in encode_klines(klines)] == [encode(row) for row in klines.iter_rows(named=True)]
+
+
+def test_to_kline_frame_rejects_missing_columns_and_nulls():
+    df = _transformed()
+    with pytest.raises(ValueError, match="missing columns"):
+        to_kline_frame(df.drop("volume"))
+    with pytest.raises(ValueError, match="nulls"):
+        to_kline_frame(df.with_columns(pl.lit(None, pl.Float64).alias("volume")))
+
+
+def test_raw_docs_match_what_beanie_writes(mongo):
+    df = _transformed()
+    collection = Kline.get_pymongo_collection()
+
+    async def stored() -> list[dict]:
+        return await collection.find({}, {"_id": 0}).sort("open_time").to_list()
+
+    async def scenario():
+        await Kline.insert_many(build_klines(df.to_dicts()))
+        beanie_docs = await stored()
+        await collection.delete_many({})
+        await collection.insert_many(encode_klines(split_aggtrades(to_kline_frame(df))[0]))
+        return beanie_docs, await stored()
+
+    beanie_docs, fast_docs = mongo.run(scenario())
+
+    assert len(fast_docs) == len(beanie_docs) == 3
+    for fast, beanie in zip(fast_docs, beanie_docs):
+        assert fast == beanie
+        assert {name: type(value) for name, value in fast.items()} == {name: type(value) for name, value in beanie.items()}
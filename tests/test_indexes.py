@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta
+
+from binance_wss.app.models.mongo_models import KLINE_SORT_FIELDS, SYMBOL_SORT_FIELDS
+from binance_wss.data import indexes
+
+END = datetime(2023, 11, 15)
+
+
+def test_shapes_cover_every_sort_of_list_klines():
+    sorts = {
+        (tuple(query), sort[0][0])
+        for _, query, sort, _ in indexes.shapes("BTCUSDT", END - timedelta(days=7), END)
+        if sort
+    }
+    # cada sort_by aceptado, con y sin symbol
+    assert {(query, field) for query, field in sorts if query in ((), ("symbol",))} == {
+        (query, field) for field in KLINE_SORT_FIELDS for query in ((), ("symbol",))
+    }
+
+
+def test_only_unindexed_sorts_are_known_in_memory_sorts():
+    for field in KLINE_SORT_FIELDS:
+        indexed = field == "open_time"
+        assert indexes.in_memory_sort({}, [(field, -1)]) is not indexed
+        indexed = indexed or field in SYMBOL_SORT_FIELDS
+        assert indexes.in_memory_sort({"symbol": "BTCUSDT"}, [(field, 1)]) is not indexed
+    assert not indexes.in_memory_sort({"symbol": "BTCUSDT"}, None)
+
+
+def test_every_query_shape_uses_an_index(mongo):
+    report = mongo.run(indexes.check())
+
+    assert report["checked"] > 0
+    assert report["failed"] == 0, report["failures"]
@@ -0,0 +1,24 @@
+from binance_wss.app.services.kpi_service import KPIService
+from binance_wss.app.services.rollup_service import ESQUEMA_PARCIAL
+
+
+def _parcial(symbol: str, aggtrades: int, compradores: int, cantidad: float) -> dict:
+    return {
+        **{campo: 0 for campo in ESQUEMA_PARCIAL}, "symbol": symbol, "num_velas": 3, "high": 101.0, "low": 99.0,
+        "volumen": 2.0, "aggtrades": aggtrades, "aggtrades_compradores": compradores,
+        "aggtrades_vendedores": aggtrades - compradores, "aggtrades_cantidad": cantidad,
+    }
+
+
+def test_aggtrades_stats_keeps_symbols_with_klines_but_no_trades():
+    parciales = [_parcial("BTCUSDT", 4, 3, 1.0), _parcial("ETHUSDT", 0, 0, 0.0), _parcial("BTCUSDT", 4, 1, 1.0)]
+
+    assert KPIService._aggtrades_stats(parciales)["datos_por_simbolo"] == [
+        {"symbol": "BTCUSDT", "total_aggtrades": 8, "trades_compradores": 4, "trades_vendedores": 4,
+         "pct_trades_compradores": 50.0, "cantidad_promedio_trade": 0.25},
+        {"symbol": "ETHUSDT", "total_aggtrades": 0, "trades_compradores": 0, "trades_vendedores": 0,
+         "pct_trades_compradores": 0, "cantidad_promedio_trade": 0},
+    ]
+    assert [dato["symbol"] for dato in KPIService._resumen(parciales)["aggtrades"]["datos_por_simbolo"]] == [
+        "BTCUSDT", "ETHUSDT",
+    ]
@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta
+
+from binance_wss.app.services import partition_service
+from binance_wss.app.services.partition_service import PartitionService
+from binance_wss.app.settings import settings
+
+START = datetime(2023, 11, 15)
+
+
+def test_agregar_reads_every_batch_of_each_partition(mongo, monkeypatch):
+    monkeypatch.setattr(settings, "KLINE_PARTITIONING", "symbol")
+    monkeypatch.setattr(partition_service, "_cache", {"nombres": None, "leido": 0.0})
+    # lotes de 2: cada partición necesita varios getMore
+    monkeypatch.setattr(partition_service, "LOTE_CURSOR", 2)
+
+    async def run() -> list[dict]:
+        for symbol, count in (("BTCUSDT", 7), ("ETHUSDT", 4)):
+            nombre = PartitionService.nombre(symbol, START)
+            await PartitionService.asegurar(nombre)
+            await PartitionService.coleccion(nombre).insert_many([
+                {"symbol": symbol, "open_time": START + timedelta(minutes=minute)} for minute in range(count)
+            ])
+        pipeline = [{"$match": {}}, {"$project": {"_id": 0, "symbol": 1, "open_time": 1}}]
+        return await PartitionService.agregar(None, None, None, pipeline)
+
+    docs = mongo.run(run())
+
+    assert sorted((doc["symbol"], doc["open_time"].minute) for doc in docs) == [
+        ("BTCUSDT", minute) for minute in range(7)
+    ] + [("ETHUSDT", minute) for minute in range(4)]
@@ -0,0 +1,87 @@
+import asyncio
+
+import polars as pl
+import pytest
+
+from binance_wss.app.services import rolling_kpi_service
+from binance_wss.app.services.kpi_cache_service import KPICacheService
+from binance_wss.app.services.rollup_service import ESQUEMA_VELA, MINUTO_MS, RollupService, _parciales_velas
+from binance_wss.app.services.rolling_kpi_service import RollingKPIService
+from binance_wss.app.settings import settings
+from binance_wss.data import archive
+
+FIN = 1_700_000_040_000 // MINUTO_MS * MINUTO_MS
+SYMBOLS = ("BTCUSDT", "ETHUSDT", "SOLUSDT")
+
+
+def _velas(symbol: str, minutos: int, fin: int = FIN) -> pl.DataFrame:
+    opens = [fin - (minutos - i) * MINUTO_MS for i in range(minutos)]
+    return pl.DataFrame({
+        "symbol": [symbol] * minutos,
+        "open_time": pl.Series(opens).cast(pl.Datetime("ms")),
+        "high_price": [101.0 + i % 5 for i in range(minutos)], "low_price": [99.0 - i % 3 for i in range(minutos)],
+        "volume": [1.0 + i for i in range(minutos)], "quote_asset_volume": [100.0] * minutos,
+        "number_of_trades": [5] * minutos, "taker_buy_base_asset_volume": [0.5] * minutos,
+        "aggtrade_count": [3] * minutos, "aggtrade_buyer_count": [2] * minutos,
+        "aggtrade_seller_count": [1] * minutos, "aggtrade_quantity": [0.75] * minutos,
+    }, schema=ESQUEMA_VELA)
+
+
+@pytest.fixture
+def ingesta(monkeypatch):
+    """Velas hasta FIN + 10 min por símbolo; `marcas` y el minuto actual los fija cada test."""
+    monkeypatch.setattr(settings, "KPI_ROLLING_WINDOWS_MINUTES", [5, 60])
+    monkeypatch.setattr(settings, "KPI_ROLLING_SEED_CONCURRENCY", 2)
+    monkeypatch.setattr(rolling_kpi_service, "_simbolos", {})
+    estado = {"frames": {symbol: _velas(symbol, 100, FIN + 10 * MINUTO_MS) for symbol in SYMBOLS},
+              "marcas": {}, "fin": FIN, "lecturas": []}
+    monkeypatch.setattr(rolling_kpi_service, "_minuto_actual", lambda: estado["fin"])
+
+    async def marcas(refrescar=False):
+        return estado["marcas"]
+
+    async def velas_1m(symbol, inicio, fin, frias=None):
+        estado["lecturas"].append((symbol, inicio, fin))
+        frame = estado["frames"][symbol] if symbol else pl.concat(estado["frames"].values())
+        return frame.filter(pl.col("open_time").dt.epoch("ms").is_between(inicio, fin, closed="left"))
+
+    monkeypatch.setattr(KPICacheService, "marcas", marcas)
+    monkeypatch.setattr(RollupService, "velas_1m", velas_1m)
+    monkeypatch.setattr(archive, "read_kline_frame", lambda *args: pl.DataFrame(schema=ESQUEMA_VELA))
+    return estado
+
+
+def _assert_parciales(frames: dict, fin: int):
+    for minutos in (5, 60):
+        hasta = [frame.filter(pl.col("open_time").dt.epoch("ms") < fin) for frame in frames.values()]
+        esperados = _parciales_velas(pl.concat([frame.tail(minutos) for frame in hasta]))
+        parciales = RollingKPIService.parciales(None, minutos, fin)
+        assert [parcial["symbol"] for parcial in parciales] == list(SYMBOLS)
+        for parcial, esperado in zip(parciales, esperados):
+            assert parcial == pytest.approx(esperado)
+
+
+def test_seed_reads_each_symbol_separately(ingesta):
+    ingesta["marcas"] = {symbol: (0, FIN - MINUTO_MS) for symbol in SYMBOLS}
+
+    asyncio.run(RollingKPIService.sincronizar())
+
+    assert sorted(ingesta["lecturas"]) == [(symbol, FIN - 60 * MINUTO_MS, FIN) for symbol in SYMBOLS]
+    _assert_parciales(ingesta["frames"], FIN)
+
+
+def test_a_lagging_symbol_reads_its_new_candles_alone(ingesta):
+    # SOLUSDT se sembró con 30 minutos de retraso
+    ingesta["marcas"] = {symbol: (0, FIN - MINUTO_MS) for symbol in SYMBOLS}
+    ingesta["marcas"]["SOLUSDT"] = (0, FIN - 31 * MINUTO_MS)
+    asyncio.run(RollingKPIService.sincronizar())
+
+    ingesta["fin"] = fin = FIN + 10 * MINUTO_MS
+    ingesta["marcas"] = {symbol: (0, fin - MINUTO_MS) for symbol in SYMBOLS}
+    ingesta["lecturas"].clear()
+    asyncio.run(RollingKPIService.sincronizar())
+
+    # los dos al día comparten lectura; el atrasado no la alarga para ellos
+    assert len(ingesta["lecturas"]) == 2
+    assert set(ingesta["lecturas"]) == {(None, FIN, fin), ("SOLUSDT", FIN - 30 * MINUTO_MS, fin)}
+    _assert_parciales(ingesta["frames"], fin)
@@ -0,0 +1,133 @@
+from datetime import datetime, timedelta
+
+import polars as pl
+import pytest
+
+from binance_wss.app.models.mongo_models import Kline
+from binance_wss.app.services.rollup_service import (
+    ESQUEMA_PARCIAL, ROLLUPS, RollupService, _parciales_velas, fecha_a_ms,
+)
+from binance_wss.app.settings import settings
+from binance_wss.data import archive
+from binance_wss.data.rollups import (
+    ROLLUP_FIELDS, SOURCE_SCHEMA, archived_segments, refresh_rollups, rollup_frame, touched_ranges,
+)
+
+# 20 velas 1m que cruzan la medianoche del 15/11/2023
+DAY = datetime(2023, 11, 15)
+START = DAY - timedelta(minutes=10)
+
+
+def _candle(minute: int, close: float = 101.0, volume: float = 2.0) -> dict:
+    open_time = START + timedelta(minutes=minute)
+    return {
+        "symbol": "BTCUSDT", "open_time": open_time, "close_time": open_time + timedelta(milliseconds=59_999),
+        "open_price": 100.0 + minute, "close_price": close + minute, "high_price": 103.0 + minute,
+        "low_price": 99.0 + minute, "volume": volume, "quote_asset_volume": 200.0, "number_of_trades": 5,
+        "taker_buy_base_asset_volume": 1.0, "taker_buy_quote_asset_volume": 100.0,
+        "aggtrade_count": 3, "aggtrade_buyer_count": 2, "aggtrade_seller_count": 1, "aggtrade_quantity": 0.75,
+    }
+
+
+def test_archived_segments_split_at_archived_days(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "ARCHIVE_DIR", str(tmp_path))
+    archive.write_partition("klines", "BTCUSDT", DAY.date(), [])
+
+    day_ms = fecha_a_ms(DAY)
+    start, end = day_ms - archive.DAY_MS + 3_600_000, day_ms + 2 * archive.DAY_MS
+    assert archived_segments("BTCUSDT", start, end) == [
+        (start, day_ms, False),
+        (day_ms, day_ms + archive.DAY_MS, True),
+        (day_ms + archive.DAY_MS, end, False),
+    ]
+    assert archived_segments("ETHUSDT", start, end) == [(start, end, False)]
+
+
+def test_rollup_frame_buckets_like_the_pipeline():
+    candles = pl.from_dicts([_candle(minute) for minute in range(7)], schema=SOURCE_SCHEMA)
+
+    buckets = rollup_frame("5m", candles).to_dicts()
+
+    # 23:50-23:54 y 23:55-23:56
+    assert [bucket["open_time"] for bucket in buckets] == [START, START + timedelta(minutes=5)]
+    first = buckets[0]
+    assert first["interval"] == "5m" and first["kline_count"] == 5
+    assert (first["open_price"], first["close_price"]) == (100.0, 105.0)
+    assert (first["high_price"], first["low_price"]) == (107.0, 99.0)
+    assert first["close_time"] == START + timedelta(minutes=4, milliseconds=59_999)
+    assert (first["number_of_trades"], first["aggtrade_count"], first["aggtrade_quantity"]) == (25, 15, 3.75)
+    assert first["volatility_max"] == pytest.approx(4 / 99 * 100)
+
+
+def _stored_rollups(mongo, interval: str) -> list[dict]:
+    collection = ROLLUPS[interval][0].get_pymongo_collection()
+    return mongo.run(collection.find({}, {"_id": 0}).sort("open_time").to_list())
+
+
+def test_reloading_an_archived_day_keeps_its_cold_candles(mongo, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "ARCHIVE_DIR", str(tmp_path))
+
+    async def load(candles: list[dict]):
+        await Kline.insert_many([Kline(interval="1m", **candle) for candle in candles])
+        await refresh_rollups(touched_ranges((candle["symbol"], candle["open_time"]) for candle in candles))
+
+    candles = [_candle(minute) for minute in range(20)]
+    mongo.run(load(candles))
+    before = {interval: _stored_rollups(mongo, interval) for interval in ROLLUPS}
+
+    # los dos días pasan a Parquet y se recargan dos velas, una con otros valores
+    assert mongo.run(archive.archive(older_than_days=0))["klines"] == 20
+    reloaded = [_candle(8), _candle(12, close=90.0, volume=7.0)]
+    mongo.run(load(reloaded))
+
+    expected_candles = pl.from_dicts(candles[:12] + reloaded[1:] + candles[13:], schema=SOURCE_SCHEMA)
+    for interval in ROLLUPS:
+        after = _stored_rollups(mongo, interval)
+        expected = rollup_frame(interval, expected_candles).to_dicts()
+        assert [bucket["kline_count"] for bucket in after] == [bucket["kline_count"] for bucket in before[interval]]
+        assert len(after) == len(expected)
+        for stored, bucket in zip(after, expected):
+            assert set(stored) == {"symbol", "interval", "open_time", *ROLLUP_FIELDS}
+            floats = {field for field, value in bucket.items() if isinstance(value, float)}
+            assert {field: stored[field] for field in bucket if field not in floats} == {
+                field: value for field, value in bucket.items() if field not in floats
+            }
+            assert {field: stored[field] for field in floats} == pytest.approx({field: bucket[field] for field in floats})
+
+
+def _sin_floats(parcial: dict) -> dict:
+    return {campo: valor for campo, valor in parcial.items() if ESQUEMA_PARCIAL[campo] != pl.Float64}
+
+
+def _floats(parcial: dict) -> dict:
+    return {campo: valor for campo, valor in parcial.items() if ESQUEMA_PARCIAL[campo] == pl.Float64}
+
+
+def test_pipeline_partials_match_the_polars_partials(mongo):
+    # dos símbolos, precios distintos por minuto, una vela con low 0 y otras sin aggTrades
+    candles = [_candle(minute, volume=1.0 + minute) for minute in range(20)]
+    candles += [
+        {**_candle(minute), "symbol": "ETHUSDT", "low_price": 0.0 if minute == 3 else 50.0 - minute,
+         "aggtrade_count": 0, "aggtrade_buyer_count": 0, "aggtrade_seller_count": 0, "aggtrade_quantity": 0.0}
+        for minute in range(0, 20, 2)
+    ]
+
+    async def partials() -> dict:
+        await Kline.insert_many([Kline(interval="1m", **candle) for candle in candles])
+        await refresh_rollups(touched_ranges((candle["symbol"], candle["open_time"]) for candle in candles))
+        inicio, fin = fecha_a_ms(START), fecha_a_ms(START + timedelta(minutes=20))
+        return {
+            "polars": _parciales_velas(await RollupService.velas_1m(None, inicio, fin)),
+            "1m": await RollupService.parciales_tramo(None, None, inicio, fin),
+            "5m": await RollupService.parciales_tramo("5m", None, inicio, fin),
+        }
+
+    results = {path: sorted(found, key=lambda parcial: parcial["symbol"]) for path, found in mongo.run(partials()).items()}
+
+    expected = results.pop("polars")
+    assert [parcial["num_velas"] for parcial in expected] == [20, 10]
+    for path, found in results.items():
+        assert [set(parcial) for parcial in found] == [set(ESQUEMA_PARCIAL)] * 2, path
+        assert [_sin_floats(parcial) for parcial in found] == [_sin_floats(parcial) for parcial in expected], path
+        for parcial, esperado in zip(found, expected):
+            assert _floats(parcial) == pytest.approx(_floats(esperado)), path
@@ -0,0 +1,89 @@
+import asyncio
+
+import polars as pl
+import pytest
+
+from binance_wss.app.models.mongo_models import AggTradeEvent, Kline
+from binance_wss.app.settings import settings
+from binance_wss.data import spool
+from binance_wss.data.load import load_frame
+from binance_wss.data.transform import merge_klines_aggtrades
+
+T0 = 1_700_000_040_000 // 60_000 * 60_000
+TRADES_PER_KLINE = 3
+
+
+def _transformed(minutes: range) -> pl.DataFrame:
+    """Frame de transform con las velas de `minutes` y 3 aggTrades por vela (ids por minuto)."""
+    opens = [T0 + minute * 60_000 for minute in minutes]
+    n = len(opens)
+    raw = pl.DataFrame({
+        "open_time": opens, "open": ["100"] * n, "high": ["102"] * n, "low": ["99"] * n,
+        "close": ["101"] * n, "volume": ["2"] * n, "close_time": [t + 59_999 for t in opens],
+        "quote_asset_volume": ["200"] * n, "number_of_trades": [TRADES_PER_KLINE] * n,
+        "taker_buy_base_asset_volume": ["1"] * n, "taker_buy_quote_asset_volume": ["100"] * n,
+        "ignore": ["0"] * n, "symbol": ["BTCUSDT"] * n, "interval": ["1m"] * n,
+    })
+    ids = [minute * TRADES_PER_KLINE + i for minute in minutes for i in range(TRADES_PER_KLINE)]
+    aggtrades = pl.DataFrame({
+        "symbol": ["BTCUSDT"] * len(ids),
+        "kline_open": [T0 + agg_id // TRADES_PER_KLINE * 60_000 for agg_id in ids],
+        "agg_trade_id": ids, "price": ["100.5"] * len(ids), "quantity": ["0.25"] * len(ids),
+        "first_trade_id": ids, "last_trade_id": ids,
+        "timestamp": [T0 + agg_id // TRADES_PER_KLINE * 60_000 + agg_id % TRADES_PER_KLINE for agg_id in ids],
+        "is_buyer_maker": [agg_id % 2 == 0 for agg_id in ids], "is_best_match": [True] * len(ids),
+    })
+    return merge_klines_aggtrades(raw, aggtrades)
+
+
+@pytest.mark.parametrize("fast_path", [False, True])
+def test_drain_overlapping_records_loads_each_trade_once(mongo, tmp_path, monkeypatch, fast_path):
+    monkeypatch.setattr(settings, "SPOOL_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "LOAD_FAST_PATH", fast_path)
+    # dos ejecuciones que fallaron con ventanas solapadas (minutos 1 y 2)
+    spool.append(_transformed(range(0, 3)))
+    spool.append(_transformed(range(1, 4)))
+
+    report = mongo.run(spool.drain(load_frame))
+
+    assert (report["records"], report["batches"]) == (2, 1)
+    trades = mongo.run(AggTradeEvent.get_pymongo_collection().distinct("agg_trade_id"))
+    assert mongo.run(AggTradeEvent.get_pymongo_collection().count_documents({})) == len(trades) == 4 * TRADES_PER_KLINE
+    klines = mongo.run(Kline.get_pymongo_collection().find({}, {"_id": 0, "aggtrade_count": 1}).to_list())
+    assert [kline["aggtrade_count"] for kline in klines] == [TRADES_PER_KLINE] * 4
+    assert spool.depth()["records"] == 0
+
+
+def test_corrupt_record_quarantines_the_segment_and_keeps_the_offset(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SPOOL_DIR", str(tmp_path))
+    ends = []
+    for minutes in (range(0, 2), range(2, 4), range(4, 6)):
+        spool.append(_transformed(minutes))
+        ends.append((tmp_path / spool.ACTIVE).stat().st_size)
+
+    # un byte cambiado en el payload del segundo registro
+    data = bytearray((tmp_path / spool.ACTIVE).read_bytes())
+    data[(ends[0] + ends[1]) // 2] ^= 0xFF
+    (tmp_path / spool.ACTIVE).write_bytes(data)
+
+    loaded = []
+
+    async def sink(frame):
+        loaded.append(frame)
+
+    report = asyncio.run(spool.drain(sink))
+
+    # se carga lo anterior al registro corrupto y nada de lo que viene después se pierde
+    assert [frame["open_time"].dt.minute().to_list() for frame in loaded] == [
+        _transformed(range(0, 2))["open_time"].dt.minute().to_list()
+    ]
+    assert (report["records"], report["quarantined"]) == (1, 1)
+    assert not list(tmp_path.glob("segment-*.spool"))
+    [corrupt] = tmp_path.glob("segment-*.corrupt")
+    assert corrupt.stat().st_size == ends[-1]
+    assert int(corrupt.with_suffix(".offset").read_text()) == ends[0]
+    assert spool.depth()["quarantined"] == 1
+
+    # un segmento apartado no se vuelve a drenar
+    assert asyncio.run(spool.drain(sink))["records"] == 0
+    assert len(loaded) == 1 and corrupt.exists()
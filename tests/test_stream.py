@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+from binance_wss.data.stream import StreamIngester, serve_replay
+
+T0 = 1_700_000_040_000 // 60_000 * 60_000
+
+
+def _kline(minute: int, closed: bool = True) -> dict:
+    open_ms = T0 + minute * 60_000
+    return {"stream": "btcusdt@kline_1m", "data": {"e": "kline", "s": "BTCUSDT", "k": {
+        "t": open_ms, "T": open_ms + 59_999, "s": "BTCUSDT", "i": "1m",
+        "o": "100", "c": "101", "h": "102", "l": "99", "v": "2", "q": "200",
+        "n": 3, "V": "1", "Q": "100", "x": closed,
+    }}}
+
+
+def _trade(agg_id: int, minute: int) -> dict:
+    return {"stream": "btcusdt@aggTrade", "data": {
+        "e": "aggTrade", "s": "BTCUSDT", "a": agg_id, "p": "100.5", "q": "0.25",
+        "f": agg_id * 10, "l": agg_id * 10 + 1, "T": T0 + minute * 60_000 + agg_id,
+        "m": agg_id % 2 == 0, "M": True,
+    }}
+
+
+def _session() -> list[str]:
+    # la vela del minuto 2 y los aggTrades 6-7 no llegan; hay un frame que no es JSON
+    # y otro sin los campos de una vela
+    frames = [
+        _trade(1, 0), _trade(2, 0), _kline(0, closed=False), _trade(3, 0), _kline(0),
+        _trade(4, 1), _trade(5, 1), _kline(1),
+        "not json", {"data": {"e": "kline"}},
+        _trade(8, 3), _trade(9, 3), _kline(3),
+    ]
+    return [frame if isinstance(frame, str) else json.dumps(frame) for frame in frames]
+
+
+async def _replay_twice(path: str):
+    written = []
+
+    async def sink(rows):
+        written.extend(rows)
+
+    # el stand-in cierra la conexión al terminar cada sesión: el ingestor
+    # reconecta y recibe la misma sesión otra vez
+    server = await serve_replay(path, port=0, close_after=True)
+    port = server.sockets[0].getsockname()[1]
+    ingester = StreamIngester(
+        ["BTCUSDT"], base_url=f"ws://127.0.0.1:{port}", sink=sink,
+        flush_interval=0.1, close_grace=0.0, max_backoff=0.1,
+    )
+    task = asyncio.create_task(ingester.run())
+    try:
+        async with asyncio.timeout(15):
+            while ingester.reconnects < 2:
+                await asyncio.sleep(0.05)
+    finally:
+        ingester.stop()
+        await task
+        server.close()
+        await server.wait_closed()
+    return ingester, written
+
+
+def test_replay_detects_gaps_reconnects_and_skips_bad_frames(tmp_path):
+    path = tmp_path / "frames.jsonl"
+    path.write_text("\n".join(_session()) + "\n", encoding="utf-8")
+
+    ingester, written = asyncio.run(_replay_twice(str(path)))
+
+    assert ingester.reconnects >= 2
+    # un frame malo no tumba la conexión: los de después se procesan
+    assert ingester.bad_frames >= 2
+    # la segunda sesión es un duplicado: ni velas ni huecos repetidos
+    assert [int(row["open_time"].timestamp() * 1000) for row in written] == [T0, T0 + 60_000, T0 + 180_000]
+    assert ingester.gaps == [
+        {"type": "aggTrade", "symbol": "BTCUSDT", "from_id": 6, "to_id": 7},
+        {"type": "kline", "symbol": "BTCUSDT", "interval": "1m",
+         "from_open_time": T0 + 120_000, "to_open_time": T0 + 120_000},
+    ]
+    # cada vela lleva los aggTrades de su minuto, en orden
+    assert [[trade["agg_trade_id"] for trade in row["aggtrades"]] for row in written] == [[1, 2, 3], [4, 5], [8, 9]]
+    assert [row["aggtrade_count"] for row in written] == [3, 2, 2]